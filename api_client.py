@@ -1,8 +1,19 @@
+import time
+import asyncio
 from config import CONFIG
 from functools import lru_cache
-import time
-from typing import List, Dict, Optional
-from PyQt6.QtWidgets import QMainWindow
+from typing import TYPE_CHECKING, List, Dict, Iterator, Optional
+from response_cache import ResponseCache, get_response_cache
+from rate_limiter import get_rate_limiter
+from token_budget import estimate_request_tokens
+from prompt_functions import prompt_version
+from retry_policy import RetryPolicy, NonRetryableError
+from metrics import get_metrics
+from hedging import HedgeSkipped, get_hedge_policy
+
+if TYPE_CHECKING:
+    # 仅用于类型标注，命令行模式下不依赖 PyQt6
+    from PyQt6.QtWidgets import QMainWindow
 
 @lru_cache(maxsize=128)
 def cached_isinstance(obj, class_or_tuple):
@@ -12,7 +23,195 @@ def cached_isinstance(obj, class_or_tuple):
 def cached_len(obj):
     return len(obj)
 
-def chat_with_moonshot(client, prompt: str, history: Optional[List[Dict]] = None, window: Optional[QMainWindow] = None) -> str:
+# create_client 可选的客户端实现
+HTTP_BACKENDS = ('sdk', 'httpx', 'async')
+
+def create_client(api_key: Optional[str] = None, base_url: Optional[str] = None, backend: Optional[str] = None):
+    """
+    创建智谱 API 客户端
+
+    zhipuai 在这里才导入，命令行模式和打包后的程序都不必在启动时加载它。
+    关闭 SDK 自带的重试，统一由 RetryPolicy 和限流器处理，避免重试次数叠加。
+
+    Args:
+        api_key: API key，默认取 CONFIG['ZHIPU_API_KEY']
+        base_url: 接口地址，默认取 CONFIG['BASE_URL']（基准测试时指向本地模拟服务）
+        backend: 客户端实现，默认取 CONFIG['HTTP_BACKEND']：sdk 为智谱 SDK，
+            httpx 为可配置连接池的同步客户端，async 为基于事件循环的异步客户端（见 http_client）
+
+    三个参数都未指定且配置了多个接口（CONFIG['PROVIDERS'] 或 providers.json）时，
+    返回在各接口间负载均衡的接口池（见 provider_pool）。
+
+    Returns:
+        客户端实例，未配置 API key 时返回 None
+    """
+    if api_key is None and base_url is None and backend is None:
+        from provider_pool import create_provider_pool
+        pool = create_provider_pool()
+        if pool is not None:
+            return pool
+    api_key = api_key or CONFIG['ZHIPU_API_KEY']
+    if not api_key:
+        return None
+    base_url = base_url or CONFIG['BASE_URL']
+    backend = backend or CONFIG['HTTP_BACKEND']
+    if backend == 'httpx':
+        from http_client import HttpChatClient
+        return HttpChatClient(api_key, base_url)
+    if backend == 'async':
+        from http_client import AsyncHttpChatClient
+        return AsyncHttpChatClient(api_key, base_url)
+    if backend != 'sdk':
+        raise ValueError(f"未知的客户端实现: {backend}，可选: {', '.join(HTTP_BACKENDS)}")
+    from zhipuai import ZhipuAI
+    return ZhipuAI(api_key=api_key, base_url=base_url, max_retries=0)
+
+def is_async_client(client) -> bool:
+    """客户端的 create 是否为协程（见 http_client.AsyncHttpChatClient）"""
+    return getattr(client, 'is_async', False)
+
+def request_model(client) -> str:
+    """本次请求使用的模型：接口池在各接口的模型中按权重选择（优先选择可用的接口），其他客户端为 CONFIG['MODEL']"""
+    choose = getattr(client, 'choose_model', None)
+    return choose() if choose else CONFIG['MODEL']
+
+def client_models(client) -> str:
+    """客户端可能使用的全部模型，计入生成清单的提示词哈希，更换模型后重新生成"""
+    models = getattr(client, 'models', None)
+    return '|'.join(models) if models else CONFIG['MODEL']
+
+def completion_params(prompt: str, history: List[Dict], stream: bool, system: Optional[str] = None,
+                      model: Optional[str] = None) -> Dict:
+    """
+    组装对话请求参数
+
+    消息按“固定说明 → 上下文 → 本次提问”排列，变化的部分放在最后。
+    上下文开头的 system 消息接在固定说明之后合并为一条，保证所有请求的开头完全相同，
+    便于服务端复用前缀缓存。
+    """
+    messages = list(history)
+    if system:
+        extra = []
+        while messages and messages[0].get('role') == 'system':
+            extra.append(messages.pop(0)['content'])
+        messages.insert(0, {"role": "system", "content": '\n\n'.join([system, *extra])})
+    params = dict(
+        model=model or CONFIG['MODEL'],
+        messages=[
+            *messages,
+            {"role": "user", "content": prompt}
+        ],
+        temperature=CONFIG['TEMPERATURE'],
+        max_tokens=CONFIG['MAX_TOKENS'],
+        top_p=CONFIG['TOP_P'],
+        stream=stream
+    )
+    return params
+
+def _set_attempt_timeout(params: Dict, client, timeout, attempt) -> None:
+    """
+    设置本次尝试的请求超时，不超过重试总时长（RETRY_DEADLINE）剩余的时间
+
+    超时写成 httpx 直接接受的数字或 (连接, 读取, 写入, 连接池) 元组，SDK 和 http_client 的客户端
+    都可以使用，这里不需要导入 httpx。调用方未指定超时时，http_client 的客户端以
+    HTTP_CONNECT_TIMEOUT / HTTP_READ_TIMEOUT 为上限；SDK 等其他客户端保留自己的默认超时，
+    只在开启 RETRY_DEADLINE 时改为剩余的时间。
+
+    Args:
+        timeout: 调用方指定的超时，同 chat_with_moonshot
+    """
+    remaining = attempt.remaining
+    if remaining is not None:
+        # 留一点时间，避免剩余时间恰好用完时以 0 超时发出请求
+        remaining = max(remaining, 0.1)
+    if timeout is None:
+        if remaining is None:
+            return
+        timeout = getattr(client, 'default_timeout', None)
+        if timeout is None:
+            params['timeout'] = remaining
+            return
+    connect, read = timeout if isinstance(timeout, (tuple, list)) else (CONFIG['HTTP_CONNECT_TIMEOUT'], timeout)
+    if remaining is not None:
+        connect, read = min(connect, remaining), min(read, remaining)
+    params['timeout'] = (connect, read, connect, None)
+
+def request_messages(prompt: str, history: List[Dict], system: Optional[str] = None) -> List[Dict]:
+    """实际发送的完整消息列表，用于生成清单的提示词哈希"""
+    return completion_params(prompt, history, stream=False, system=system)['messages']
+
+def response_cache_key(params: Dict) -> str:
+    """根据请求参数计算响应缓存键"""
+    return ResponseCache.make_key(
+        params['model'], params['temperature'], params['top_p'], params['max_tokens'], params['messages'],
+        prompt_version()
+    )
+
+def _cache_lookup(cache, params: Dict, client) -> Optional[str]:
+    """按客户端可能使用的每个模型查找响应缓存（缓存键中包含实际使用的模型）"""
+    for model in getattr(client, 'models', None) or [params['model']]:
+        cached = cache.get(response_cache_key({**params, 'model': model}))
+        if cached is not None:
+            return cached
+    return None
+
+def retry_logger(window):
+    """重试时在日志中显示本次耗时和等待时间"""
+    def on_retry(record):
+        if window:
+            window.log_message(
+                f"API调用失败（耗时{record.latency:.1f}秒: {record.error}），"
+                f"{record.delay:.1f}秒后进行第{record.attempt}次重试..."
+            )
+    return on_retry
+
+def _record_call(course, started_at, records, usage=None, cache_hit=False, error=None, kind='chat', hedge=None):
+    """记录一次调用的指标，未开启指标时忽略"""
+    if CONFIG['METRICS_ENABLED']:
+        get_metrics().record_call(course, time.perf_counter() - started_at, attempts=max(1, len(records)),
+                                  usage=usage, cache_hit=cache_hit, error=error, kind=kind, hedge=hedge)
+
+def _hedge_saved_recorder(course):
+    """对冲请求胜出后，被丢弃的原请求完成时记录少等待的秒数"""
+    def on_saved(seconds):
+        if CONFIG['METRICS_ENABLED']:
+            get_metrics().record_hedge_saved(course, seconds)
+    return on_saved
+
+def _hedge_quota(limiter, estimated_tokens):
+    """对冲请求只在有空闲配额时发出，不等待配额"""
+    quota = limiter.try_request(estimated_tokens)
+    if quota is None:
+        raise HedgeSkipped("没有空闲的限流配额，不发出对冲请求")
+    return quota
+
+def _create_completion(client, params, limiter, estimated_tokens, request=None):
+    """占用限流配额发出一次请求，request 为对冲中的请求（见 hedging.HedgedRequest）"""
+    quota = _hedge_quota(limiter, estimated_tokens) if request and request.is_hedge else limiter.request(estimated_tokens)
+    with quota as ticket:
+        if request:
+            request.mark_sent()
+        response = client.chat.completions.create(**params)
+        ticket.record_usage(getattr(response, 'usage', None))
+    return response
+
+async def _create_completion_async(client, params, limiter, estimated_tokens, request=None):
+    if request and request.is_hedge:
+        with _hedge_quota(limiter, estimated_tokens) as ticket:
+            request.mark_sent()
+            response = await client.chat.completions.create(**params)
+            ticket.record_usage(getattr(response, 'usage', None))
+        return response
+    async with limiter.request_async(estimated_tokens) as ticket:
+        if request:
+            request.mark_sent()
+        response = await client.chat.completions.create(**params)
+        ticket.record_usage(getattr(response, 'usage', None))
+    return response
+
+def chat_with_moonshot(client, prompt: str, history: Optional[List[Dict]] = None, window: Optional['QMainWindow'] = None,
+                       use_cache: bool = True, course: Optional[str] = None, system: Optional[str] = None,
+                       timeout=None) -> str:
     """
     与 API 进行对话
     
@@ -21,48 +220,214 @@ def chat_with_moonshot(client, prompt: str, history: Optional[List[Dict]] = None
         prompt: 提示词
         history: 对话历史
         window: 主窗口实例，用于显示日志
+        use_cache: 是否使用响应缓存，False 时跳过缓存直接请求
+        course: 指标中使用的课程名
+        system: 放在最前面的固定说明（system 消息）
+        timeout: 本次请求的超时，数字为读取超时，(连接超时, 读取超时) 元组分别指定，
+            默认使用 HTTP_CONNECT_TIMEOUT / HTTP_READ_TIMEOUT（SDK 客户端为 SDK 的默认值）；
+            每次尝试的超时都不超过 RETRY_DEADLINE 剩余的时间（SDK 客户端未指定超时时即为剩余时间）
     
     Returns:
         str: API返回的响应内容
     """
+    if is_async_client(client):
+        return client.run(achat_with_moonshot(client, prompt, history, window, use_cache, course, system, timeout))
+
+    started_at = time.perf_counter()
+    records = []
     try:
         if history is None:
             history = []
+
+        params = completion_params(prompt, history, stream=False, system=system)
+        cache = get_response_cache() if use_cache else None
+        if cache:
+            cached = _cache_lookup(cache, params, client)
+            if cached is not None:
+                if window:
+                    window.log_message("命中响应缓存，跳过API调用")
+                _record_call(course, started_at, records, cache_hit=True)
+                return cached
+
+        limiter = get_rate_limiter()
+        estimated_tokens = estimate_request_tokens(params['messages'], params['max_tokens'])
+        hedger = get_hedge_policy()
+        hedge = None
+
+        def create(request=None):
+            return _create_completion(client, params, limiter, estimated_tokens, request)
             
-        max_retries = 3
-        retry_count = 0
-        
-        while retry_count < max_retries:
-            try:
-                response = client.chat.completions.create(
-                    model=CONFIG['MODEL'],
-                    messages=[
-                        *history,
-                        {"role": "user", "content": prompt}
-                    ],
-                    temperature=CONFIG['TEMPERATURE'],
-                    max_tokens=CONFIG['MAX_TOKENS'],
-                    top_p=CONFIG['TOP_P'],
-                    stream=False
-                )
-                
-                if response and response.choices:
-                    return response.choices[0].message.content
+        policy = RetryPolicy.from_config()
+        for attempt in policy.attempts(on_retry=retry_logger(window), records=records):
+            with attempt:
+                # 接口池每次尝试重新选择模型，优先选择仍可用的接口
+                params['model'] = request_model(client)
+                _set_attempt_timeout(params, client, timeout, attempt)
+                if hedger:
+                    response, hedge = hedger.call(create, on_saved=_hedge_saved_recorder(course))
                 else:
+                    response = create()
+
+                if not (response and response.choices):
                     raise Exception("API返回为空")
-                    
-            except Exception as e:
-                retry_count += 1
-                if window:
-                    window.log_message(f"API调用失败，正在进行第{retry_count}次重试...")
-                time.sleep(2)  # 重试前等待2秒
-                
-                if retry_count >= max_retries:
-                    raise Exception(f"API调用失败，已重试{max_retries}次: {str(e)}")
-                
+                content = response.choices[0].message.content
+
+        if cache and content:
+            cache.put(response_cache_key(params), content)
+        _record_call(course, started_at, records, usage=getattr(response, 'usage', None), hedge=hedge)
+        return content
+
     except Exception as e:
+        _record_call(course, started_at, records, error=str(e))
         if window:
             window.log_message(f"发生错误: {str(e)}")
         raise e
         
     return ""
+
+
+async def achat_with_moonshot(client, prompt: str, history: Optional[List[Dict]] = None,
+                              window: Optional['QMainWindow'] = None, use_cache: bool = True,
+                              course: Optional[str] = None, system: Optional[str] = None, timeout=None) -> str:
+    """
+    chat_with_moonshot 的协程版本，参数和返回值相同
+
+    client 必须是异步客户端，且在客户端的事件循环中运行（client.submit / client.run）。
+    限流、重试等待都不阻塞事件循环，读写响应缓存（SQLite）放到线程池中执行，
+    一个线程即可同时发出大量请求。
+    """
+    started_at = time.perf_counter()
+    records = []
+    try:
+        params = completion_params(prompt, history or [], stream=False, system=system)
+        cache = get_response_cache() if use_cache else None
+        if cache:
+            cached = await asyncio.to_thread(_cache_lookup, cache, params, client)
+            if cached is not None:
+                if window:
+                    window.log_message("命中响应缓存，跳过API调用")
+                _record_call(course, started_at, records, cache_hit=True)
+                return cached
+
+        limiter = get_rate_limiter()
+        estimated_tokens = estimate_request_tokens(params['messages'], params['max_tokens'])
+        hedger = get_hedge_policy()
+        hedge = None
+
+        def create(request=None):
+            return _create_completion_async(client, params, limiter, estimated_tokens, request)
+
+        policy = RetryPolicy.from_config()
+        for attempt in policy.attempts(on_retry=retry_logger(window), records=records):
+            async with attempt:
+                params['model'] = request_model(client)
+                _set_attempt_timeout(params, client, timeout, attempt)
+                if hedger:
+                    response, hedge = await hedger.call_async(create, on_saved=_hedge_saved_recorder(course))
+                else:
+                    response = await create()
+
+                if not (response and response.choices):
+                    raise Exception("API返回为空")
+                content = response.choices[0].message.content
+
+        if cache and content:
+            await asyncio.to_thread(cache.put, response_cache_key(params), content)
+        _record_call(course, started_at, records, usage=getattr(response, 'usage', None), hedge=hedge)
+        return content
+
+    except Exception as e:
+        _record_call(course, started_at, records, error=str(e))
+        if window:
+            window.log_message(f"发生错误: {str(e)}")
+        raise
+
+
+def stream_with_moonshot(client, prompt: str, history: Optional[List[Dict]] = None, window: Optional['QMainWindow'] = None,
+                         use_cache: bool = True, course: Optional[str] = None,
+                         system: Optional[str] = None, timeout=None) -> Iterator[str]:
+    """
+    以流式方式与 API 进行对话，逐段产出增量内容
+
+    只有在尚未产出任何内容时才会重试；已经输出部分内容后再失败，
+    直接抛出异常，由调用方决定如何处理已写出的内容。
+    命中响应缓存时一次性产出缓存内容；异步客户端不支持流式，一次性产出完整内容。
+
+    Args:
+        client: API客户端实例
+        prompt: 提示词
+        history: 对话历史
+        window: 主窗口实例，用于显示日志
+        use_cache: 是否使用响应缓存，False 时跳过缓存直接请求
+        course: 指标中使用的课程名
+        system: 放在最前面的固定说明（system 消息）
+        timeout: 本次请求的超时，同 chat_with_moonshot
+
+    Yields:
+        str: API返回的增量内容
+    """
+    if is_async_client(client):
+        yield chat_with_moonshot(client, prompt, history, window, use_cache, course, system, timeout)
+        return
+
+    if history is None:
+        history = []
+
+    started_at = time.perf_counter()
+    records = []
+    params = completion_params(prompt, history, stream=True, system=system)
+    cache = get_response_cache() if use_cache else None
+    if cache:
+        cached = _cache_lookup(cache, params, client)
+        if cached is not None:
+            if window:
+                window.log_message("命中响应缓存，跳过API调用")
+            _record_call(course, started_at, records, cache_hit=True, kind='stream')
+            yield cached
+            return
+
+    limiter = get_rate_limiter()
+    estimated_tokens = estimate_request_tokens(params['messages'], params['max_tokens'])
+
+    policy = RetryPolicy.from_config()
+    usage = None
+    try:
+        for attempt in policy.attempts(on_retry=retry_logger(window), records=records):
+            with attempt:
+                params['model'] = request_model(client)
+                _set_attempt_timeout(params, client, timeout, attempt)
+                emitted = False
+                parts = [] if cache else None
+                try:
+                    # 流式请求在整个输出期间占用并发配额
+                    with limiter.request(estimated_tokens) as ticket:
+                        response = client.chat.completions.create(**params)
+                        for chunk in response:
+                            if getattr(chunk, 'usage', None):
+                                usage = chunk.usage
+                                ticket.record_usage(usage)
+                            if not chunk.choices:
+                                continue
+                            delta = chunk.choices[0].delta.content
+                            if delta:
+                                emitted = True
+                                if parts is not None:
+                                    parts.append(delta)
+                                yield delta
+                except Exception as e:
+                    if emitted:
+                        raise NonRetryableError(f"流式输出中断: {str(e)}") from e
+                    raise
+
+                if not emitted:
+                    raise Exception("API返回为空")
+
+    except Exception as e:
+        _record_call(course, started_at, records, usage=usage, error=str(e), kind='stream')
+        if window:
+            window.log_message(f"发生错误: {str(e)}")
+        raise
+
+    _record_call(course, started_at, records, usage=usage, kind='stream')
+    if cache:
+        cache.put(response_cache_key(params), ''.join(parts))
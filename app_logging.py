@@ -0,0 +1,49 @@
+import os
+import logging
+from logging.handlers import RotatingFileHandler
+
+from config import CONFIG
+
+LOGGER_NAME = 'courseforge'
+
+_configured = False
+
+
+def setup_logging(log_dir=None):
+    """
+    配置滚动日志文件
+
+    日志写入 CONFIG['LOG_DIR']/courseforge.log，单个文件超过 LOG_FILE_MAX_MB 后滚动，
+    最多保留 LOG_FILE_BACKUPS 个历史文件。重复调用不会重复添加处理器。
+
+    Returns:
+        str: 日志文件路径，创建失败时返回 None
+    """
+    global _configured
+    log_dir = log_dir or CONFIG['LOG_DIR']
+    log_file = os.path.join(log_dir, 'courseforge.log')
+    if _configured:
+        return log_file
+
+    try:
+        os.makedirs(log_dir, exist_ok=True)
+        handler = RotatingFileHandler(
+            log_file,
+            maxBytes=int(CONFIG['LOG_FILE_MAX_MB'] * 1024 * 1024),
+            backupCount=CONFIG['LOG_FILE_BACKUPS'],
+            encoding='utf-8'
+        )
+    except OSError as e:
+        print(f"创建日志文件失败: {str(e)}")
+        return None
+
+    handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s [%(threadName)s] %(message)s'))
+    root = logging.getLogger()
+    root.addHandler(handler)
+    root.setLevel(logging.INFO)
+    _configured = True
+    return log_file
+
+
+def get_logger():
+    return logging.getLogger(LOGGER_NAME)
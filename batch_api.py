@@ -0,0 +1,333 @@
+"""
+批处理接口模式
+
+把一门或多门课程中待生成的小节请求写入一个 JSONL 批处理文件，上传后提交批处理任务，
+轮询完成后下载结果，再逐节保存到各自的课程目录。适合不需要实时结果的大批量离线生成，
+省去逐个请求的开销:
+
+    python cli.py --batch courses.jsonl --batch-api
+
+依赖前面小节内容的上下文策略（previous-section / summary）无法一次性提交，
+批处理模式下改用 chapter-outline。
+
+提交后批处理任务 ID 和各请求 ID 记录在各课程的生成清单中，等待期间程序中断或被取消时，
+下次运行先继续等待（或取回已取消任务的部分结果）上次提交的任务，再为剩余的小节提交新任务。
+"""
+import os
+import json
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+from config import CONFIG
+from api_client import client_models, completion_params, response_cache_key, retry_logger
+from course_files import save_section_content
+from course_manifest import CourseManifest, prompt_hash
+from course_model import Section, load_course
+from context_strategies import CONTEXT_STRATEGIES, create_context_strategy
+from prompt_functions import generate_section_content, section_system_prompt
+from response_cache import get_response_cache
+from retry_policy import RetryPolicy
+from metrics import get_metrics
+from generation_engine import GenerationCancelled, course_label, record_written, write_metrics_report
+
+# 批处理任务的终止状态
+FINISHED_STATUSES = ('completed', 'failed', 'expired', 'cancelled')
+
+
+@dataclass(slots=True)
+class BatchItem:
+    """批处理文件中的一个请求"""
+    custom_id: str
+    course_dir: str
+    section: Section
+    prompt_hash: str
+    cache_key: Optional[str]
+
+
+def _call(func, window=None, **kwargs):
+    """批处理的上传、提交、查询等控制请求也按重试策略重试"""
+    for attempt in RetryPolicy.from_config().attempts(on_retry=retry_logger(window)):
+        with attempt:
+            result = func(**kwargs)
+    return result
+
+
+def _response_text(response) -> str:
+    """files.content 返回的内容转为文本（不同版本的 SDK 返回的响应对象不同）"""
+    content = response.read() if callable(getattr(response, 'read', None)) else getattr(response, 'content', response)
+    return content.decode('utf-8') if isinstance(content, bytes) else str(content)
+
+
+def build_batch_file(client, course_dirs: List[str], path: str, window=None,
+                     resume: Optional[bool] = None) -> List[BatchItem]:
+    """
+    收集待生成小节的请求并写入批处理文件
+
+    已完成的小节（断点续传）直接跳过，命中响应缓存的小节直接保存，不进入批处理文件。
+    提示词哈希与逐节生成（generation_engine）的计算方式相同，两种方式生成的小节可以互相续跑。
+
+    Returns:
+        list: 写入文件的请求
+    """
+    if resume is None:
+        resume = CONFIG['RESUME']
+    strategy_name = CONFIG['CONTEXT_STRATEGY']
+    if not CONTEXT_STRATEGIES[strategy_name].independent:
+        if window:
+            window.log_message(f"批处理模式不支持上下文策略 {strategy_name}，改用 chapter-outline")
+        strategy_name = 'chapter-outline'
+
+    system = section_system_prompt()
+    models = client_models(client)
+    cache = get_response_cache()
+    items = []
+    with open(path, 'w', encoding='utf-8') as f:
+        for course_number, course_dir in enumerate(course_dirs):
+            course = load_course(course_dir)
+            manifest = CourseManifest(course_dir)
+            context = create_context_strategy(strategy_name, course_dir).new_context()
+            for section in course.sections:
+                prompt = generate_section_content(title=section.title)
+                params = completion_params(prompt, context.messages(section), stream=False, system=system)
+                section_hash = prompt_hash(params['messages'], models)
+                if resume and manifest.is_complete(section.title, section_hash):
+                    continue
+
+                key = response_cache_key(params) if cache else None
+                cached = cache.get(key) if cache else None
+                if cached is not None:
+                    manifest.mark_running(section.index, section.title, section_hash)
+                    filepath = save_section_content(section.title, cached, course_dir, window)
+                    manifest.mark_done(section.title, filepath)
+                    record_written(course_dir, filepath)
+                    continue
+
+                params.pop('stream')
+                item = BatchItem(f"{course_number}-{section.index}", course_dir, section, section_hash, key)
+                f.write(json.dumps({
+                    'custom_id': item.custom_id,
+                    'method': 'POST',
+                    'url': CONFIG['BATCH_ENDPOINT'],
+                    'body': params
+                }, ensure_ascii=False) + '\n')
+                manifest.mark_running(section.index, section.title, section_hash)
+                items.append(item)
+    return items
+
+
+def submit_batch(client, path: str, window=None, description: str = ''):
+    """上传批处理文件并提交批处理任务，返回批处理任务对象"""
+    with open(path, 'rb') as f:
+        uploaded = _call(client.files.create, window, file=f, purpose='batch')
+    batch = _call(
+        client.batches.create, window,
+        input_file_id=uploaded.id,
+        endpoint=CONFIG['BATCH_ENDPOINT'],
+        completion_window=CONFIG['BATCH_COMPLETION_WINDOW'],
+        metadata={'description': description[:512]} if description else None
+    )
+    if window:
+        window.log_message(f"批处理任务已提交: {batch.id}")
+    return batch
+
+
+def wait_for_batch(client, batch_id: str, window=None, control=None, poll_interval: Optional[float] = None,
+                   timeout: Optional[float] = None):
+    """
+    轮询批处理任务直到结束
+
+    Raises:
+        GenerationCancelled: 等待期间被取消（同时取消服务端的批处理任务）
+        TimeoutError: 超过 timeout 秒仍未结束
+    """
+    poll_interval = CONFIG['BATCH_POLL_INTERVAL'] if poll_interval is None else poll_interval
+    timeout = CONFIG['BATCH_TIMEOUT'] if timeout is None else timeout
+    started_at = time.monotonic()
+    last_status = None
+    while True:
+        batch = _call(client.batches.retrieve, window, batch_id=batch_id)
+        if batch.status != last_status:
+            last_status = batch.status
+            counts = batch.request_counts
+            progress = f"（{counts.completed}/{counts.total}）" if counts else ''
+            if window:
+                window.log_message(f"批处理任务 {batch_id} 状态: {batch.status}{progress}")
+        if batch.status in FINISHED_STATUSES:
+            return batch
+        if timeout and time.monotonic() - started_at > timeout:
+            raise TimeoutError(f"批处理任务 {batch_id} 超过{timeout}秒仍未完成")
+
+        deadline = time.monotonic() + poll_interval
+        while time.monotonic() < deadline:
+            if control and control.cancelled:
+                _call(client.batches.cancel, window, batch_id=batch_id)
+                raise GenerationCancelled("任务已取消")
+            time.sleep(min(1.0, poll_interval))
+
+
+def collect_results(client, batch, items: List[BatchItem], window=None) -> Dict[str, int]:
+    """
+    下载批处理结果并保存到各课程目录
+
+    Returns:
+        dict: succeeded / failed 数量，errors 为各课程目录第一个失败小节的错误信息
+    """
+    by_id = {item.custom_id: item for item in items}
+    manifests = {}
+
+    def manifest_for(course_dir):
+        if course_dir not in manifests:
+            manifests[course_dir] = CourseManifest(course_dir)
+        return manifests[course_dir]
+    cache = get_response_cache()
+    metrics = get_metrics() if CONFIG['METRICS_ENABLED'] else None
+    succeeded = 0
+    errors = {}
+
+    lines = []
+    for file_id in (batch.output_file_id, batch.error_file_id):
+        if file_id:
+            lines.extend(_response_text(_call(client.files.content, window, file_id=file_id)).splitlines())
+
+    for line in lines:
+        if not line.strip():
+            continue
+        record = json.loads(line)
+        item = by_id.pop(record.get('custom_id'), None)
+        if item is None:
+            continue
+        manifest = manifest_for(item.course_dir)
+        response = record.get('response') or {}
+        body = response.get('body') or {}
+        choices = body.get('choices') or []
+        content = choices[0].get('message', {}).get('content') if choices else None
+
+        if response.get('status_code') != 200 or not content:
+            error = (body.get('error') or {}).get('message') or record.get('error') or 'API返回为空'
+            manifest.mark_failed(item.section.title, str(error))
+            errors.setdefault(item.course_dir, f"{item.section.title}: {error}")
+            if metrics:
+                metrics.record_call(course_label(item.course_dir), 0.0, usage=body.get('usage'),
+                                    error=str(error), kind='batch')
+            continue
+
+        filepath = save_section_content(item.section.title, content, item.course_dir, window)
+        manifest.mark_done(item.section.title, filepath)
+        record_written(item.course_dir, filepath)
+        if cache and item.cache_key:
+            cache.put(item.cache_key, content)
+        if metrics:
+            metrics.record_call(course_label(item.course_dir), 0.0, usage=body.get('usage'), kind='batch')
+        succeeded += 1
+
+    # 结果文件中没有出现的请求
+    for item in by_id.values():
+        error = f"批处理任务 {batch.id} 未返回结果（{batch.status}）"
+        manifest_for(item.course_dir).mark_failed(item.section.title, error)
+        errors.setdefault(item.course_dir, f"{item.section.title}: {error}")
+
+    for course_dir in {item.course_dir for item in items}:
+        write_metrics_report(course_dir, window)
+    return {'succeeded': succeeded, 'failed': len(items) - succeeded, 'errors': errors}
+
+
+def _record_submitted(batch_id: str, items: List[BatchItem]) -> None:
+    """把批处理任务 ID 和请求 ID 写入各课程的生成清单"""
+    by_course = {}
+    for item in items:
+        by_course.setdefault(item.course_dir, {})[item.section.title] = {
+            'custom_id': item.custom_id, 'cache_key': item.cache_key
+        }
+    for course_dir, requests in by_course.items():
+        CourseManifest(course_dir).mark_batched(batch_id, requests)
+
+
+def pending_batch_items(course_dirs: List[str]) -> Dict[str, List[BatchItem]]:
+    """生成清单中记录的、已提交但尚未取回结果的请求，按批处理任务 ID 分组"""
+    pending = {}
+    for course_dir in course_dirs:
+        batches = CourseManifest(course_dir).pending_batches()
+        if not batches:
+            continue
+        sections = {section.title: section for section in load_course(course_dir).sections}
+        for batch_id, entries in batches.items():
+            for title, entry in entries:
+                if title in sections:
+                    pending.setdefault(batch_id, []).append(BatchItem(
+                        entry['custom_id'], course_dir, sections[title], entry['prompt_hash'], entry.get('cache_key')
+                    ))
+    return pending
+
+
+def resume_batches(client, course_dirs: List[str], window=None, control=None, poll_interval: Optional[float] = None,
+                   timeout: Optional[float] = None) -> Dict[str, int]:
+    """
+    继续等待上次提交后未取回结果的批处理任务并保存结果
+
+    查询不到的任务中的小节标记为失败，随后由新的批处理任务重新生成。
+
+    Returns:
+        dict: resumed（继续等待的请求数）/ succeeded 数量
+    """
+    resumed = succeeded = 0
+    for batch_id, items in pending_batch_items(course_dirs).items():
+        resumed += len(items)
+        if window:
+            window.log_message(f"继续等待上次提交的批处理任务 {batch_id}（{len(items)}个请求）")
+        try:
+            batch = wait_for_batch(client, batch_id, window, control, poll_interval, timeout)
+        except (GenerationCancelled, TimeoutError):
+            raise
+        except Exception as e:
+            if window:
+                window.log_message(f"查询批处理任务 {batch_id} 失败，重新提交其中的请求: {str(e)}")
+            error = f"批处理任务 {batch_id} 查询失败: {str(e)}"
+            for course_dir in {item.course_dir for item in items}:
+                manifest = CourseManifest(course_dir)
+                for item in items:
+                    if item.course_dir == course_dir:
+                        manifest.mark_failed(item.section.title, error)
+            continue
+        # 失败的小节接下来重新提交，错误信息以新任务的结果为准
+        succeeded += collect_results(client, batch, items, window)['succeeded']
+    return {'resumed': resumed, 'succeeded': succeeded}
+
+
+def run_batch(client, course_dirs: List[str], window=None, control=None, resume: Optional[bool] = None,
+              poll_interval: Optional[float] = None, timeout: Optional[float] = None) -> Dict[str, int]:
+    """
+    以批处理方式生成若干课程中待生成的小节（课程目录中需要已有大纲）
+
+    断点续传时先继续等待上次提交后未取回结果的批处理任务（见 resume_batches），再提交剩余的小节。
+
+    Returns:
+        dict: submitted / resumed / succeeded / failed 数量，errors 为各课程目录的错误信息
+    """
+    if resume is None:
+        resume = CONFIG['RESUME']
+    resumed = {'resumed': 0, 'succeeded': 0}
+    if resume:
+        resumed = resume_batches(client, course_dirs, window, control, poll_interval, timeout)
+
+    os.makedirs(CONFIG['BATCH_DIR'], exist_ok=True)
+    path = os.path.join(CONFIG['BATCH_DIR'], f"batch-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}.jsonl")
+    items = build_batch_file(client, course_dirs, path, window, resume)
+    if not items:
+        if window:
+            window.log_message("没有需要生成的小节")
+        os.remove(path)
+        return {'submitted': 0, 'resumed': resumed['resumed'], 'succeeded': resumed['succeeded'], 'failed': 0,
+                'errors': {}}
+
+    if window:
+        window.log_message(f"共{len(items)}个请求写入批处理文件: {path}")
+    titles = ', '.join(course_label(course_dir) for course_dir in course_dirs)
+    batch = submit_batch(client, path, window, description=f"CourseForge: {titles}")
+    _record_submitted(batch.id, items)
+    batch = wait_for_batch(client, batch.id, window, control, poll_interval, timeout)
+    result = collect_results(client, batch, items, window)
+    result['succeeded'] += resumed['succeeded']
+    if window:
+        window.log_message(f"批处理完成: 成功{result['succeeded']}节，失败{result['failed']}节")
+    return {'submitted': len(items), 'resumed': resumed['resumed'], **result}
@@ -0,0 +1,284 @@
+"""
+端到端基准测试
+
+启动本地模拟接口（mock_llm_server），用真实的 zhipuai 客户端跑完整的
+大纲 → 小节 → 保存流程，报告吞吐量、请求延迟分位数、峰值内存和启动耗时。
+全程不访问网络，可用于对比并发、缓存、流式等改动的效果:
+
+    python benchmark.py --courses 2 --chapters 4 --sections 4 --workers 4
+    python benchmark.py --stream --latency 1.0 --error-rate 0.05
+    python benchmark.py --cache --repeat 2 --json bench.json
+"""
+import sys
+import json
+import time
+import shutil
+import tempfile
+import argparse
+import threading
+import importlib.util
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+from typing import Dict, Optional
+
+from config import CONFIG, VERSION
+from metrics import percentile, reset_metrics
+from mock_llm_server import MockLLMServer, MockSettings
+
+
+def peak_rss_mb() -> Optional[float]:
+    """进程峰值内存（MB），不支持的平台返回 None"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 单位为 KB，macOS 为字节
+    return round(peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024, 1)
+
+
+class TimedClient:
+    """包装 API 客户端，记录每次请求的总耗时和流式首字节时间（异步客户端只有总耗时）"""
+
+    def __init__(self, client):
+        self._client = client
+        self._lock = threading.Lock()
+        self.latencies = []
+        self.first_byte = []
+        self.errors = 0
+        self.chat = SimpleNamespace(completions=self)
+        self.is_async = getattr(client, 'is_async', False)
+        if self.is_async:
+            self.submit, self.run = client.submit, client.run
+            self.create = self._create_async
+
+    def _record(self, latency=None, first_byte=None, error=False):
+        with self._lock:
+            if latency is not None:
+                self.latencies.append(latency)
+            if first_byte is not None:
+                self.first_byte.append(first_byte)
+            if error:
+                self.errors += 1
+
+    def create(self, **kwargs):
+        started_at = time.perf_counter()
+        try:
+            response = self._client.chat.completions.create(**kwargs)
+        except Exception:
+            self._record(error=True)
+            raise
+        if kwargs.get('stream'):
+            return self._timed_stream(response, started_at)
+        self._record(latency=time.perf_counter() - started_at)
+        return response
+
+    async def _create_async(self, **kwargs):
+        started_at = time.perf_counter()
+        try:
+            response = await self._client.chat.completions.create(**kwargs)
+        except Exception:
+            self._record(error=True)
+            raise
+        self._record(latency=time.perf_counter() - started_at)
+        return response
+
+    def _timed_stream(self, response, started_at):
+        first_byte = None
+        try:
+            for chunk in response:
+                if first_byte is None:
+                    first_byte = time.perf_counter() - started_at
+                yield chunk
+        except Exception:
+            self._record(error=True)
+            raise
+        self._record(latency=time.perf_counter() - started_at, first_byte=first_byte)
+
+
+def measure_startup() -> Dict:
+    """测量导入 cli（以及可用时 main）的子进程耗时"""
+    from startup_profile import profile_imports
+    result = {}
+    modules = ['cli']
+    if importlib.util.find_spec('PyQt6') is not None:
+        modules.append('main')
+    for module in modules:
+        report = profile_imports(module)
+        result[module] = {
+            'wall_time_s': report['wall_time_s'],
+            'import_ms': round(report['total_import_us'] / 1000, 1),
+            'error': report['error']
+        }
+    return result
+
+
+def run_once(client, args, output_dir) -> Dict:
+    """生成一轮课程，返回本轮统计"""
+    from generation_engine import generate_course
+    from course_files import create_course_directory
+
+    timed = TimedClient(client)
+    metrics = reset_metrics()
+    titles = [f"基准课程{i + 1}" for i in range(args.courses)]
+    failures = []
+
+    def run_course(title):
+        course_dir = create_course_directory(title, output_dir)
+        try:
+            generate_course(
+                client=timed, title=title, student='基准测试用户',
+                chapter=args.chapters, section=args.sections, course_dir=course_dir,
+                workers=args.workers, stream=args.stream, resume=False
+            )
+        except Exception as e:
+            failures.append(f"{title}: {str(e)}")
+
+    started_at = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, args.parallel)) as pool:
+        list(pool.map(run_course, titles))
+    elapsed = time.perf_counter() - started_at
+
+    sections = args.courses * args.chapters * args.sections - len(failures) * args.chapters * args.sections
+    return {
+        'elapsed_s': round(elapsed, 3),
+        'sections': sections,
+        'sections_per_min': round(sections / elapsed * 60, 1) if elapsed else None,
+        'requests': len(timed.latencies),
+        'failed_requests': timed.errors,
+        'latency_p50_s': _round(percentile(timed.latencies, 50)),
+        'latency_p95_s': _round(percentile(timed.latencies, 95)),
+        'first_byte_p50_s': _round(percentile(timed.first_byte, 50)),
+        'first_byte_p95_s': _round(percentile(timed.first_byte, 95)),
+        'retries': metrics.summary()['retries'],
+        'cache_hits': metrics.summary()['cache_hits'],
+        'prompt_tokens': metrics.summary()['prompt_tokens'],
+        'prefix_cache_hit_rate': metrics.summary()['prefix_cache_hit_rate'],
+        # 调用方实际等待的耗时（对冲时取先返回的请求），与上面逐个请求的耗时不同
+        'call_p95_s': metrics.summary()['latency_p95_s'],
+        'call_max_s': metrics.summary()['latency_max_s'],
+        'hedged_calls': metrics.summary()['hedged_calls'],
+        'hedge_wins': metrics.summary()['hedge_wins'],
+        'failures': failures
+    }
+
+
+def _round(value, digits=3):
+    return round(value, digits) if value is not None else None
+
+
+def run_benchmark(args) -> Dict:
+    settings = MockSettings(
+        latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+        throttle_rate=args.throttle_rate, chunk_delay=args.chunk_delay, seed=args.seed,
+        outline_drift=args.outline_drift, slow_rate=args.slow_rate, slow_factor=args.slow_factor
+    )
+    server = MockLLMServer(settings=settings).start()
+    work_dir = tempfile.mkdtemp(prefix='courseforge-bench-')
+
+    # 基准测试只对模拟服务生效的配置
+    CONFIG['BASE_URL'] = server.base_url
+    CONFIG['CACHE_ENABLED'] = args.cache
+    CONFIG['CACHE_PATH'] = f"{work_dir}/response_cache.db"
+    CONFIG['CONTEXT_STRATEGY'] = args.context
+    CONFIG['HEDGE_ENABLED'] = args.hedge
+    CONFIG['RATE_LIMIT_RPM'] = args.rpm
+    CONFIG['RATE_LIMIT_TPM'] = args.tpm
+    CONFIG['CONCURRENCY_MAX'] = max(CONFIG['CONCURRENCY_MAX'], args.workers * args.parallel)
+
+    from api_client import create_client
+    client = create_client(api_key='benchmark.mock-secret', base_url=server.base_url, backend=args.http)
+
+    try:
+        runs = [run_once(client, args, f"{work_dir}/run{i + 1}") for i in range(args.repeat)]
+    finally:
+        server.stop()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    return {
+        'version': VERSION,
+        'settings': {
+            'courses': args.courses, 'chapters': args.chapters, 'sections': args.sections,
+            'workers': args.workers, 'parallel': args.parallel, 'stream': args.stream,
+            'cache': args.cache, 'latency': args.latency, 'jitter': args.jitter,
+            'error_rate': args.error_rate, 'throttle_rate': args.throttle_rate,
+            'context_strategy': CONFIG['CONTEXT_STRATEGY'], 'http_backend': args.http,
+            'slow_rate': args.slow_rate, 'hedge': args.hedge
+        },
+        'runs': runs,
+        'server_requests': settings.requests,
+        'peak_rss_mb': peak_rss_mb(),
+        'startup': measure_startup() if not args.skip_startup else None
+    }
+
+
+def format_report(report: Dict) -> str:
+    s = report['settings']
+    lines = [
+        f"CourseForge v{report['version']} 基准测试",
+        f"{s['courses']}门课程 × {s['chapters']}章 × {s['sections']}节，并发{s['workers']}，"
+        f"课程并行{s['parallel']}，流式{'开' if s['stream'] else '关'}，缓存{'开' if s['cache'] else '关'}，"
+        f"模拟延迟{s['latency']}秒，错误率{s['error_rate']}，客户端{s['http_backend']}"
+    ]
+    for i, run in enumerate(report['runs'], 1):
+        line = (f"第{i}轮: {run['elapsed_s']:.2f}秒，{run['sections_per_min']}节/分钟，"
+                f"请求{run['requests']}次（失败{run['failed_requests']}，重试{run['retries']}，"
+                f"缓存命中{run['cache_hits']}），"
+                f"p50 {run['latency_p50_s']}秒，p95 {run['latency_p95_s']}秒")
+        if run['first_byte_p50_s'] is not None:
+            line += f"，首字节 p50 {run['first_byte_p50_s']}秒"
+        if run['hedged_calls']:
+            line += (f"，对冲{run['hedged_calls']}次（对冲胜出{run['hedge_wins']}），"
+                     f"调用 p95 {run['call_p95_s']}秒，最长 {run['call_max_s']}秒")
+        if run['prefix_cache_hit_rate']:
+            line += f"，输入{run['prompt_tokens']} token，前缀缓存命中{run['prefix_cache_hit_rate']:.0%}"
+        lines.append(line)
+        for failure in run['failures']:
+            lines.append(f"  失败: {failure}")
+    lines.append(f"模拟服务共收到 {report['server_requests']} 次请求，峰值内存 {report['peak_rss_mb']} MB")
+    for module, startup in (report['startup'] or {}).items():
+        lines.append(f"启动: import {module} 用时 {startup['wall_time_s'] * 1000:.0f} ms"
+                     f"{'（导入失败: ' + startup['error'] + '）' if startup['error'] else ''}")
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    from api_client import HTTP_BACKENDS
+    parser = argparse.ArgumentParser(description='端到端基准测试（本地模拟接口）')
+    parser.add_argument('--courses', type=int, default=1, help='课程数')
+    parser.add_argument('--chapters', type=int, default=4, help='每门课程章数')
+    parser.add_argument('--sections', type=int, default=4, help='每章节数')
+    parser.add_argument('--workers', type=int, default=CONFIG['MAX_WORKERS'], help='每门课程的并发数')
+    parser.add_argument('--parallel', type=int, default=1, help='同时生成的课程数')
+    parser.add_argument('--stream', action='store_true', help='流式生成')
+    parser.add_argument('--context', default=CONFIG['CONTEXT_STRATEGY'], help='上下文策略')
+    parser.add_argument('--http', choices=HTTP_BACKENDS, default=CONFIG['HTTP_BACKEND'], help='客户端实现')
+    parser.add_argument('--cache', action='store_true', help='启用响应缓存（配合 --repeat 观察命中效果）')
+    parser.add_argument('--repeat', type=int, default=1, help='重复轮数')
+    parser.add_argument('--latency', type=float, default=0.5, help='模拟平均延迟（秒）')
+    parser.add_argument('--jitter', type=float, default=0.3, help='模拟延迟波动')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='模拟 500 错误概率')
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help='模拟 429 限流概率')
+    parser.add_argument('--slow-rate', type=float, default=0.0, help='模拟长尾慢响应的概率')
+    parser.add_argument('--slow-factor', type=float, default=10.0, help='长尾慢响应的延迟倍数')
+    parser.add_argument('--hedge', action='store_true', help='开启对冲请求')
+    parser.add_argument('--outline-drift', type=float, default=0.0, help='模拟大纲缺少章节的概率（测试大纲修复）')
+    parser.add_argument('--chunk-delay', type=float, default=0.01, help='流式每段间隔（秒）')
+    parser.add_argument('--rpm', type=float, default=0, help='限流器每分钟请求数，0 为不限制')
+    parser.add_argument('--tpm', type=float, default=0, help='限流器每分钟 token 数，0 为不限制')
+    parser.add_argument('--seed', type=int, help='随机种子，便于复现')
+    parser.add_argument('--skip-startup', action='store_true', help='不测量启动耗时')
+    parser.add_argument('--json', help='把完整报告保存为 JSON 文件')
+    args = parser.parse_args(argv)
+
+    report = run_benchmark(args)
+    print(format_report(report))
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"报告已保存到: {args.json}")
+    return 1 if any(run['failures'] for run in report['runs']) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
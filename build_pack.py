@@ -459,6 +459,7 @@ def build_windows_package(ssh, remote_path, conda_path, conda_env):
             f'cd /d {remote_path} && '
             'pyinstaller --clean --windowed --onefile '
             '--name CourseForgeMini --icon images/app.ico '
+            '--add-data "prompts;prompts" '  # 提示词模板
             '--exclude-module PyQt5 main.py'
             '"'
         )
@@ -521,6 +522,7 @@ def build_mac_package():
             "--name 'CourseForgeMini' "
             "--icon images/app.icns "
             "--add-data 'Info.plist:.' "  # 使用项目中已有的 Info.plist
+            "--add-data 'prompts:prompts' "  # 提示词模板
             "--noupx "
             "--osx-bundle-identifier 'com.courseforge.pro' "
             "main.py"
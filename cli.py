@@ -0,0 +1,349 @@
+"""
+命令行批量生成课程（无需图形界面和 PyQt6）
+
+单门课程:
+    python cli.py --title "瑜伽入门" --users "想学习瑜伽的初学者" --chapters 4 --sections 4
+
+批量生成（JSONL 每行一个对象，CSV 需要表头）:
+    python cli.py --batch courses.jsonl --parallel 4
+
+持久化队列（中断后再次运行同一队列即可继续）:
+    python cli.py --batch courses.jsonl --queue jobs.db --workers 8
+    python cli.py --queue jobs.db
+
+批处理接口（先生成大纲，所有小节合并为一个批处理任务离线生成）:
+    python cli.py --batch courses.jsonl --batch-api
+
+打包输出（每门课程一个 SQLite 课程包，或用 --bundle 让所有课程共用一个），以及导出为散文件:
+    python cli.py --batch courses.jsonl --output-format bundle --bundle run.course.db
+    python cli.py --export run.course.db --output-dir ./导出
+
+课程字段: title, users（或 student / target_users）, chapters, sections, priority（仅队列模式）
+"""
+import os
+import sys
+import csv
+import json
+import time
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from config import CONFIG
+from api_client import HTTP_BACKENDS, create_client
+from course_files import OUTLINE_FILENAME, create_course_directory, ensure_temp_directory, sanitize_filename
+from course_bundle import export_bundle, pack_course, restore_course
+from generation_engine import generate_course, generate_outline
+from batch_api import run_batch
+from provider_pool import ROUTING_STRATEGIES, ProviderPool
+from context_strategies import CONTEXT_STRATEGIES
+from job_queue import JobQueue, JobScheduler
+from app_logging import setup_logging, get_logger
+from metrics import get_metrics, serve_prometheus
+
+_print_lock = threading.Lock()
+
+
+class ConsoleLog:
+    """命令行日志输出，接口与主窗口的 log_message 一致，可直接作为 window 参数传入"""
+
+    def __init__(self, prefix=''):
+        self.prefix = prefix
+        self.logger = get_logger()
+
+    def log_message(self, message):
+        self.logger.info(f"{self.prefix}{message}")
+        timestamp = time.strftime("%H:%M:%S", time.localtime())
+        with _print_lock:
+            print(f"[{timestamp}] {self.prefix}{message}", flush=True)
+
+
+def _normalize_spec(raw, defaults):
+    """统一课程字段名并校验取值范围"""
+    spec = {
+        'title': (raw.get('title') or '').strip(),
+        'users': (raw.get('users') or raw.get('student') or raw.get('target_users') or defaults['users']).strip(),
+        'chapters': int(raw.get('chapters') or raw.get('chapter') or defaults['chapters']),
+        'sections': int(raw.get('sections') or raw.get('section') or defaults['sections']),
+        'priority': int(raw.get('priority') or defaults.get('priority') or 0),
+    }
+    if not spec['title'] or len(spec['title']) > 100:
+        raise ValueError(f"课程标题不能为空且长度不能超过100字符: {raw}")
+    if not spec['users'] or len(spec['users']) > 100:
+        raise ValueError(f"目标用户不能为空且长度不能超过100字符: {raw}")
+    for key in ('chapters', 'sections'):
+        if not 1 <= spec[key] <= 10:
+            raise ValueError(f"{key} 必须是1-10之间的整数: {raw}")
+    return spec
+
+
+def load_course_specs(path, defaults):
+    """读取 JSONL 或 CSV 课程清单"""
+    specs = []
+    with open(path, 'r', encoding='utf-8-sig', newline='') as f:
+        if path.lower().endswith('.csv'):
+            rows = list(csv.DictReader(f))
+        else:
+            rows = [json.loads(line) for line in f if line.strip()]
+    for row in rows:
+        specs.append(_normalize_spec(row, defaults))
+    return specs
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description='优课工坊命令行批量生成')
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument('--title', help='课程标题（单门课程）')
+    source.add_argument('--batch', help='课程清单文件（.jsonl 或 .csv）')
+    parser.add_argument('--users', default='希望提升生活品质的都市人群', help='目标用户（清单中未填写时的默认值）')
+    parser.add_argument('--chapters', type=int, default=4, help='课程章数（默认值）')
+    parser.add_argument('--sections', type=int, default=4, help='每章节数（默认值）')
+    parser.add_argument('--output-dir', help='输出目录，默认为桌面的优课工坊目录')
+    parser.add_argument('--parallel', type=int, default=1, help='同时生成的课程数')
+    parser.add_argument('--workers', type=int, default=CONFIG['MAX_WORKERS'],
+                        help='每门课程并发生成的小节数（队列模式下为所有课程共享的工作线程数）')
+    parser.add_argument('--queue', help='持久化作业队列文件（SQLite），课程加入队列后统一调度')
+    parser.add_argument('--batch-api', action='store_true', help='通过批处理接口离线生成所有小节（不能与 --queue 同时使用）')
+    parser.add_argument('--priority', type=int, default=0, help='加入队列的课程优先级（默认值），越大越先执行')
+    parser.add_argument('--context', choices=sorted(CONTEXT_STRATEGIES), default=CONFIG['CONTEXT_STRATEGY'],
+                        help='生成小节时带上的上下文策略')
+    parser.add_argument('--http', choices=HTTP_BACKENDS, default=CONFIG['HTTP_BACKEND'],
+                        help='客户端实现：sdk、httpx（可配置连接池）、async（单线程事件循环，适合上百个并发请求）')
+    parser.add_argument('--providers', default=CONFIG['PROVIDERS_FILE'],
+                        help='多接口配置文件（JSON），存在时在各接口间负载均衡并自动切换')
+    parser.add_argument('--routing', choices=ROUTING_STRATEGIES, default=CONFIG['PROVIDER_ROUTING'],
+                        help='多接口时的选择策略')
+    parser.add_argument('--hedge', action='store_true', default=CONFIG['HEDGE_ENABLED'],
+                        help='对冲请求：调用耗时超过近期耗时分位数时再发一个相同请求，先返回的被采用')
+    parser.add_argument('--output-format', choices=('files', 'bundle'), default=CONFIG['OUTPUT_FORMAT'],
+                        help='输出格式：files（每门课程一个目录）或 bundle（课程完成后打包为 SQLite 课程包）')
+    parser.add_argument('--bundle', default=CONFIG['BUNDLE_PATH'],
+                        help='所有课程共用的课程包文件，默认每门课程一个（<课程目录>.course.db）')
+    parser.add_argument('--export', help='把课程包导出为散文件到 --output-dir（可用 --title 只导出一门课程）后退出')
+    parser.add_argument('--stream', action='store_true', default=CONFIG['STREAM'], help='流式生成小节内容')
+    parser.add_argument('--no-cache', action='store_true', help='不使用响应缓存')
+    parser.add_argument('--no-resume', action='store_true', help='不跳过已完成的小节')
+    parser.add_argument('--regenerate-outline', action='store_true', help='已有大纲时也重新生成')
+    parser.add_argument('--metrics-report', help='把本次运行的指标汇总（含各课程）保存为 JSON 文件')
+    parser.add_argument('--metrics-file', default=CONFIG['METRICS_PROMETHEUS_FILE'],
+                        help='每门课程完成时把指标以 Prometheus 文本格式写入该文件')
+    parser.add_argument('--metrics-port', type=int, help='在本机该端口提供 Prometheus 抓取接口')
+    return parser
+
+
+def run_course(client, spec, base_dir, args):
+    """生成一门课程，返回 (标题, 错误信息或 None)"""
+    log = ConsoleLog(f"[{spec['title']}] ")
+    try:
+        course_dir = create_course_directory(spec['title'], base_dir)
+        log.log_message(f"课程目录: {course_dir}")
+        if CONFIG['OUTPUT_FORMAT'] == 'bundle':
+            restore_course(course_dir, window=log)
+        generate_course(
+            client=client,
+            title=spec['title'],
+            student=spec['users'],
+            chapter=spec['chapters'],
+            section=spec['sections'],
+            course_dir=course_dir,
+            window=log,
+            regenerate_outline=args.regenerate_outline,
+            workers=args.workers,
+            stream=args.stream,
+            resume=not args.no_resume
+        )
+        if CONFIG['OUTPUT_FORMAT'] == 'bundle':
+            pack_course(course_dir, window=log)
+        log.log_message("课程生成完成")
+        return spec['title'], None
+    except Exception as e:
+        log.log_message(f"错误: {str(e)}")
+        return spec['title'], str(e)
+
+
+def run_queue(client, specs, base_dir, args):
+    """把课程加入持久化队列并执行队列中的所有任务"""
+    queue = JobQueue(args.queue)
+    try:
+        for spec in specs:
+            existing = queue.find_job(spec['title'], base_dir)
+            if existing is not None:
+                # 重复运行同一清单时不重复加入，未完成的作业由调度器继续执行
+                ConsoleLog(f"[{spec['title']}] ").log_message(
+                    f"已在队列中（作业{existing['id']}，状态{existing['status']}），不再重复加入")
+                continue
+            if CONFIG['OUTPUT_FORMAT'] == 'bundle':
+                restore_course(create_course_directory(spec['title'], base_dir),
+                               window=ConsoleLog(f"[{spec['title']}] "))
+            queue.enqueue(spec['title'], spec['users'], spec['chapters'], spec['sections'],
+                          priority=spec['priority'], base_dir=base_dir)
+
+        scheduler = JobScheduler(queue, client, workers=args.workers, window=ConsoleLog(),
+                                 stream=args.stream, resume=not args.no_resume)
+        jobs = scheduler.run()
+    finally:
+        queue.close()
+    results = []
+    for job in jobs:
+        error = job['error'] if job['status'] != 'done' else None
+        if error is None and CONFIG['OUTPUT_FORMAT'] == 'bundle' and job['course_dir'] \
+                and os.path.exists(os.path.join(job['course_dir'], OUTLINE_FILENAME)):
+            error = _pack(job['course_dir'], ConsoleLog(f"[{job['title']}] "))
+        results.append((job['title'], error))
+    return results
+
+
+def _pack(course_dir, log):
+    """打包一门课程，返回错误信息或 None"""
+    try:
+        pack_course(course_dir, window=log)
+    except Exception as e:
+        log.log_message(f"打包失败: {str(e)}")
+        return f"打包失败: {str(e)}"
+    return None
+
+
+def run_batch_api(client, specs, base_dir, args):
+    """逐门生成大纲后，把所有课程的小节合并为一个批处理任务"""
+    results = {}
+    course_dirs = {}
+    for spec in specs:
+        log = ConsoleLog(f"[{spec['title']}] ")
+        try:
+            course_dir = create_course_directory(spec['title'], base_dir)
+            if CONFIG['OUTPUT_FORMAT'] == 'bundle':
+                restore_course(course_dir, window=log)
+            if args.regenerate_outline or not os.path.exists(os.path.join(course_dir, OUTLINE_FILENAME)):
+                generate_outline(client, spec['title'], spec['users'], spec['chapters'], spec['sections'],
+                                 course_dir, window=log)
+            course_dirs[course_dir] = spec['title']
+            results[spec['title']] = None
+        except Exception as e:
+            log.log_message(f"错误: {str(e)}")
+            results[spec['title']] = str(e)
+
+    if course_dirs:
+        try:
+            batch = run_batch(client, list(course_dirs), window=ConsoleLog(), resume=not args.no_resume)
+            for course_dir, error in batch['errors'].items():
+                results[course_dirs[course_dir]] = error
+        except Exception as e:
+            print(f"批处理失败: {str(e)}", file=sys.stderr)
+            for title in course_dirs.values():
+                results[title] = str(e)
+    if CONFIG['OUTPUT_FORMAT'] == 'bundle':
+        for course_dir, title in course_dirs.items():
+            if results[title] is None:
+                results[title] = _pack(course_dir, ConsoleLog(f"[{title}] "))
+    return list(results.items())
+
+
+def export_courses(args):
+    """把课程包导出为散文件"""
+    output_dir = args.output_dir or ensure_temp_directory()
+    names = [sanitize_filename(args.title)] if args.title else None
+    try:
+        course_dirs = export_bundle(args.export, output_dir, names, window=ConsoleLog())
+    except (OSError, ValueError) as e:
+        print(f"导出失败: {str(e)}", file=sys.stderr)
+        return 2
+    if not course_dirs:
+        print("课程包中没有要导出的课程", file=sys.stderr)
+        return 1
+    print(f"已导出 {len(course_dirs)} 门课程到: {output_dir}")
+    return 0
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.export:
+        return export_courses(args)
+    if not (args.title or args.batch or args.queue):
+        parser.error('需要指定 --title、--batch、--queue 或 --export 之一')
+    if args.batch_api and args.queue:
+        parser.error('--batch-api 不能与 --queue 同时使用')
+    if args.batch_api and args.http != 'sdk':
+        parser.error('--batch-api 需要使用 SDK 客户端（--http sdk）')
+    defaults = {'users': args.users, 'chapters': args.chapters, 'sections': args.sections,
+                'priority': args.priority}
+
+    try:
+        if args.batch:
+            specs = load_course_specs(args.batch, defaults)
+        elif args.title:
+            specs = [_normalize_spec({'title': args.title}, defaults)]
+        else:
+            specs = []
+    except (OSError, ValueError) as e:
+        print(f"读取课程清单失败: {str(e)}", file=sys.stderr)
+        return 2
+
+    if args.no_cache:
+        CONFIG['CACHE_ENABLED'] = False
+    CONFIG['METRICS_PROMETHEUS_FILE'] = args.metrics_file
+    CONFIG['CONTEXT_STRATEGY'] = args.context
+    CONFIG['HTTP_BACKEND'] = args.http
+    CONFIG['HEDGE_ENABLED'] = args.hedge
+    CONFIG['PROVIDERS_FILE'] = args.providers
+    CONFIG['PROVIDER_ROUTING'] = args.routing
+    CONFIG['OUTPUT_FORMAT'] = args.output_format
+    CONFIG['BUNDLE_PATH'] = args.bundle
+    setup_logging()
+
+    try:
+        client = create_client()
+    except (OSError, ValueError) as e:
+        print(f"读取接口配置失败: {str(e)}", file=sys.stderr)
+        return 2
+    if client is None:
+        print("API key 获取失败", file=sys.stderr)
+        return 2
+    if isinstance(client, ProviderPool):
+        client.window = ConsoleLog()
+        if args.batch_api:
+            parser.error('--batch-api 不支持多接口负载均衡')
+
+    base_dir = args.output_dir or ensure_temp_directory()
+    os.makedirs(base_dir, exist_ok=True)
+    if args.metrics_port:
+        serve_prometheus(args.metrics_port)
+
+    started_at = time.time()
+    if args.queue:
+        results = run_queue(client, specs, base_dir, args)
+    elif args.batch_api:
+        results = run_batch_api(client, specs, base_dir, args)
+    else:
+        with ThreadPoolExecutor(max_workers=max(1, args.parallel), thread_name_prefix='course') as pool:
+            results = list(pool.map(lambda spec: run_course(client, spec, base_dir, args), specs))
+
+    failed = [(title, error) for title, error in results if error]
+    print(f"完成 {len(results) - len(failed)}/{len(results)} 门课程，用时 {time.time() - started_at:.1f} 秒")
+    for title, error in failed:
+        print(f"  失败: {title}: {error}")
+
+    report = get_metrics().report()
+    total = report['total']
+    print(f"API调用 {total['api_calls']} 次（缓存命中 {total['cache_hits']}，重试 {total['retries']}，"
+          f"失败 {total['errors']}），token {total['prompt_tokens']}+{total['completion_tokens']}，"
+          f"耗时 p50 {total['latency_p50_s']} 秒，p95 {total['latency_p95_s']} 秒")
+    if total['cached_prompt_tokens']:
+        print(f"服务端前缀缓存命中 {total['cached_prompt_tokens']} 个输入 token（{total['prefix_cache_hit_rate']:.0%}）")
+    if total['hedged_calls']:
+        print(f"对冲请求 {total['hedged_calls']} 次，其中 {total['hedge_wins']} 次对冲请求先返回"
+              f"（已测得少等待 {total['hedge_saved_s']} 秒），调用耗时最长 {total['latency_max_s']} 秒")
+    if isinstance(client, ProviderPool):
+        for provider in client.status():
+            print(f"  接口 {provider['name']}（{provider['model']}）: 请求 {provider['requests']} 次，"
+                  f"失败 {provider['errors']}，切换 {provider['failovers']}"
+                  f"{'' if provider['healthy'] else '，暂停使用中'}")
+    if args.metrics_report:
+        with open(args.metrics_report, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"指标报告已保存到: {args.metrics_report}")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
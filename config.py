@@ -5,6 +5,9 @@ import base64
 # 版本号
 VERSION = "2.0.4" #修改了课程标题和目标用户的提示语
 
+# 本地数据目录（响应缓存等）
+DATA_DIR = os.path.join(os.path.expanduser('~'), '.courseforge_mini')
+
 # 调试配置
 DEBUG = {
     'SKIP_LOGIN': False,  # 是否跳过扫码登录
@@ -27,7 +30,70 @@ def load_config():
         'BASE_URL': "https://open.bigmodel.cn/api/paas/v4",
         'MODEL': "glm-4-flash",
         'MAX_TOKENS': 2048,
-        'MAX_HISTORY_LENGTH': 1,
+        'PROMPT_VERSION': 'v2',  # 提示词模板版本（prompts/<版本>/ 目录），切换即可对比不同提示词
+        'PROMPT_DIR': None,  # 提示词模板根目录，None 为程序目录下的 prompts
+        'MAX_HISTORY_LENGTH': 1,  # previous-section/summary 策略最多带上同一章之前几节
+        'HISTORY_TOKEN_BUDGET': 1500,  # previous-section/summary 策略的上下文 token 预算
+        'MAX_WORKERS': 4,  # 并发生成小节的线程数，1 为顺序生成
+        # 上下文策略：none（不带上下文）/chapter-outline（带本章大纲，各节全部并发）/
+        # previous-section（带同一章前一节的完整内容）/summary（带同一章前几节的标题和PPT骨架）；
+        # 后两种同一章按顺序生成，章与章之间并发
+        'CONTEXT_STRATEGY': 'chapter-outline',
+        'STREAM': False,  # 是否流式生成小节内容（边生成边写入文件并显示在日志中）
+        'RATE_LIMIT_RPM': 120,  # 每分钟请求数上限，0 为不限制
+        'RATE_LIMIT_TPM': 400000,  # 每分钟 token 数上限，0 为不限制
+        'CONCURRENCY_MIN': 1,  # 自适应并发下限（遇到限流时减半但不低于此值）
+        'CONCURRENCY_MAX': 8,  # 自适应并发上限（请求成功时逐步提升到此值）
+        'RETRY_MAX_ATTEMPTS': 3,  # 单次调用最多尝试次数
+        'RETRY_BASE_DELAY': 1.0,  # 首次重试等待秒数，之后按指数增长
+        'RETRY_MAX_DELAY': 30.0,  # 单次重试等待上限（秒）
+        'RETRY_JITTER': 0.5,  # 随机抖动比例，0 为不抖动，1 为完全随机
+        'RETRY_DEADLINE': 300,  # 单次调用（含重试）总时长上限（秒），0 为不限制
+        'OUTLINE_REPAIR_ROUNDS': 2,  # 大纲章节数不符时用小提示词补充缺失部分的最多轮数，0 为只删减多出的章节
+        'BATCH_DIR': os.path.join(DATA_DIR, 'batches'),  # 批处理模式的请求文件目录
+        'BATCH_ENDPOINT': '/v4/chat/completions',  # 批处理文件中每个请求的接口
+        'BATCH_COMPLETION_WINDOW': '24h',  # 批处理任务的完成时限
+        'BATCH_POLL_INTERVAL': 30,  # 查询批处理任务状态的间隔（秒）
+        'BATCH_TIMEOUT': 86400,  # 等待批处理任务的最长时间（秒），0 为不限制
+        'HTTP_BACKEND': 'sdk',  # 客户端实现: sdk（智谱 SDK）、httpx（可配置连接池）、async（事件循环，适合大量并发）
+        'HTTP_MAX_CONNECTIONS': 200,  # httpx/async 客户端连接池的最大连接数
+        'HTTP_MAX_KEEPALIVE': 50,  # 保持空闲的 keep-alive 连接数
+        'HTTP_KEEPALIVE_EXPIRY': 30,  # 空闲连接保持的秒数
+        'HTTP_CONNECT_TIMEOUT': 10,  # 建立连接的超时（秒）
+        'HTTP_READ_TIMEOUT': 300,  # 等待响应数据的超时（秒），单次请求可通过 timeout 参数另行指定
+        'ASYNC_CONCURRENCY_MAX': 200,  # 异步客户端的自适应并发上限，不超过 HTTP_MAX_CONNECTIONS
+        'HTTP2': True,  # 安装了 h2 包时使用 HTTP/2
+        'HEDGE_ENABLED': False,  # 对冲请求：调用耗时超过近期分位数时再发一个相同请求，先返回的被采用
+        'HEDGE_PERCENTILE': 95,  # 触发对冲的耗时分位数
+        'HEDGE_BUDGET': 0.05,  # 对冲请求数占总调用数的上限
+        'HEDGE_MIN_SAMPLES': 20,  # 近期样本数不足时不对冲
+        'HEDGE_WINDOW': 200,  # 计算分位数的近期调用数
+        'HEDGE_MIN_DELAY': 1.0,  # 发出对冲请求前至少等待的秒数
+        'PROVIDERS': None,  # 多个接口（key/地址/模型）负载均衡，格式见 provider_pool；None 时读取 PROVIDERS_FILE
+        'PROVIDERS_FILE': os.path.join(DATA_DIR, 'providers.json'),
+        'PROVIDER_ROUTING': 'weighted',  # 接口选择策略: weighted（加权轮询）或 least-outstanding（最少进行中请求）
+        'PROVIDER_COOLDOWN': 30,  # 接口被限流或连续失败后暂停使用的秒数（再次失败时加倍）
+        'PROVIDER_FAILURE_THRESHOLD': 3,  # 连续失败多少次后暂停使用该接口
+        'PROVIDER_HEALTH_INTERVAL': 30,  # 后台检查冷却结束的接口是否恢复的间隔（秒），0 为不检查
+        'ASYNC_FILE_WRITES': True,  # 小节文件交给后台线程批量写入，不阻塞 API 调用
+        'FILE_WRITE_BATCH': 32,  # 后台写文件每批最多的文件数
+        'FILE_WRITE_LINGER': 0.05,  # 后台写文件凑批的等待秒数
+        'FILE_FSYNC': True,  # 改名前 fsync，保证断电后文件完整（关闭后更快）
+        'OUTPUT_FORMAT': 'files',  # 命令行生成的课程输出格式：files（课程目录）或 bundle（SQLite 课程包）
+        'BUNDLE_PATH': None,  # 课程包文件，为空时每门课程一个（<课程目录>.course.db）
+        'BUNDLE_KEEP_FILES': False,  # 打包后是否保留课程目录
+        'RESUME': True,  # 断点续传：跳过生成清单中已完成的小节
+        'CACHE_ENABLED': True,  # 是否启用响应缓存，相同请求不再重复调用 API
+        'CACHE_PATH': os.path.join(DATA_DIR, 'response_cache.db'),
+        'CACHE_MAX_AGE_DAYS': 30,  # 缓存有效期（天）
+        'CACHE_MAX_SIZE_MB': 200,  # 缓存容量上限（MB）
+        'METRICS_ENABLED': True,  # 记录 API 调用指标，并在课程目录下写出 metrics.json / metrics.csv
+        'METRICS_PROMETHEUS_FILE': None,  # 同时写出 Prometheus 文本格式指标的文件路径，None 为不写
+        'LOG_MAX_LINES': 5000,  # 日志窗口最多保留的行数，超出后自动丢弃最早的行
+        'LOG_BUFFER_SIZE': 2000,  # 等待刷新到日志窗口的缓冲行数上限
+        'LOG_DIR': os.path.join(DATA_DIR, 'logs'),
+        'LOG_FILE_MAX_MB': 5,  # 单个日志文件大小上限（MB）
+        'LOG_FILE_BACKUPS': 5,  # 保留的历史日志文件数
         'TEMPERATURE': 0.7,
         'TOP_P': 0.95,
         'DEBUG': DEBUG
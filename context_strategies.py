@@ -0,0 +1,124 @@
+from typing import Dict, List, Type
+
+from course_model import Course, Section, load_course
+from token_budget import HistoryManager
+
+
+class SectionContext:
+    """
+    一个任务单元内的上下文
+
+    messages 返回生成某一节时要放在提示词前面的消息，add 在一节生成完成后调用。
+    """
+
+    tokens_saved = 0
+
+    def messages(self, section: Section) -> List[Dict]:
+        return []
+
+    def add(self, section: Section, prompt: str, content: str) -> None:
+        pass
+
+
+class ContextStrategy:
+    """
+    上下文策略
+
+    independent 为 True 的策略不依赖之前小节的内容，每一节都可以单独并发生成；
+    否则同一章的小节按顺序生成，章与章之间并发。
+    """
+
+    name = ''
+    independent = True
+
+    def __init__(self, course_dir: str):
+        self.course_dir = course_dir
+
+    def new_context(self) -> SectionContext:
+        return SectionContext()
+
+
+class _HistoryContext(SectionContext):
+    def __init__(self, mode: str):
+        self.history = HistoryManager(mode=mode)
+
+    @property
+    def tokens_saved(self):
+        return self.history.tokens_saved
+
+    def messages(self, section: Section) -> List[Dict]:
+        return self.history.messages()
+
+    def add(self, section: Section, prompt: str, content: str) -> None:
+        self.history.add(section.title, prompt, content)
+
+
+class NoContext(ContextStrategy):
+    """不带任何上下文"""
+    name = 'none'
+
+
+class PreviousSectionContext(ContextStrategy):
+    """带上同一章前面小节的完整问答（受 token 预算限制）"""
+    name = 'previous-section'
+    independent = False
+
+    def new_context(self) -> SectionContext:
+        return _HistoryContext('full')
+
+
+class SummaryContext(ContextStrategy):
+    """只带同一章前面小节的标题和 PPT 骨架"""
+    name = 'summary'
+    independent = False
+
+    def new_context(self) -> SectionContext:
+        return _HistoryContext('summary')
+
+
+class _ChapterOutline(SectionContext):
+    def __init__(self, course: Course):
+        self.course = course
+        self._messages = {}
+
+    def messages(self, section: Section) -> List[Dict]:
+        if section.chapter not in self._messages:
+            chapter = self.course.chapters[section.chapter]
+            lines = [f"课程: {self.course.title}"] if self.course.title else []
+            if self.course.student:
+                lines.append(f"目标学员: {self.course.student}")
+            lines.append(f"当前章: {chapter.title or f'第{chapter.index + 1}章'}")
+            lines.append("本章包含以下小节:")
+            lines.extend(f"- {s.title}" for s in chapter.sections)
+            lines.append("请只围绕要求的小节展开，避免与本章其他小节的内容重复。")
+            self._messages[section.chapter] = [{"role": "system", "content": '\n'.join(lines)}]
+        return self._messages[section.chapter]
+
+
+class ChapterOutlineContext(ContextStrategy):
+    """带上当前章的大纲（章名和本章所有节名），各节互不依赖，可以全部并发"""
+    name = 'chapter-outline'
+
+    def __init__(self, course_dir: str):
+        super().__init__(course_dir)
+        self.course = load_course(course_dir)
+
+    def new_context(self) -> SectionContext:
+        return _ChapterOutline(self.course)
+
+
+CONTEXT_STRATEGIES: Dict[str, Type[ContextStrategy]] = {}
+
+def register_context_strategy(strategy: Type[ContextStrategy]) -> Type[ContextStrategy]:
+    """注册上下文策略，可用作类装饰器"""
+    CONTEXT_STRATEGIES[strategy.name] = strategy
+    return strategy
+
+for _strategy in (NoContext, PreviousSectionContext, ChapterOutlineContext, SummaryContext):
+    register_context_strategy(_strategy)
+
+def create_context_strategy(name: str, course_dir: str) -> ContextStrategy:
+    """按名称创建上下文策略"""
+    if name not in CONTEXT_STRATEGIES:
+        raise ValueError(f"未知的上下文策略: {name}，可选: {', '.join(CONTEXT_STRATEGIES)}")
+    return CONTEXT_STRATEGIES[name](course_dir)
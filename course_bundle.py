@@ -0,0 +1,297 @@
+"""
+课程打包输出
+
+默认每门课程是一个目录，大纲和每个小节各占一个文本文件，课程很多时复制、扫描和备份都很慢。
+打包输出把课程的大纲、全部小节和元数据（课程结构、生成清单、指标报告）存入一个 SQLite 文件，
+可以每门课程一个（<课程目录>.course.db），也可以一次运行的所有课程共用一个:
+
+    python cli.py --batch courses.jsonl --output-format bundle
+    python cli.py --batch courses.jsonl --output-format bundle --bundle run.course.db
+
+生成过程仍在课程目录中进行（断点续传依赖其中的清单），课程完成后打包，
+默认删除已打包的文件（目录中没有其他内容时删除目录）；再次生成已打包的课程时先解包到课程目录。需要散文件时随时导出:
+
+    python cli.py --export run.course.db --output-dir ./导出
+"""
+import os
+import json
+import time
+import sqlite3
+import threading
+from concurrent.futures import wait
+from typing import Dict, List, Optional, Union
+
+from config import CONFIG
+from course_files import (OUTLINE_FILENAME, save_outline, queue_section_content, read_section_content,
+                          section_file_path)
+from course_manifest import MANIFEST_FILENAME
+from course_model import Course, load_course
+from file_writer import atomic_write
+
+BUNDLE_SUFFIX = '.course.db'
+
+
+class CourseBundle:
+    """
+    课程包（SQLite 文件），可以存放一门或多门课程
+
+    课程按课程目录名区分；小节按 (课程, 序号) 存储，另有 (课程, 节标题) 索引，
+    读取单个小节不需要加载整门课程。其他元数据文件原样存入 files 表。
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+
+        # 不使用 WAL，课程包始终是单个文件，便于复制和备份
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        with self._lock:
+            self._conn.executescript("""
+                CREATE TABLE IF NOT EXISTS courses (
+                    name TEXT PRIMARY KEY,
+                    title TEXT NOT NULL,
+                    student TEXT NOT NULL,
+                    chapters INTEGER NOT NULL,
+                    sections INTEGER NOT NULL,
+                    outline TEXT NOT NULL,
+                    packed_at REAL NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS sections (
+                    course TEXT NOT NULL,
+                    idx INTEGER NOT NULL,
+                    chapter INTEGER NOT NULL,
+                    number TEXT NOT NULL,
+                    title TEXT NOT NULL,
+                    content TEXT NOT NULL,
+                    PRIMARY KEY (course, idx)
+                ) WITHOUT ROWID;
+                CREATE INDEX IF NOT EXISTS idx_sections_title ON sections (course, title);
+                CREATE TABLE IF NOT EXISTS files (
+                    course TEXT NOT NULL,
+                    name TEXT NOT NULL,
+                    data BLOB NOT NULL,
+                    PRIMARY KEY (course, name)
+                ) WITHOUT ROWID;
+            """)
+            self._conn.commit()
+
+    def put_course(self, name: str, course: Course, outline: str, contents: Dict[int, str],
+                   files: Optional[Dict[str, bytes]] = None) -> None:
+        """
+        写入一门课程（整门课程在一个事务中替换）
+
+        Args:
+            name: 课程名（课程目录名）
+            contents: 小节序号 -> 内容，缺少的小节不写入
+            files: 其他元数据文件，文件名 -> 内容
+        """
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM sections WHERE course = ?", (name,))
+            self._conn.execute("DELETE FROM files WHERE course = ?", (name,))
+            self._conn.execute(
+                "INSERT OR REPLACE INTO courses (name, title, student, chapters, sections, outline, packed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (name, course.title, course.student, len(course.chapters), len(course.sections), outline, time.time())
+            )
+            self._conn.executemany(
+                "INSERT INTO sections (course, idx, chapter, number, title, content) VALUES (?, ?, ?, ?, ?, ?)",
+                [(name, s.index, s.chapter, s.number, s.title, contents[s.index])
+                 for s in course.sections if s.index in contents]
+            )
+            self._conn.executemany(
+                "INSERT INTO files (course, name, data) VALUES (?, ?, ?)",
+                [(name, filename, data) for filename, data in (files or {}).items()]
+            )
+
+    def courses(self) -> List[Dict]:
+        """课程包中的所有课程及已保存的小节数"""
+        with self._lock:
+            rows = self._conn.execute("""
+                SELECT c.name, c.title, c.student, c.chapters, c.sections, c.packed_at,
+                       (SELECT COUNT(*) FROM sections s WHERE s.course = c.name)
+                FROM courses c ORDER BY c.name
+            """).fetchall()
+        keys = ('name', 'title', 'student', 'chapters', 'sections', 'packed_at', 'saved_sections')
+        return [dict(zip(keys, row)) for row in rows]
+
+    def has_course(self, name: str) -> bool:
+        with self._lock:
+            return self._conn.execute("SELECT 1 FROM courses WHERE name = ?", (name,)).fetchone() is not None
+
+    def get_outline(self, name: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute("SELECT outline FROM courses WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else None
+
+    def get_section(self, name: str, section: Union[int, str]) -> Optional[str]:
+        """按小节序号（从 0 开始）或节标题读取小节内容，不存在时返回 None"""
+        column = 'idx' if isinstance(section, int) else 'title'
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT content FROM sections WHERE course = ? AND {column} = ?", (name, section)
+            ).fetchone()
+        return row[0] if row else None
+
+    def sections(self, name: str) -> List[Dict]:
+        """按大纲顺序返回课程的全部小节（含内容）"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT idx, chapter, number, title, content FROM sections WHERE course = ? ORDER BY idx", (name,)
+            ).fetchall()
+        return [dict(zip(('index', 'chapter', 'number', 'title', 'content'), row)) for row in rows]
+
+    def files(self, name: str) -> Dict[str, bytes]:
+        with self._lock:
+            rows = self._conn.execute("SELECT name, data FROM files WHERE course = ?", (name,)).fetchall()
+        return {filename: bytes(data) for filename, data in rows}
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+def bundle_path_for(course_dir: str, bundle_path: Optional[str] = None) -> str:
+    """课程所在的课程包：指定了 bundle_path（或 CONFIG['BUNDLE_PATH']）时共用该文件，否则每门课程一个"""
+    bundle_path = bundle_path or CONFIG['BUNDLE_PATH']
+    return bundle_path or os.path.normpath(course_dir) + BUNDLE_SUFFIX
+
+
+def _course_name(course_dir: str) -> str:
+    return os.path.basename(os.path.normpath(course_dir))
+
+
+def pack_course(course_dir: str, bundle_path: Optional[str] = None, remove_files: Optional[bool] = None,
+                window=None) -> str:
+    """
+    把课程目录存入课程包
+
+    Args:
+        remove_files: 打包后是否删除已打包的文件，默认取 not CONFIG['BUNDLE_KEEP_FILES']；
+            有小节尚未生成时始终保留，便于之后续跑。只打包课程目录第一层的文件，
+            子目录等未打包的内容不会删除，此时保留课程目录
+
+    Returns:
+        str: 课程包路径
+    """
+    if remove_files is None:
+        remove_files = not CONFIG['BUNDLE_KEEP_FILES']
+    path = bundle_path_for(course_dir, bundle_path)
+    course = load_course(course_dir)
+    with open(os.path.join(course_dir, OUTLINE_FILENAME), 'r', encoding='utf-8') as f:
+        outline = f.read()
+
+    contents = {}
+    section_files = set()
+    for section in course.sections:
+        filepath = section_file_path(section.title, course_dir)
+        if not os.path.exists(filepath):
+            continue
+        contents[section.index] = read_section_content(section.title, course_dir)
+        section_files.add(os.path.basename(filepath))
+
+    files = {}
+    for entry in os.scandir(course_dir):
+        if entry.is_file() and entry.name not in section_files and entry.name != OUTLINE_FILENAME \
+                and not entry.name.endswith('.tmp'):
+            with open(entry.path, 'rb') as f:
+                files[entry.name] = f.read()
+
+    bundle = CourseBundle(path)
+    try:
+        bundle.put_course(_course_name(course_dir), course, outline, contents, files)
+    finally:
+        bundle.close()
+
+    complete = len(contents) == len(course.sections)
+    if window:
+        missing = '' if complete else f"，缺少{len(course.sections) - len(contents)}节，保留课程目录"
+        window.log_message(f"课程已打包到: {path}（{len(contents)}节{missing}）")
+    if remove_files and complete:
+        _remove_packed(course_dir, [OUTLINE_FILENAME, *section_files, *files], window)
+    return path
+
+
+def _remove_packed(course_dir: str, filenames: List[str], window=None) -> None:
+    """只删除已存入课程包的文件，目录中还有其他内容（子目录、用户自己放入的文件）时保留目录"""
+    for filename in filenames:
+        try:
+            os.remove(os.path.join(course_dir, filename))
+        except FileNotFoundError:
+            pass
+    try:
+        os.rmdir(course_dir)
+    except OSError:
+        if window:
+            window.log_message(f"课程目录中还有未打包的文件，保留目录: {course_dir}")
+
+
+def unpack_course(bundle: CourseBundle, name: str, course_dir: str, window=None) -> str:
+    """把课程包中的一门课程还原为课程目录（散文件），生成清单中的文件路径改为新目录"""
+    os.makedirs(course_dir, exist_ok=True)
+    # 先写大纲，课程结构文件比大纲新时才不会重新解析大纲
+    save_outline(bundle.get_outline(name), course_dir)
+    for filename, data in bundle.files(name).items():
+        if filename == MANIFEST_FILENAME:
+            manifest = json.loads(data.decode('utf-8'))
+            for title, entry in manifest.get('sections', {}).items():
+                if entry.get('path'):
+                    entry['path'] = section_file_path(title, course_dir)
+            data = json.dumps(manifest, ensure_ascii=False, indent=2).encode('utf-8')
+        atomic_write(os.path.join(course_dir, filename), data, CONFIG['FILE_FSYNC'])
+
+    # 小节交给后台写文件线程批量写入
+    futures = [queue_section_content(section['title'], section['content'], course_dir)[1]
+               for section in bundle.sections(name)]
+    wait(futures)
+    for future in futures:
+        if future.exception() is not None:
+            raise future.exception()
+    if window:
+        window.log_message(f"已从课程包还原课程目录: {course_dir}")
+    return course_dir
+
+
+def restore_course(course_dir: str, bundle_path: Optional[str] = None, window=None) -> bool:
+    """
+    课程目录中没有大纲而课程包中有这门课程时，先解包再继续生成
+
+    Returns:
+        bool: 是否从课程包还原
+    """
+    path = bundle_path_for(course_dir, bundle_path)
+    if os.path.exists(os.path.join(course_dir, OUTLINE_FILENAME)) or not os.path.exists(path):
+        return False
+    bundle = CourseBundle(path)
+    try:
+        name = _course_name(course_dir)
+        if not bundle.has_course(name):
+            return False
+        unpack_course(bundle, name, course_dir, window)
+        return True
+    finally:
+        bundle.close()
+
+
+def export_bundle(bundle_path: str, output_dir: str, names: Optional[List[str]] = None, window=None) -> List[str]:
+    """
+    把课程包导出为散文件（每门课程一个目录）
+
+    Args:
+        names: 只导出这些课程（课程目录名），默认全部
+
+    Returns:
+        list: 导出的课程目录
+    """
+    if not os.path.exists(bundle_path):
+        raise FileNotFoundError(f"课程包不存在: {bundle_path}")
+    bundle = CourseBundle(bundle_path)
+    try:
+        available = [course['name'] for course in bundle.courses()]
+        selected = available if names is None else [name for name in names if name in available]
+        return [unpack_course(bundle, name, os.path.join(output_dir, name), window) for name in selected]
+    finally:
+        bundle.close()
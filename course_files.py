@@ -0,0 +1,129 @@
+import os
+import re
+import platform
+from functools import lru_cache
+
+from config import CONFIG
+from file_writer import atomic_write, get_file_writer, remove_quietly
+
+OUTLINE_FILENAME = '课程大纲.txt'
+
+
+def ensure_temp_directory():
+    """确保临时目录存在"""
+    dir_path = "优课工坊"
+    if platform.system() == "Windows":
+        temp_dir = 'D:\\' + dir_path
+    else:  # macOS or Linux
+        temp_dir = os.path.expanduser('~/Desktop/' + dir_path)
+
+    if not os.path.exists(temp_dir):
+        try:
+            os.makedirs(temp_dir)
+            print(f"创建目录成功: {temp_dir}")
+        except Exception as e:
+            print(f"创建目录失败: {temp_dir}. 错误: {str(e)}")
+    return temp_dir
+
+def create_course_directory(title, base_dir=None):
+    """创建课程目录，未指定 base_dir 时放在默认的优课工坊目录下"""
+    if base_dir is None:
+        base_dir = ensure_temp_directory()
+    course_dir = os.path.join(base_dir, sanitize_filename(title))
+    if not os.path.exists(course_dir):
+        os.makedirs(course_dir)
+    return course_dir
+
+@lru_cache(maxsize=128)
+def sanitize_filename(filename):
+    """清理文件名"""
+    sanitized = re.sub(r'[\\/*?:"<>|]', '', filename)
+    return sanitized.replace(' ', '_')
+
+def section_file_path(title, course_dir):
+    """小节内容文件路径"""
+    return os.path.join(course_dir, f'{sanitize_filename(title)}.txt')
+
+def read_section_content(title, course_dir):
+    """读取已保存的小节内容（去掉标题行）"""
+    with open(section_file_path(title, course_dir), 'r', encoding='utf-8') as f:
+        content = f.read()
+    header = f"# {title}\n\n"
+    return content[len(header):] if content.startswith(header) else content
+
+def save_outline(content, course_dir, window=None):
+    """保存课程大纲"""
+    outline_file = os.path.join(course_dir, OUTLINE_FILENAME)
+    atomic_write(outline_file, content, CONFIG['FILE_FSYNC'])
+    if window:
+        window.log_message(f'课程大纲已经保存到：{outline_file}')
+    return outline_file
+
+def save_section_content(title, content, course_dir, window=None):
+    """优化文件写入"""
+    try:
+        formatted_content = f"# {title}\n\n{content}"
+        filepath = section_file_path(title, course_dir)
+
+        atomic_write(filepath, formatted_content, CONFIG['FILE_FSYNC'])
+        if window:
+            window.log_message(f"[{title}]已保存到: {filepath}")
+        return filepath
+
+    except Exception as e:
+        if window:
+            window.log_message(f"保存失败: {str(e)}")
+        raise
+
+def queue_section_content(title, content, course_dir, window=None, callback=None):
+    """
+    把小节内容交给后台写文件线程，立即返回，不等待写入完成
+
+    写入失败只记录日志，不抛给调用方；需要处理结果时传入 callback（参数为 Future）。
+
+    Returns:
+        tuple: (文件路径, Future)
+    """
+    filepath = section_file_path(title, course_dir)
+
+    def on_written(future):
+        if window:
+            if future.exception() is None:
+                window.log_message(f"[{title}]已保存到: {filepath}")
+            else:
+                window.log_message(f"[{title}]保存失败: {str(future.exception())}")
+        if callback:
+            callback(future)
+
+    return filepath, get_file_writer().write(filepath, f"# {title}\n\n{content}", on_written)
+
+def stream_section_content(title, chunks, course_dir, window=None):
+    """
+    流式写入小节内容，每收到一段增量就写入临时文件，全部完成后再改名为小节文件
+
+    Args:
+        chunks: 增量内容迭代器
+
+    Returns:
+        str: 文件路径
+    """
+    filepath = section_file_path(title, course_dir)
+    tmp_path = f"{filepath}.{os.getpid()}.stream.tmp"
+    try:
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(f"# {title}\n\n")
+            for chunk in chunks:
+                f.write(chunk)
+                f.flush()
+            if CONFIG['FILE_FSYNC']:
+                os.fsync(f.fileno())
+        os.replace(tmp_path, filepath)
+        if window:
+            window.log_message(f"[{title}]已保存到: {filepath}")
+        return filepath
+
+    except Exception as e:
+        remove_quietly(tmp_path)
+        if window:
+            window.log_message(f"保存失败: {str(e)}")
+        raise
@@ -0,0 +1,141 @@
+import os
+import json
+import time
+import hashlib
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from config import CONFIG
+from prompt_functions import prompt_version
+
+MANIFEST_FILENAME = 'manifest.json'
+
+# 小节状态
+STATUS_RUNNING = 'running'
+STATUS_DONE = 'done'
+STATUS_FAILED = 'failed'
+
+
+def prompt_hash(messages: List[Dict], model: Optional[str] = None) -> str:
+    """
+    计算实际发送的完整消息（固定说明、上下文、本次提问）、模板版本及模型参数的哈希，
+    其中任何一项变化后已完成的小节需要重新生成
+
+    Args:
+        messages: 请求中的全部消息，与响应缓存键使用的消息相同
+        model: 使用的模型（接口池为各接口模型的组合），默认取 CONFIG['MODEL']
+    """
+    payload = json.dumps(
+        [model or CONFIG['MODEL'], CONFIG['TEMPERATURE'], CONFIG['TOP_P'], CONFIG['MAX_TOKENS'], prompt_version(),
+         messages],
+        ensure_ascii=False
+    )
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class CourseManifest:
+    """
+    课程生成清单
+
+    保存在课程目录下，记录每个小节的状态、提示词哈希、输出文件和耗时，
+    用于中断后从断点继续生成。所有方法都是线程安全的，每次状态变化都会立即落盘。
+    """
+
+    def __init__(self, course_dir: str):
+        self.path = os.path.join(course_dir, MANIFEST_FILENAME)
+        self._lock = threading.Lock()
+        self.data = {'version': 1, 'sections': {}}
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                if isinstance(data.get('sections'), dict):
+                    self.data = data
+            except (OSError, ValueError) as e:
+                print(f"读取生成清单失败，将重新记录: {str(e)}")
+
+    @property
+    def sections(self) -> Dict[str, Dict]:
+        return self.data['sections']
+
+    def get(self, title: str) -> Optional[Dict]:
+        with self._lock:
+            entry = self.sections.get(title)
+            return dict(entry) if entry else None
+
+    def is_complete(self, title: str, section_hash: str) -> bool:
+        """小节已完成、提示词未变化且输出文件仍然存在"""
+        entry = self.get(title)
+        return bool(
+            entry
+            and entry.get('status') == STATUS_DONE
+            and entry.get('prompt_hash') == section_hash
+            and entry.get('path')
+            and os.path.exists(entry['path'])
+        )
+
+    def mark_running(self, index: int, title: str, section_hash: str) -> None:
+        with self._lock:
+            self.sections[title] = {
+                'index': index,
+                'status': STATUS_RUNNING,
+                'prompt_hash': section_hash,
+                'path': None,
+                'started_at': time.time(),
+                'finished_at': None,
+                'duration': None,
+                'error': None
+            }
+            self._save()
+
+    def mark_batched(self, batch_id: str, requests: Dict[str, Dict]) -> None:
+        """
+        记录已提交到批处理任务的小节，程序中断后据此继续等待该任务而不是重新提交
+
+        Args:
+            requests: 节标题 -> {'custom_id': 批处理请求 ID, 'cache_key': 响应缓存键}
+        """
+        with self._lock:
+            for title, request in requests.items():
+                entry = self.sections.get(title)
+                if entry is not None:
+                    entry['batch_id'] = batch_id
+                    entry.update(request)
+            self._save()
+
+    def pending_batches(self) -> Dict[str, List[Tuple[str, Dict]]]:
+        """已提交到批处理任务、尚未取回结果的小节，按批处理任务 ID 分组，值为 (节标题, 清单记录)"""
+        pending = {}
+        with self._lock:
+            for title, entry in self.sections.items():
+                if entry.get('status') == STATUS_RUNNING and entry.get('batch_id'):
+                    pending.setdefault(entry['batch_id'], []).append((title, dict(entry)))
+        return pending
+
+    def mark_done(self, title: str, path: str) -> None:
+        with self._lock:
+            entry = self.sections[title]
+            entry['status'] = STATUS_DONE
+            entry['path'] = path
+            entry['finished_at'] = time.time()
+            entry['duration'] = round(entry['finished_at'] - entry['started_at'], 3)
+            self._save()
+
+    def mark_failed(self, title: str, error: str) -> None:
+        with self._lock:
+            entry = self.sections.get(title)
+            if entry is None:
+                return
+            entry['status'] = STATUS_FAILED
+            entry['error'] = error
+            entry['finished_at'] = time.time()
+            entry['duration'] = round(entry['finished_at'] - entry['started_at'], 3)
+            self._save()
+
+    def _save(self) -> None:
+        """先写临时文件再替换，避免中途崩溃留下损坏的清单"""
+        self.data['updated_at'] = time.time()
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.data, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,230 @@
+import os
+import re
+import json
+import threading
+from dataclasses import dataclass, field, asdict
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from course_files import OUTLINE_FILENAME
+
+COURSE_MODEL_FILENAME = '课程结构.json'
+
+_CHAPTER_RE = re.compile(r'^第\s*([0-9一二三四五六七八九十百零〇两]+)\s*章')
+_SECTION_RE = re.compile(r'^(\d+)\s*[.．]\s*(\d+)(?![.．\d])')
+_HEADING_RE = re.compile(r'^(#+)\s*(.*)$')
+_BULLET_RE = re.compile(r'^(?:[-*+•]\s+)+')
+
+
+@dataclass(slots=True)
+class Section:
+    """小节，index 为在整门课程中的顺序（从 0 开始）"""
+    index: int
+    chapter: int
+    title: str
+    number: str = ''
+
+
+@dataclass(slots=True)
+class Chapter:
+    index: int
+    title: str
+    number: str = ''
+    sections: List[Section] = field(default_factory=list)
+
+
+@dataclass(slots=True)
+class Course:
+    """
+    解析后的课程结构
+
+    由课程大纲解析一次得到，保存为课程目录下的 课程结构.json，
+    后续的生成、断点续传和任务拆分都使用它，不再逐行扫描大纲文本。
+    """
+    title: str = ''
+    student: str = ''
+    chapters: List[Chapter] = field(default_factory=list)
+
+    @property
+    def sections(self) -> List[Section]:
+        """按大纲顺序排列的全部小节"""
+        return [section for chapter in self.chapters for section in chapter.sections]
+
+    def iter_sections(self) -> Iterator[Tuple[Chapter, Section]]:
+        for chapter in self.chapters:
+            for section in chapter.sections:
+                yield chapter, section
+
+    def reindex(self) -> None:
+        """增删章节后重新编排章序号和小节序号"""
+        index = 0
+        for chapter_index, chapter in enumerate(self.chapters):
+            chapter.index = chapter_index
+            for section in chapter.sections:
+                section.index = index
+                section.chapter = chapter_index
+                index += 1
+
+    def to_dict(self) -> Dict:
+        return asdict(self)
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'Course':
+        chapters = []
+        for c in data.get('chapters') or []:
+            sections = [Section(s['index'], s['chapter'], s['title'], s.get('number', '')) for s in c.get('sections') or []]
+            chapters.append(Chapter(c['index'], c['title'], c.get('number', ''), sections))
+        return cls(data.get('title', ''), data.get('student', ''), chapters)
+
+
+def _clean_line(line: str) -> str:
+    """去掉全角井号、加粗标记和列表符号"""
+    line = line.strip().replace('＃', '#')
+    line = line.replace('**', '').replace('__', '')
+    match = _HEADING_RE.match(line)
+    if match:
+        return match.group(1) + ' ' + _BULLET_RE.sub('', match.group(2).strip())
+    return _BULLET_RE.sub('', line)
+
+
+def parse_outline(text: str, title: str = '', student: str = '') -> Course:
+    """
+    解析模型返回的课程大纲
+
+    兼容常见的格式偏差：代码块包裹、全角井号、加粗、列表符号、
+    用 ##/### 表示章节、额外的课程标题行，以及没有井号但以“第X章”/“1.1”开头的行。
+    出现在第一章之前的小节归入一个无标题的章。
+    """
+    lines = []
+    for raw in text.splitlines():
+        line = _clean_line(raw)
+        if not line or line.startswith('```'):
+            continue
+        lines.append(line)
+
+    # 标题层级：取出现的最浅两级分别作为章和节
+    levels = []
+    for line in lines:
+        match = _HEADING_RE.match(line)
+        if match and match.group(2).strip():
+            levels.append(len(match.group(1)))
+    distinct = sorted(set(levels))
+    # 最浅一级只出现一次且下面还有两级时，视为课程标题
+    if len(distinct) >= 3 and levels.count(distinct[0]) == 1:
+        distinct = distinct[1:]
+    chapter_level = distinct[0] if len(distinct) >= 2 else None
+    section_level = distinct[1] if len(distinct) >= 2 else None
+
+    course = Course(title=title, student=student)
+    section_index = 0
+
+    def add_chapter(heading):
+        match = _CHAPTER_RE.match(heading)
+        course.chapters.append(Chapter(len(course.chapters), heading, match.group(1) if match else ''))
+
+    def add_section(heading):
+        nonlocal section_index
+        if not course.chapters:
+            course.chapters.append(Chapter(0, ''))
+        chapter = course.chapters[-1]
+        match = _SECTION_RE.match(heading)
+        number = f"{match.group(1)}.{match.group(2)}" if match else ''
+        chapter.sections.append(Section(section_index, chapter.index, heading, number))
+        section_index += 1
+
+    for line in lines:
+        match = _HEADING_RE.match(line)
+        if match:
+            level, heading = len(match.group(1)), match.group(2).strip()
+            if not heading:
+                continue
+            if chapter_level is None:
+                # 只有一级标题时按内容区分章和节
+                if _SECTION_RE.match(heading):
+                    add_section(heading)
+                else:
+                    add_chapter(heading)
+            elif level == chapter_level:
+                add_chapter(heading)
+            elif level == section_level:
+                add_section(heading)
+        elif _CHAPTER_RE.match(line):
+            add_chapter(line)
+        elif _SECTION_RE.match(line):
+            add_section(line)
+    return course
+
+
+def render_outline(course: Course) -> str:
+    """按标准格式输出大纲文本（# 章 / ## 节）"""
+    lines = []
+    for chapter in course.chapters:
+        if chapter.title:
+            lines.append(f"# {chapter.title}")
+        lines.extend(f"## {section.title}" for section in chapter.sections)
+    return '\n'.join(lines)
+
+
+def model_path(course_dir: str) -> str:
+    return os.path.join(course_dir, COURSE_MODEL_FILENAME)
+
+
+def save_course_model(course: Course, course_dir: str) -> str:
+    """把课程结构写到大纲旁边，返回文件路径"""
+    path = model_path(course_dir)
+    with open(path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(course.to_dict(), f, ensure_ascii=False, indent=2)
+    os.replace(path + '.tmp', path)
+    with _lock:
+        _loaded[course_dir] = (_mtime(os.path.join(course_dir, OUTLINE_FILENAME)), course)
+    return path
+
+
+_lock = threading.Lock()
+_loaded: Dict[str, Tuple[Optional[int], Course]] = {}
+
+
+def _mtime(path: str) -> Optional[int]:
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+def load_course(course_dir: str, title: str = '', student: str = '') -> Course:
+    """
+    读取课程结构
+
+    同一进程内按大纲文件的修改时间缓存；课程结构文件缺失或比大纲旧
+    （例如用户手动修改了大纲）时重新解析大纲并保存。
+
+    Raises:
+        FileNotFoundError: 课程目录中没有大纲
+    """
+    outline_path = os.path.join(course_dir, OUTLINE_FILENAME)
+    outline_mtime = _mtime(outline_path)
+    if outline_mtime is None:
+        raise FileNotFoundError(f"课程大纲不存在: {outline_path}")
+
+    with _lock:
+        cached = _loaded.get(course_dir)
+    if cached and cached[0] == outline_mtime:
+        return cached[1]
+
+    path = model_path(course_dir)
+    model_mtime = _mtime(path)
+    course = None
+    if model_mtime is not None and model_mtime >= outline_mtime:
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                course = Course.from_dict(json.load(f))
+        except (OSError, ValueError, KeyError, TypeError):
+            course = None
+
+    if course is None:
+        with open(outline_path, 'r', encoding='utf-8') as f:
+            course = parse_outline(f.read(), title, student)
+        save_course_model(course, course_dir)
+    else:
+        with _lock:
+            _loaded[course_dir] = (outline_mtime, course)
+    return course
@@ -0,0 +1,222 @@
+import os
+import time
+import queue
+import threading
+from concurrent.futures import Future
+from typing import Callable, Dict, List, Optional, Union
+
+from config import CONFIG
+
+
+def atomic_write(path: str, data: Union[str, bytes], fsync: bool = True) -> int:
+    """
+    先写临时文件再改名，中途崩溃不会留下只写了一半的文件
+
+    Returns:
+        int: 写入的字节数
+    """
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    payload = data if isinstance(data, bytes) else data.encode('utf-8')
+    try:
+        with open(tmp_path, 'wb') as f:
+            f.write(payload)
+            if fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        remove_quietly(tmp_path)
+        raise
+    if fsync:
+        fsync_directory(os.path.dirname(path))
+    return len(payload)
+
+
+def fsync_directory(directory: str) -> None:
+    """让目录中的改名落盘；Windows 不支持打开目录，直接跳过"""
+    if os.name == 'nt':
+        return
+    try:
+        fd = os.open(directory or '.', os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def remove_quietly(path: str) -> None:
+    """删除文件（如写到一半的临时文件），文件不存在或删除失败时忽略"""
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+class _WriteJob:
+    __slots__ = ('path', 'data', 'future', 'callbacks')
+
+    def __init__(self, path: str, data: str):
+        self.path = path
+        self.data = data
+        self.future = Future()
+        self.callbacks: List[Callable[[Future], None]] = []
+
+
+class FileWriter:
+    """
+    后台批量写文件
+
+    write 只把内容放入队列，由写文件线程按批取出：同一批中对同一文件的多次写入只保留最后一次，
+    每个文件先写入临时文件并 fsync，整批写完后再依次改名，最后每个目录只 fsync 一次。
+    写入失败不会抛给调用方，只体现在返回的 Future 上（可通过回调处理）。
+
+    Args:
+        batch_size: 每批最多写入的文件数
+        linger: 取到第一个文件后再等待多少秒凑成一批
+        fsync: 是否在改名前 fsync，关闭后更快但断电时可能丢失最近写入的文件
+    """
+
+    def __init__(self, batch_size: Optional[int] = None, linger: Optional[float] = None,
+                 fsync: Optional[bool] = None):
+        self.batch_size = max(1, CONFIG['FILE_WRITE_BATCH'] if batch_size is None else batch_size)
+        self.linger = CONFIG['FILE_WRITE_LINGER'] if linger is None else linger
+        self.fsync = CONFIG['FILE_FSYNC'] if fsync is None else fsync
+        self._queue = queue.Queue()
+        self._pending = 0
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name='file-writer', daemon=True)
+        self._thread.start()
+
+    def write(self, path: str, data: str, callback: Optional[Callable[[Future], None]] = None) -> Future:
+        """
+        把文件内容放入写入队列
+
+        Args:
+            callback: 写入完成（或失败）后在写文件线程中调用，参数为已完成的 Future，
+                返回的 Future 在回调执行完后才完成
+
+        Returns:
+            Future: 结果为写入的字节数，失败时为异常
+        """
+        job = _WriteJob(path, data)
+        if callback:
+            job.callbacks.append(callback)
+        with self._cond:
+            self._pending += 1
+        self._queue.put(job)
+        return job.future
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """等待队列中已有的文件全部写完，超时返回 False"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while self._pending:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def _next_batch(self, jobs: List[_WriteJob]) -> None:
+        """取出一批文件放入 jobs（出错时已取出的文件也在 jobs 中）"""
+        jobs.append(self._queue.get())
+        deadline = time.monotonic() + self.linger
+        while len(jobs) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                jobs.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+
+    def _run(self) -> None:
+        while True:
+            jobs: List[_WriteJob] = []
+            try:
+                self._next_batch(jobs)
+                self._write_batch(jobs)
+            except Exception as e:
+                # 意外错误不能让写文件线程退出，否则等待写入结果的一方会一直等下去
+                for job in jobs:
+                    if not job.future.done():
+                        self._finish(job, [], error=e)
+            finally:
+                with self._cond:
+                    self._pending -= len(jobs)
+                    self._cond.notify_all()
+
+    def _write_batch(self, jobs: List[_WriteJob]) -> None:
+        # 同一文件只写最后一次，被覆盖的写入与最后一次共享结果
+        latest: Dict[str, _WriteJob] = {}
+        superseded: Dict[str, List[_WriteJob]] = {}
+        for job in jobs:
+            if job.path in latest:
+                superseded.setdefault(job.path, []).append(latest[job.path])
+            latest[job.path] = job
+
+        staged = []
+        for path, job in latest.items():
+            tmp_path = f"{path}.{os.getpid()}.writer.tmp"
+            try:
+                payload = job.data.encode('utf-8')
+                with open(tmp_path, 'wb') as f:
+                    f.write(payload)
+                    if self.fsync:
+                        f.flush()
+                        os.fsync(f.fileno())
+                staged.append((job, tmp_path, len(payload)))
+            except Exception as e:
+                remove_quietly(tmp_path)
+                self._finish(job, superseded.get(path, []), error=e)
+
+        directories = set()
+        renamed = []
+        for job, tmp_path, size in staged:
+            try:
+                os.replace(tmp_path, job.path)
+            except Exception as e:
+                remove_quietly(tmp_path)
+                self._finish(job, superseded.get(job.path, []), error=e)
+                continue
+            directories.add(os.path.dirname(job.path))
+            renamed.append((job, size))
+
+        if self.fsync:
+            for directory in directories:
+                fsync_directory(directory)
+        for job, size in renamed:
+            self._finish(job, superseded.get(job.path, []), result=size)
+
+    def _finish(self, job: _WriteJob, superseded: List[_WriteJob], result=None, error=None) -> None:
+        # 回调收到的是一个已完成的副本，回调全部执行完后返回给调用方的 Future 才完成，
+        # 等待 Future 的一方可以确定回调（如更新清单）已经生效
+        for item in (*superseded, job):
+            outcome = Future()
+            if error is not None:
+                outcome.set_exception(error)
+            else:
+                outcome.set_result(result)
+            for callback in item.callbacks:
+                try:
+                    callback(outcome)
+                except Exception as e:
+                    print(f"写文件回调出错: {str(e)}")
+            if error is not None:
+                item.future.set_exception(error)
+            else:
+                item.future.set_result(result)
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+def get_file_writer() -> FileWriter:
+    """全局共享的写文件线程"""
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = FileWriter()
+        return _writer
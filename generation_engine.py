@@ -0,0 +1,462 @@
+import os
+import queue
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Callable, List, Optional, Tuple
+
+from config import CONFIG
+from prompt_functions import generate_course_outline, generate_section_content, section_system_prompt
+from api_client import (chat_with_moonshot, stream_with_moonshot, achat_with_moonshot, is_async_client, client_models,
+                        request_messages)
+from course_files import (OUTLINE_FILENAME, save_outline, save_section_content, stream_section_content,
+                          queue_section_content, section_file_path, read_section_content)
+from course_manifest import CourseManifest, prompt_hash
+from course_model import Section, parse_outline, render_outline, save_course_model, load_course
+from outline_repair import repair_outline
+from context_strategies import CONTEXT_STRATEGIES, create_context_strategy
+from metrics import get_metrics
+
+
+class GenerationCancelled(Exception):
+    """生成任务被用户取消"""
+
+
+class JobControl:
+    """
+    生成任务的暂停/取消控制
+
+    由界面线程调用 pause/resume/cancel，工作线程在每个小节开始前调用 checkpoint。
+    """
+
+    def __init__(self):
+        self._cancelled = threading.Event()
+        self._running = threading.Event()
+        self._running.set()
+
+    def pause(self):
+        self._running.clear()
+
+    def resume(self):
+        self._running.set()
+
+    def cancel(self):
+        self._cancelled.set()
+        # 唤醒处于暂停状态的工作线程，让其尽快退出
+        self._running.set()
+
+    @property
+    def paused(self):
+        return not self._running.is_set()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def checkpoint(self):
+        """暂停时阻塞等待，已取消时抛出 GenerationCancelled"""
+        self._running.wait()
+        if self._cancelled.is_set():
+            raise GenerationCancelled("任务已取消")
+
+    async def checkpoint_async(self, poll_interval: float = 0.2):
+        """checkpoint 的协程版本，暂停时不阻塞事件循环"""
+        while self.paused:
+            await asyncio.sleep(poll_interval)
+        self.checkpoint()
+
+
+class LiveLog:
+    """把流式增量按行转发到日志，每行带上小节标题"""
+
+    def __init__(self, window, title):
+        self.window = window
+        self.title = title
+        self.pending = ''
+
+    def feed(self, delta):
+        self.pending += delta
+        *lines, self.pending = self.pending.split('\n')
+        for line in lines:
+            if line.strip():
+                self.window.log_message(f"[{self.title}] {line}")
+
+    def close(self):
+        if self.pending.strip():
+            self.window.log_message(f"[{self.title}] {self.pending}")
+        self.pending = ''
+
+
+def course_label(course_dir: str) -> str:
+    """指标中使用的课程名（课程目录名）"""
+    return os.path.basename(os.path.normpath(course_dir))
+
+
+def record_written(course_dir: str, filepath: Optional[str]) -> None:
+    """把写入文件的大小计入课程指标"""
+    if CONFIG['METRICS_ENABLED'] and filepath and os.path.exists(filepath):
+        get_metrics().record_bytes(course_label(course_dir), os.path.getsize(filepath))
+
+
+def write_metrics_report(course_dir: str, window=None) -> None:
+    """写出课程指标报告，失败时只记录日志，不影响生成结果"""
+    if not CONFIG['METRICS_ENABLED']:
+        return
+    try:
+        get_metrics().write_course_report(course_label(course_dir), course_dir)
+    except OSError as e:
+        if window:
+            window.log_message(f"保存指标报告失败: {str(e)}")
+
+
+def generate_outline(client, title, student, chapter, section, course_dir, window=None, control=None) -> str:
+    """
+    生成课程大纲并保存到课程目录，同时解析并保存课程结构
+
+    章节数与要求不一致时先用针对缺失部分的提示词修复，保存的是修复后的大纲。
+
+    Returns:
+        str: 课程大纲文件路径
+    """
+    if control:
+        control.checkpoint()
+    prompt = generate_course_outline(
+        title=title,
+        student=student,
+        chapter=chapter,
+        section=section
+    )
+
+    if window:
+        window.log_message("开始用AI设计课程大纲...")
+    # 重新生成大纲是用户的明确意图，不使用响应缓存
+    content = chat_with_moonshot(client=client, prompt=prompt, history=[], window=window, use_cache=False,
+                                 course=course_label(course_dir))
+    if window:
+        window.log_message("课程大纲设计完成")
+
+    course = parse_outline(content, title, student)
+    if repair_outline(client, course, chapter, section, window=window, course_label=course_label(course_dir)):
+        content = render_outline(course)
+    outline_path = save_outline(content, course_dir, window)
+    record_written(course_dir, outline_path)
+    save_course_model(course, course_dir)
+    if window:
+        window.log_message(f"解析出{len(course.chapters)}章{len(course.sections)}节")
+    return outline_path
+
+
+def build_work_units(sections: List[Section], context_strategy: str) -> List[List[Tuple[int, Section]]]:
+    """
+    按上下文策略把小节划分为任务单元
+
+    同一单元内的小节按顺序生成并共享上下文，不同单元之间可以并发执行：
+    不依赖前面小节的策略每节一个单元，其余策略每章一个单元。
+
+    Returns:
+        list: 任务单元列表，每个单元是 (在 sections 中的序号, 小节) 列表
+    """
+    if context_strategy not in CONTEXT_STRATEGIES:
+        raise ValueError(f"未知的上下文策略: {context_strategy}")
+
+    if CONTEXT_STRATEGIES[context_strategy].independent:
+        return [[(i, section)] for i, section in enumerate(sections)]
+
+    units = []
+    current_chapter = None
+    for i, section in enumerate(sections):
+        if not units or section.chapter != current_chapter:
+            units.append([])
+            current_chapter = section.chapter
+        units[-1].append((i, section))
+    return units
+
+
+def generate_sections(client,
+                      sections: List[Section],
+                      course_dir: str,
+                      save_section: Optional[Callable[[str, str, str], None]] = None,
+                      window=None,
+                      progress: Optional[Callable[[int, int, str], None]] = None,
+                      workers: Optional[int] = None,
+                      context_strategy: Optional[str] = None,
+                      control: Optional[JobControl] = None,
+                      stream: Optional[bool] = None,
+                      resume: Optional[bool] = None,
+                      manifest: Optional[CourseManifest] = None) -> None:
+    """
+    并发生成课程各小节内容
+
+    每个小节生成完成后立即保存（ASYNC_FILE_WRITES 开启且未传入 save_section 时交给后台写文件线程，
+    写完后才在清单中标记完成，保存失败的小节在全部生成结束后统一报错）；进度回调按大纲顺序触发，
+    即使后面的小节先完成，也会等前面的小节完成后再一并上报。
+    异步客户端（HTTP_BACKEND 为 async）时各任务单元以协程在客户端的事件循环中运行，
+    不再为每个并发单元占用一个线程。
+
+    Args:
+        client: API客户端实例
+        sections: 要生成的小节，通常为 Course.sections 或其中一部分
+        course_dir: 课程目录
+        save_section: 保存函数，参数为 (节标题, 内容, 课程目录)，返回文件路径，
+            会在工作线程中调用，默认使用 course_files.save_section_content
+        window: 主窗口实例，用于显示日志
+        progress: 进度回调，参数为 (已完成数, 总数, 节标题)
+        workers: 并发数（同时进行的任务单元数），默认取 CONFIG['MAX_WORKERS']
+        context_strategy: 上下文策略名称（见 context_strategies），默认取 CONFIG['CONTEXT_STRATEGY']
+        control: 暂停/取消控制，取消时抛出 GenerationCancelled
+        stream: 是否流式生成，默认取 CONFIG['STREAM']；流式模式下增量内容直接写入
+            小节文件并实时显示在日志中，此时 save_section 不会被调用；异步客户端不支持流式
+        resume: 是否断点续传，默认取 CONFIG['RESUME']；开启后跳过生成清单中已完成
+            且提示词未变化的小节，只重新生成失败或缺失的小节
+        manifest: 生成清单，默认读取课程目录下的清单；同一课程分多次并发调用时
+            需要传入同一个实例，避免相互覆盖
+    """
+    if workers is None:
+        workers = CONFIG['MAX_WORKERS']
+    if context_strategy is None:
+        context_strategy = CONFIG['CONTEXT_STRATEGY']
+    if stream is None:
+        stream = CONFIG['STREAM']
+    if resume is None:
+        resume = CONFIG['RESUME']
+    use_async = is_async_client(client)
+    if use_async and stream:
+        if window:
+            window.log_message("异步客户端不支持流式生成，改为一次性生成")
+        stream = False
+    background_writes = save_section is None and CONFIG['ASYNC_FILE_WRITES']
+    if save_section is None:
+        def save_section(section_title, content, section_dir):
+            return save_section_content(section_title, content, section_dir, window)
+
+    units = build_work_units(sections, context_strategy)
+    if not units:
+        return
+
+    workers = max(1, min(int(workers), len(units)))
+    strategy = create_context_strategy(context_strategy, course_dir)
+    # 只有后面的小节需要用到前面小节的内容时才保留完整内容
+    keep_content = not strategy.independent
+    system = section_system_prompt()
+    course = course_label(course_dir)
+    models = client_models(client)
+    saved_tokens = []
+    pending_writes = []
+    events = queue.Queue()
+    stop_event = threading.Event()
+    if manifest is None:
+        manifest = CourseManifest(course_dir)
+
+    def stream_section(section_title, prompt, history):
+        """流式生成并写入小节，只在上下文需要时保留完整内容"""
+        parts = [] if keep_content else None
+        live_log = LiveLog(window, section_title) if window else None
+
+        def chunks():
+            for delta in stream_with_moonshot(client=client, prompt=prompt, history=history, window=window,
+                                              course=course, system=system):
+                if parts is not None:
+                    parts.append(delta)
+                if live_log:
+                    live_log.feed(delta)
+                yield delta
+            if live_log:
+                live_log.close()
+
+        try:
+            filepath = stream_section_content(section_title, chunks(), course_dir, window)
+        finally:
+            if live_log:
+                live_log.close()
+        return (''.join(parts) if parts is not None else None), filepath
+
+    def begin_section(index, section, context):
+        """准备一节的请求，返回 (提示词, 上下文消息)；已完成的小节直接上报并返回 None"""
+        prompt = generate_section_content(title=section.title)
+        messages = context.messages(section)
+        section_hash = prompt_hash(request_messages(prompt, messages, system), models)
+
+        if resume and manifest.is_complete(section.title, section_hash):
+            if window:
+                window.log_message(f"[{section.title}]已完成，跳过")
+            if keep_content:
+                context.add(section, prompt, read_section_content(section.title, course_dir))
+            events.put(('done', index, None))
+            return None
+
+        if window:
+            window.log_message(f"开始用AI设计[{section.title}]的内容...")
+        manifest.mark_running(index, section.title, section_hash)
+        return prompt, messages
+
+    def on_written(title, filepath):
+        """后台写文件完成后更新清单，失败的小节下次运行时重新生成"""
+        def callback(future):
+            if future.exception() is not None:
+                manifest.mark_failed(title, f"保存失败: {str(future.exception())}")
+            else:
+                manifest.mark_done(title, filepath)
+                record_written(course_dir, filepath)
+        return callback
+
+    def finish_section(index, section, context, prompt, content, filepath=None):
+        """保存一节的内容（流式生成时已写入 filepath）并更新清单"""
+        if window:
+            window.log_message(f"[{section.title}]的内容设计完成")
+        if filepath is None and background_writes:
+            # 交给写文件线程，不阻塞当前工作线程，写完后再在清单中标记完成
+            target = section_file_path(section.title, course_dir)
+            _, future = queue_section_content(section.title, content, course_dir, window,
+                                              callback=on_written(section.title, target))
+            pending_writes.append(future)
+        else:
+            try:
+                # 及时保存
+                if filepath is None:
+                    filepath = save_section(section.title, content, course_dir) or section_file_path(section.title, course_dir)
+            except Exception as e:
+                manifest.mark_failed(section.title, str(e))
+                raise
+            manifest.mark_done(section.title, filepath)
+            record_written(course_dir, filepath)
+
+        context.add(section, prompt, content)
+        events.put(('done', index, None))
+
+    def run_unit(unit):
+        context = strategy.new_context()
+        try:
+            for index, section in unit:
+                if stop_event.is_set():
+                    break
+                if control:
+                    control.checkpoint()
+
+                begun = begin_section(index, section, context)
+                if begun is None:
+                    continue
+                prompt, messages = begun
+                filepath = None
+                try:
+                    if stream:
+                        content, filepath = stream_section(section.title, prompt, messages)
+                    else:
+                        content = chat_with_moonshot(client=client, prompt=prompt, history=messages, window=window,
+                                                     course=course, system=system)
+                except Exception as e:
+                    manifest.mark_failed(section.title, str(e))
+                    raise
+                finish_section(index, section, context, prompt, content, filepath)
+        except Exception as e:
+            stop_event.set()
+            events.put(('error', None, e))
+        finally:
+            saved_tokens.append(context.tokens_saved)
+            events.put(('end', None, None))
+
+    async def run_unit_async(unit, slots):
+        async with slots:
+            context = strategy.new_context()
+            try:
+                for index, section in unit:
+                    if stop_event.is_set():
+                        break
+                    if control:
+                        await control.checkpoint_async()
+
+                    # 生成清单和小节文件的读写放到线程池中，不阻塞事件循环
+                    begun = await asyncio.to_thread(begin_section, index, section, context)
+                    if begun is None:
+                        continue
+                    prompt, messages = begun
+                    try:
+                        content = await achat_with_moonshot(client=client, prompt=prompt, history=messages,
+                                                            window=window, course=course, system=system)
+                    except Exception as e:
+                        await asyncio.to_thread(manifest.mark_failed, section.title, str(e))
+                        raise
+                    await asyncio.to_thread(finish_section, index, section, context, prompt, content)
+            except Exception as e:
+                stop_event.set()
+                events.put(('error', None, e))
+            finally:
+                saved_tokens.append(context.tokens_saved)
+                events.put(('end', None, None))
+
+    async def run_units_async():
+        slots = asyncio.Semaphore(workers)
+        await asyncio.gather(*(run_unit_async(unit, slots) for unit in units))
+
+    total = len(sections)
+    finished = set()
+    next_index = 0
+    first_error = None
+
+    def wait_for_units():
+        nonlocal next_index, first_error
+        remaining = len(units)
+        while remaining:
+            kind, index, error = events.get()
+            if kind == 'end':
+                remaining -= 1
+            elif kind == 'error':
+                if first_error is None:
+                    first_error = error
+            else:
+                finished.add(index)
+                # 按大纲顺序上报进度
+                while next_index in finished:
+                    finished.discard(next_index)
+                    next_index += 1
+                    if progress:
+                        progress(next_index, total, sections[next_index - 1].title)
+
+    try:
+        if use_async:
+            done = client.submit(run_units_async())
+            wait_for_units()
+            done.result()
+        else:
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='section') as pool:
+                for unit in units:
+                    pool.submit(run_unit, unit)
+                wait_for_units()
+    finally:
+        # 等后台写文件完成，清单和统计报告才是最终状态
+        wait(pending_writes)
+        if sum(saved_tokens):
+            if window:
+                window.log_message(f"历史记录按token预算精简，少发送约{sum(saved_tokens)}个输入token")
+            if CONFIG['METRICS_ENABLED']:
+                get_metrics().record_tokens_saved(course, sum(saved_tokens))
+        write_metrics_report(course_dir, window)
+
+    if first_error is not None:
+        raise first_error
+    failed_writes = [future for future in pending_writes if future.exception() is not None]
+    if failed_writes:
+        raise OSError(f"{len(failed_writes)}个小节保存失败，重新运行即可补全: {str(failed_writes[0].exception())}")
+
+
+def generate_course(client, title, student, chapter, section, course_dir, window=None,
+                    control=None, regenerate_outline=False, **options) -> str:
+    """
+    生成整门课程：先生成课程大纲，再生成各小节内容
+
+    课程目录中已有大纲时直接复用（除非 regenerate_outline），便于中断后续跑。
+    options 原样传给 generate_sections（workers、stream、resume 等）。
+
+    Returns:
+        str: 课程目录
+    """
+    outline_path = os.path.join(course_dir, OUTLINE_FILENAME)
+    if regenerate_outline or not os.path.exists(outline_path):
+        generate_outline(client, title, student, chapter, section, course_dir, window=window, control=control)
+    elif window:
+        window.log_message(f"使用已有的课程大纲: {outline_path}")
+
+    course = load_course(course_dir, title, student)
+    if window:
+        window.log_message(f"共{len(course.chapters)}章{len(course.sections)}节")
+    generate_sections(client, course.sections, course_dir, window=window, control=control, **options)
+    return course_dir
@@ -0,0 +1,65 @@
+import logging
+import traceback
+
+from PyQt6.QtCore import QObject, QThread, pyqtSignal
+
+from generation_engine import GenerationCancelled, JobControl
+
+
+class GenerationWorker(QObject):
+    """
+    在后台线程中执行生成任务
+
+    任务函数以 worker 作为唯一参数，可以把 worker 当作 window 传给
+    chat_with_moonshot 等函数：worker.log_message 会把日志通过信号转发到界面线程。
+    """
+
+    log = pyqtSignal(str)
+    progress = pyqtSignal(int)
+    result = pyqtSignal(str)
+    failed = pyqtSignal(str)
+    cancelled = pyqtSignal()
+    finished = pyqtSignal()
+
+    def __init__(self, task, control=None):
+        super().__init__()
+        self.task = task
+        self.control = control or JobControl()
+
+    def log_message(self, message):
+        """线程安全的日志输出"""
+        self.log.emit(str(message))
+
+    def report_progress(self, value):
+        """线程安全的进度输出"""
+        self.progress.emit(max(0, min(100, int(value))))
+
+    def run(self):
+        try:
+            result = self.task(self)
+            self.result.emit(result or '')
+        except GenerationCancelled:
+            self.cancelled.emit()
+        except Exception as e:
+            logging.error(f"Error: {str(e)}", exc_info=True)
+            self.log.emit(traceback.format_exc())
+            self.failed.emit(str(e))
+        finally:
+            self.finished.emit()
+
+
+def create_worker(parent, task, control=None):
+    """
+    创建后台线程和任务对象，连接好信号后调用 thread.start() 启动
+
+    Returns:
+        tuple: (QThread, GenerationWorker)，调用方需持有引用直到 finished
+    """
+    thread = QThread(parent)
+    worker = GenerationWorker(task, control)
+    worker.moveToThread(thread)
+    thread.started.connect(worker.run)
+    worker.finished.connect(thread.quit)
+    worker.finished.connect(worker.deleteLater)
+    thread.finished.connect(thread.deleteLater)
+    return thread, worker
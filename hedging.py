@@ -0,0 +1,255 @@
+import time
+import asyncio
+import threading
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, TimeoutError as FutureTimeout, wait
+from typing import Any, Callable, Optional, Tuple
+
+from config import CONFIG
+from metrics import percentile
+
+# 对冲结果：哪一个请求的响应被采用，未发出对冲请求时为 None
+PRIMARY = 'primary'
+HEDGE = 'hedge'
+
+
+class HedgeCancelled(Exception):
+    """另一个请求已先返回，尚未发出的请求放弃发送"""
+
+
+class HedgeSkipped(Exception):
+    """没有空闲的限流配额，不发出对冲请求"""
+
+
+class HedgedRequest:
+    """
+    对冲中的一个请求（原请求或对冲请求）
+
+    请求函数在取得限流配额、真正发出请求前调用 mark_sent：对冲计时从原请求发出时开始，
+    在线程池中排队和等待限流的时间不算作服务端耗时；另一个请求已经先返回时 mark_sent
+    抛出 HedgeCancelled，放弃发送并释放配额。
+    """
+
+    __slots__ = ('is_hedge', 'sent_at', 'sent', '_cancelled')
+
+    def __init__(self, is_hedge: bool = False, event_factory: Callable[[], Any] = threading.Event):
+        self.is_hedge = is_hedge
+        self.sent_at: Optional[float] = None
+        self.sent = event_factory()
+        self._cancelled = False
+
+    def mark_sent(self) -> None:
+        if self._cancelled:
+            raise HedgeCancelled("另一个请求已先返回")
+        self.sent_at = time.perf_counter()
+        self.sent.set()
+
+    def cancel(self) -> None:
+        self._cancelled = True
+
+
+class HedgePolicy:
+    """
+    对冲请求策略
+
+    原请求发出后超过最近成功调用耗时的 percentile 分位数仍未返回时，再发出一个相同的请求，
+    先成功返回的被采用。对冲请求只在限流器有空闲配额时发出，不等待配额；对冲请求数不超过
+    总调用数的 budget 比例；样本不足 min_samples 时不对冲。落后的请求尚未发出时直接放弃，
+    已经发出的同步请求无法中断，只是丢弃其结果。
+    """
+
+    def __init__(self, pct: Optional[float] = None, budget: Optional[float] = None,
+                 min_samples: Optional[int] = None, window: Optional[int] = None,
+                 min_delay: Optional[float] = None):
+        self.pct = CONFIG['HEDGE_PERCENTILE'] if pct is None else pct
+        self.budget = CONFIG['HEDGE_BUDGET'] if budget is None else budget
+        self.min_samples = CONFIG['HEDGE_MIN_SAMPLES'] if min_samples is None else min_samples
+        self.min_delay = CONFIG['HEDGE_MIN_DELAY'] if min_delay is None else min_delay
+        self.latencies = deque(maxlen=CONFIG['HEDGE_WINDOW'] if window is None else window)
+        self.calls = 0
+        self.hedges = 0
+        self._lock = threading.Lock()
+        self._executor = None
+
+    def delay(self) -> Optional[float]:
+        """原请求发出后、发出对冲请求前等待的秒数，样本不足时返回 None"""
+        with self._lock:
+            if len(self.latencies) < self.min_samples:
+                return None
+            samples = list(self.latencies)
+        return max(self.min_delay, percentile(samples, self.pct))
+
+    def record_latency(self, latency: float) -> None:
+        with self._lock:
+            self.latencies.append(latency)
+
+    def _record_since(self, request: HedgedRequest) -> None:
+        if request.sent_at is not None:
+            self.record_latency(time.perf_counter() - request.sent_at)
+
+    def _start_call(self) -> Optional[float]:
+        with self._lock:
+            self.calls += 1
+        return self.delay()
+
+    def _take_budget(self) -> bool:
+        """占用一次对冲配额，超出预算时返回 False"""
+        with self._lock:
+            if self.hedges + 1 > self.budget * self.calls:
+                return False
+            self.hedges += 1
+            return True
+
+    def _refund_budget(self) -> None:
+        """对冲请求最终没有发出，归还对冲配额"""
+        with self._lock:
+            self.hedges -= 1
+
+    def _pool(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                workers = max(8, (CONFIG['CONCURRENCY_MAX'] + CONFIG['MAX_WORKERS']) * 2)
+                self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='hedge')
+            return self._executor
+
+    def call(self, func: Callable[[HedgedRequest], Any],
+             on_saved: Optional[Callable[[float], None]] = None) -> Tuple[Any, Optional[str]]:
+        """
+        调用 func，必要时对冲
+
+        Args:
+            func: 发出一次请求的函数，参数为 HedgedRequest，可能在两个线程中同时调用；
+                取得限流配额后调用其 mark_sent，对冲请求（is_hedge）没有空闲配额时抛出 HedgeSkipped
+            on_saved: 对冲请求胜出、被丢弃的原请求随后也完成时调用，参数为节省的秒数
+
+        Returns:
+            tuple: (结果, PRIMARY / HEDGE / None)
+        """
+        delay = self._start_call()
+        if delay is None:
+            request = HedgedRequest()
+            result = func(request)
+            self._record_since(request)
+            return result, None
+
+        pool = self._pool()
+        first = HedgedRequest()
+        primary = pool.submit(func, first)
+        primary.add_done_callback(lambda _: first.sent.set())
+        first.sent.wait()
+        sent_at = first.sent_at or time.perf_counter()
+        try:
+            result = primary.result(timeout=max(0.0, delay - (time.perf_counter() - sent_at)))
+            self._record_since(first)
+            return result, None
+        except FutureTimeout:
+            pass
+        if not self._take_budget():
+            result = primary.result()
+            self._record_since(first)
+            return result, None
+
+        second = HedgedRequest(is_hedge=True)
+        requests = {primary: first, pool.submit(func, second): second}
+        pending = {future: (PRIMARY if request is first else HEDGE) for future, request in requests.items()}
+        first_error = None
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = pending.pop(future)
+                try:
+                    result = future.result()
+                except HedgeSkipped:
+                    self._refund_budget()
+                    continue
+                except Exception as e:
+                    first_error = first_error or e
+                    continue
+                latency = time.perf_counter() - sent_at
+                self.record_latency(latency)
+                for loser in pending:
+                    requests[loser].cancel()
+                    if not loser.cancel() and on_saved and name == HEDGE:
+                        loser.add_done_callback(_saved_callback(sent_at, latency, on_saved))
+                return result, (name if second.sent_at is not None else None)
+        raise first_error
+
+    async def call_async(self, factory: Callable[[HedgedRequest], Any],
+                         on_saved: Optional[Callable[[float], None]] = None) -> Tuple[Any, Optional[str]]:
+        """
+        call 的协程版本，factory 每次调用返回一个新的请求协程
+
+        原请求先返回时对冲请求被真正取消；对冲请求先返回且传入 on_saved 时，与同步版本一样
+        让原请求继续完成，用于统计少等待的秒数，否则原请求也被取消。
+        """
+        delay = self._start_call()
+        if delay is None:
+            request = HedgedRequest(event_factory=asyncio.Event)
+            result = await factory(request)
+            self._record_since(request)
+            return result, None
+
+        first = HedgedRequest(event_factory=asyncio.Event)
+        primary = asyncio.ensure_future(factory(first))
+        pending = {primary: PRIMARY}
+        requests = {primary: first}
+        second = None
+        try:
+            sent = asyncio.ensure_future(first.sent.wait())
+            await asyncio.wait({primary, sent}, return_when=asyncio.FIRST_COMPLETED)
+            sent.cancel()
+            sent_at = first.sent_at or time.perf_counter()
+            remaining = max(0.0, delay - (time.perf_counter() - sent_at))
+            done, _ = await asyncio.wait({primary}, timeout=remaining)
+            if not done and self._take_budget():
+                second = HedgedRequest(is_hedge=True, event_factory=asyncio.Event)
+                task = asyncio.ensure_future(factory(second))
+                pending[task] = HEDGE
+                requests[task] = second
+            first_error = None
+            while pending:
+                done, _ = await asyncio.wait(set(pending), return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    name = pending.pop(task)
+                    error = task.exception()
+                    if isinstance(error, HedgeSkipped):
+                        self._refund_budget()
+                        continue
+                    if error is not None:
+                        first_error = first_error or error
+                        continue
+                    latency = time.perf_counter() - sent_at
+                    self.record_latency(latency)
+                    for loser in pending:
+                        requests[loser].cancel()
+                    if name == HEDGE and on_saved:
+                        for loser in pending:
+                            loser.add_done_callback(_saved_callback(sent_at, latency, on_saved))
+                        pending.clear()
+                    hedged = second is not None and second.sent_at is not None
+                    return task.result(), (name if hedged else None)
+            raise first_error
+        finally:
+            for task in pending:
+                task.cancel()
+
+
+def _saved_callback(started_at: float, winner_latency: float, on_saved: Callable[[float], None]):
+    def callback(future):
+        if not future.cancelled() and future.exception() is None:
+            on_saved(time.perf_counter() - started_at - winner_latency)
+    return callback
+
+
+_policy = None
+_policy_lock = threading.Lock()
+
+def get_hedge_policy() -> Optional[HedgePolicy]:
+    """全局对冲策略，未开启 HEDGE_ENABLED 时返回 None"""
+    global _policy
+    if not CONFIG['HEDGE_ENABLED']:
+        return None
+    with _policy_lock:
+        if _policy is None:
+            _policy = HedgePolicy()
+        return _policy
@@ -0,0 +1,237 @@
+"""
+基于 httpx 的对话接口客户端
+
+与智谱 SDK 的 client.chat.completions.create 用法一致，可直接替换 create_client 返回的客户端，
+但连接池大小、keep-alive、HTTP/2 和连接/读取超时都可以通过配置控制；单次请求的超时
+可以用 create(timeout=request_timeout(...)) 另行指定。
+适用于智谱 v4 接口及其他 OpenAI 兼容的接口（包括本地模拟服务）。
+
+HttpChatClient 为同步客户端，供线程池使用；AsyncHttpChatClient 的 create 是协程，
+所有请求在一个后台事件循环线程中复用同一个连接池，生成引擎可以用一个线程同时发出上百个请求。
+"""
+import json
+import asyncio
+import threading
+from types import SimpleNamespace
+from typing import Any, AsyncIterator, Dict, Iterator, Optional, Tuple, Union
+
+from config import CONFIG
+
+
+class APIStatusError(Exception):
+    """接口返回非 2xx 状态码，status_code 和 response 供重试策略判断"""
+
+    def __init__(self, message: str, status_code: int, response=None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.response = response
+
+
+class RateLimitError(APIStatusError):
+    """接口限流（429）"""
+
+
+def http2_available() -> bool:
+    """是否安装了 HTTP/2 支持（h2 包）"""
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def to_object(value: Any) -> Any:
+    """把响应 JSON 转为可按属性访问的对象，与 SDK 返回的对象用法一致"""
+    if isinstance(value, dict):
+        return SimpleNamespace(**{key: to_object(item) for key, item in value.items()})
+    if isinstance(value, list):
+        return [to_object(item) for item in value]
+    return value
+
+
+def request_timeout(value: Union[float, Tuple[float, float]]):
+    """
+    单次请求的超时
+
+    Args:
+        value: 数字为读取超时；(连接超时, 读取超时) 元组分别指定
+
+    Returns:
+        httpx.Timeout，可传给 SDK 和本模块客户端的 create(timeout=...)
+    """
+    import httpx
+    connect, read = value if isinstance(value, (tuple, list)) else (CONFIG['HTTP_CONNECT_TIMEOUT'], value)
+    return httpx.Timeout(connect=connect, read=read, write=connect, pool=None)
+
+
+def default_timeout() -> Tuple[float, float]:
+    """客户端默认的 (连接超时, 读取超时)，调用方限制单次请求的超时时以此为上限"""
+    return CONFIG['HTTP_CONNECT_TIMEOUT'], CONFIG['HTTP_READ_TIMEOUT']
+
+
+def _timeout_option(params: Dict) -> Dict:
+    """取出请求参数中的 timeout（数字、httpx 的四元组或 httpx.Timeout），未指定时使用客户端的默认超时"""
+    timeout = params.pop('timeout', None)
+    return {'timeout': timeout} if timeout is not None else {}
+
+
+def _client_options(api_key: str, base_url: str) -> Dict:
+    import httpx
+    return dict(
+        base_url=base_url.rstrip('/'),
+        headers={'Authorization': f'Bearer {api_key}'},
+        limits=httpx.Limits(
+            max_connections=CONFIG['HTTP_MAX_CONNECTIONS'],
+            max_keepalive_connections=CONFIG['HTTP_MAX_KEEPALIVE'],
+            keepalive_expiry=CONFIG['HTTP_KEEPALIVE_EXPIRY']
+        ),
+        timeout=httpx.Timeout(
+            connect=CONFIG['HTTP_CONNECT_TIMEOUT'],
+            read=CONFIG['HTTP_READ_TIMEOUT'],
+            write=CONFIG['HTTP_CONNECT_TIMEOUT'],
+            pool=None
+        ),
+        http2=CONFIG['HTTP2'] and http2_available()
+    )
+
+
+def _raise_for_status(response) -> None:
+    if response.status_code < 400:
+        return
+    text = response.text
+    try:
+        message = json.loads(text).get('error', {}).get('message') or text
+    except (ValueError, AttributeError):
+        message = text
+    error = RateLimitError if response.status_code == 429 else APIStatusError
+    raise error(f"Error code: {response.status_code}, {message}", response.status_code, response)
+
+
+def _sse_payload(line: str) -> Optional[Dict]:
+    """解析一行 SSE 数据，非数据行和结束标记返回 None"""
+    if not line.startswith('data:'):
+        return None
+    data = line[5:].strip()
+    if not data or data == '[DONE]':
+        return None
+    return json.loads(data)
+
+
+class _Completions:
+    def __init__(self, client: 'HttpChatClient'):
+        self._client = client
+
+    def create(self, **params):
+        http = self._client.http
+        options = _timeout_option(params)
+        if not params.get('stream'):
+            response = http.post('/chat/completions', json=params, **options)
+            _raise_for_status(response)
+            return to_object(response.json())
+        return self._stream(http, params, options)
+
+    def _stream(self, http, params, options) -> Iterator:
+        with http.stream('POST', '/chat/completions', json=params, **options) as response:
+            if response.status_code >= 400:
+                response.read()
+            _raise_for_status(response)
+            for line in response.iter_lines():
+                payload = _sse_payload(line)
+                if payload is not None:
+                    yield to_object(payload)
+
+
+class _AsyncCompletions:
+    def __init__(self, client: 'AsyncHttpChatClient'):
+        self._client = client
+
+    async def create(self, **params):
+        http = self._client.http
+        options = _timeout_option(params)
+        if not params.get('stream'):
+            response = await http.post('/chat/completions', json=params, **options)
+            _raise_for_status(response)
+            return to_object(response.json())
+        return self._stream(http, params, options)
+
+    async def _stream(self, http, params, options) -> AsyncIterator:
+        async with http.stream('POST', '/chat/completions', json=params, **options) as response:
+            if response.status_code >= 400:
+                await response.aread()
+            _raise_for_status(response)
+            async for line in response.aiter_lines():
+                payload = _sse_payload(line)
+                if payload is not None:
+                    yield to_object(payload)
+
+
+class HttpChatClient:
+    """同步客户端，所有线程共享一个连接池"""
+
+    is_async = False
+
+    def __init__(self, api_key: str, base_url: str):
+        import httpx
+        self.http = httpx.Client(**_client_options(api_key, base_url))
+        self.chat = SimpleNamespace(completions=_Completions(self))
+
+    def close(self) -> None:
+        self.http.close()
+
+    @property
+    def default_timeout(self) -> Tuple[float, float]:
+        return default_timeout()
+
+
+class AsyncHttpChatClient:
+    """
+    异步客户端
+
+    chat.completions.create 是协程，必须在 loop 上运行：在协程中直接 await，
+    在普通线程中用 submit / run 提交。事件循环线程在第一次使用时启动。
+    """
+
+    is_async = True
+
+    def __init__(self, api_key: str, base_url: str):
+        self._options = (api_key, base_url)
+        self._lock = threading.Lock()
+        self._thread = None
+        self.loop = None
+        self.http = None
+        self.chat = SimpleNamespace(completions=_AsyncCompletions(self))
+
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self.loop is None:
+                import httpx
+                self.loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(target=self.loop.run_forever, name='http-client', daemon=True)
+                self._thread.start()
+
+                async def open_client():
+                    return httpx.AsyncClient(**_client_options(*self._options))
+                self.http = asyncio.run_coroutine_threadsafe(open_client(), self.loop).result()
+            return self.loop
+
+    def submit(self, coro):
+        """把协程提交到客户端的事件循环，返回 concurrent.futures.Future"""
+        return asyncio.run_coroutine_threadsafe(coro, self._ensure_loop())
+
+    def run(self, coro):
+        """在普通线程中运行协程并等待结果（不能在客户端自己的事件循环中调用）"""
+        return self.submit(coro).result()
+
+    def close(self) -> None:
+        with self._lock:
+            if self.loop is None:
+                return
+            asyncio.run_coroutine_threadsafe(self.http.aclose(), self.loop).result()
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self._thread.join()
+            self.loop.close()
+            self.loop = self.http = self._thread = None
+
+    @property
+    def default_timeout(self) -> Tuple[float, float]:
+        return default_timeout()
@@ -0,0 +1,358 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from config import CONFIG
+from course_files import OUTLINE_FILENAME, create_course_directory
+from course_manifest import CourseManifest
+from course_model import load_course
+from generation_engine import (JobControl, GenerationCancelled, build_work_units,
+                               generate_outline, generate_sections)
+
+# 任务/作业状态
+PENDING = 'pending'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+# 任务类型：outline 生成大纲，unit 生成一个任务单元（一章或一节，取决于上下文策略）
+KIND_OUTLINE = 'outline'
+KIND_UNIT = 'unit'
+
+
+class JobQueue:
+    """
+    基于 SQLite 的持久化课程作业队列
+
+    每门课程是一个作业（job），作业拆分为一个大纲任务和若干小节任务（task）。
+    程序中断后重新打开队列，未完成的任务会被放回待执行状态。
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    title TEXT NOT NULL,
+                    users TEXT NOT NULL,
+                    chapters INTEGER NOT NULL,
+                    sections INTEGER NOT NULL,
+                    priority INTEGER NOT NULL DEFAULT 0,
+                    base_dir TEXT,
+                    course_dir TEXT,
+                    status TEXT NOT NULL,
+                    error TEXT,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS tasks (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    job_id INTEGER NOT NULL REFERENCES jobs(id),
+                    kind TEXT NOT NULL,
+                    payload TEXT,
+                    status TEXT NOT NULL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    error TEXT,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS idx_tasks_status ON tasks (status, job_id);
+            """)
+            self._conn.commit()
+
+    def enqueue(self, title: str, users: str, chapters: int, sections: int,
+                priority: int = 0, base_dir: Optional[str] = None) -> int:
+        """
+        添加一门课程
+
+        Returns:
+            int: 作业 ID
+        """
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT INTO jobs (title, users, chapters, sections, priority, base_dir, status, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (title, users, int(chapters), int(sections), int(priority), base_dir, PENDING, now, now)
+            )
+            job_id = cursor.lastrowid
+            self._insert_task(job_id, KIND_OUTLINE, None, now)
+            self._conn.commit()
+        return job_id
+
+    def find_job(self, title: str, base_dir: Optional[str] = None) -> Optional[Dict]:
+        """
+        查找同一输出目录下同名课程的作业（任何状态），用于避免重复加入队列
+
+        失败的作业会在下次运行时由 recover 重新排队，因此也算已存在
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT * FROM jobs WHERE title = ? AND base_dir IS ? ORDER BY id DESC LIMIT 1", (title, base_dir)
+            ).fetchone()
+        return dict(row) if row else None
+
+    def _insert_task(self, job_id: int, kind: str, payload, now: float) -> None:
+        self._conn.execute(
+            "INSERT INTO tasks (job_id, kind, payload, status, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?)",
+            (job_id, kind, json.dumps(payload, ensure_ascii=False) if payload is not None else None, PENDING, now, now)
+        )
+
+    def recover(self, retry_failed: bool = True) -> int:
+        """
+        把上次中断时处于执行中的任务放回待执行状态
+
+        Args:
+            retry_failed: 同时把失败的任务放回待执行状态并清零尝试次数
+
+        Returns:
+            int: 放回待执行状态的任务数
+        """
+        statuses = (RUNNING, FAILED) if retry_failed else (RUNNING,)
+        marks = ', '.join('?' * len(statuses))
+        with self._lock:
+            cursor = self._conn.execute(
+                f"UPDATE tasks SET status = ?, attempts = 0, updated_at = ? WHERE status IN ({marks})",
+                (PENDING, time.time(), *statuses)
+            )
+            self._conn.execute(
+                f"UPDATE jobs SET status = ?, error = NULL WHERE status IN ({marks})", (PENDING, *statuses)
+            )
+            self._conn.commit()
+            return cursor.rowcount
+
+    def claim_next(self) -> Optional[Dict]:
+        """
+        领取下一个待执行任务
+
+        先按作业优先级排序；同优先级下优先选择当前执行中任务最少的作业（公平分配），
+        最后按任务创建顺序。
+        """
+        with self._lock:
+            row = self._conn.execute("""
+                SELECT t.*, j.title, j.users, j.chapters, j.sections, j.base_dir, j.course_dir
+                FROM tasks t JOIN jobs j ON j.id = t.job_id
+                WHERE t.status = ?
+                ORDER BY j.priority DESC,
+                         (SELECT COUNT(*) FROM tasks r WHERE r.job_id = t.job_id AND r.status = ?) ASC,
+                         t.id ASC
+                LIMIT 1
+            """, (PENDING, RUNNING)).fetchone()
+            if row is None:
+                return None
+            now = time.time()
+            self._conn.execute(
+                "UPDATE tasks SET status = ?, attempts = attempts + 1, updated_at = ? WHERE id = ?",
+                (RUNNING, now, row['id'])
+            )
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, updated_at = ? WHERE id = ? AND status = ?",
+                (RUNNING, now, row['job_id'], PENDING)
+            )
+            self._conn.commit()
+            task = dict(row)
+            task['attempts'] += 1
+            task['payload'] = json.loads(task['payload']) if task['payload'] else None
+            return task
+
+    def set_course_dir(self, job_id: int, course_dir: str) -> None:
+        with self._lock:
+            self._conn.execute("UPDATE jobs SET course_dir = ? WHERE id = ?", (course_dir, job_id))
+            self._conn.commit()
+
+    def finish_task(self, task: Dict, error: Optional[str] = None, retry: bool = False,
+                    subtasks: Optional[List[Tuple[str, object]]] = None) -> None:
+        """
+        记录任务结果；retry 为 True 时放回待执行状态，否则在作业的所有任务结束后更新作业状态
+
+        Args:
+            subtasks: 任务成功后拆分出的 (类型, 参数) 列表，与任务完成状态在同一事务中写入，
+                中途崩溃时要么都没有写入（重新执行本任务），要么都已写入，不会重复插入
+        """
+        if error is None:
+            status = DONE
+        else:
+            status = PENDING if retry else FAILED
+        now = time.time()
+        with self._lock:
+            if error is None:
+                for kind, payload in subtasks or []:
+                    self._insert_task(task['job_id'], kind, payload, now)
+            self._conn.execute(
+                "UPDATE tasks SET status = ?, error = ?, updated_at = ? WHERE id = ?",
+                (status, error, now, task['id'])
+            )
+            self._update_job_status(task['job_id'])
+            self._conn.commit()
+
+    def _update_job_status(self, job_id: int) -> None:
+        counts = dict(self._conn.execute(
+            "SELECT status, COUNT(*) FROM tasks WHERE job_id = ? GROUP BY status", (job_id,)
+        ).fetchall())
+        if counts.get(PENDING) or counts.get(RUNNING):
+            return
+        if counts.get(FAILED):
+            error = self._conn.execute(
+                "SELECT error FROM tasks WHERE job_id = ? AND status = ? ORDER BY id LIMIT 1", (job_id, FAILED)
+            ).fetchone()[0]
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, updated_at = ? WHERE id = ?",
+                (FAILED, error, time.time(), job_id)
+            )
+        else:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, error = NULL, updated_at = ? WHERE id = ?", (DONE, time.time(), job_id)
+            )
+
+    def has_unfinished(self) -> bool:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT COUNT(*) FROM tasks WHERE status IN (?, ?)", (PENDING, RUNNING)
+            ).fetchone()
+            return row[0] > 0
+
+    def jobs(self) -> List[Dict]:
+        with self._lock:
+            return [dict(row) for row in self._conn.execute("SELECT * FROM jobs ORDER BY id")]
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class JobScheduler:
+    """
+    作业调度器
+
+    用一组工作线程从队列中领取任务：大纲任务完成后，按历史记录范围把课程
+    拆分为若干小节任务放回队列，由所有课程共享同一组工作线程和同一个限流器。
+    """
+
+    def __init__(self, queue: JobQueue, client, workers: Optional[int] = None,
+                 window=None, stream: Optional[bool] = None, resume: bool = True,
+                 max_task_attempts: int = 2):
+        self.queue = queue
+        self.client = client
+        self.workers = max(1, int(workers or CONFIG['MAX_WORKERS']))
+        self.window = window
+        self.stream = stream
+        self.resume = resume
+        self.max_task_attempts = max_task_attempts
+        self.control = JobControl()
+        self._cond = threading.Condition()
+        self._manifests = {}
+        self._manifest_lock = threading.Lock()
+
+    def log_message(self, message):
+        if self.window:
+            self.window.log_message(message)
+
+    def _manifest(self, course_dir: str) -> CourseManifest:
+        """同一课程的所有任务共用一个生成清单实例"""
+        with self._manifest_lock:
+            if course_dir not in self._manifests:
+                self._manifests[course_dir] = CourseManifest(course_dir)
+            return self._manifests[course_dir]
+
+    def _course_dir(self, task: Dict) -> str:
+        course_dir = task['course_dir']
+        if not course_dir:
+            course_dir = create_course_directory(task['title'], task['base_dir'])
+            self.queue.set_course_dir(task['job_id'], course_dir)
+        return course_dir
+
+    def _run_outline(self, task: Dict) -> List[Tuple[str, List[int]]]:
+        """生成（或读取已有的）大纲，返回拆分出的任务单元，由调用方在完成大纲任务时一并写入队列"""
+        course_dir = self._course_dir(task)
+        outline_path = os.path.join(course_dir, OUTLINE_FILENAME)
+        if not os.path.exists(outline_path):
+            generate_outline(self.client, task['title'], task['users'], task['chapters'], task['sections'],
+                             course_dir, window=self.window, control=self.control)
+
+        sections = load_course(course_dir, task['title'], task['users']).sections
+        if not sections:
+            raise ValueError("课程大纲中没有找到小节")
+        units = build_work_units(sections, CONFIG['CONTEXT_STRATEGY'])
+        return [(KIND_UNIT, [section.index for _, section in unit]) for unit in units]
+
+    def _run_unit(self, task: Dict) -> None:
+        course_dir = self._course_dir(task)
+        sections = load_course(course_dir, task['title'], task['users']).sections
+        subset = [sections[index] for index in task['payload'] if index < len(sections)]
+        # 一个任务单元内按顺序生成（同一章共享上下文），并发由调度器的工作线程提供
+        generate_sections(
+            self.client, subset, course_dir,
+            window=self.window, workers=1, control=self.control,
+            stream=self.stream, resume=self.resume, manifest=self._manifest(course_dir)
+        )
+
+    def _worker(self) -> None:
+        while True:
+            try:
+                self.control.checkpoint()
+            except GenerationCancelled:
+                return
+            task = self.queue.claim_next()
+            if task is None:
+                with self._cond:
+                    if not self.queue.has_unfinished():
+                        self._cond.notify_all()
+                        return
+                    # 还有任务在执行，可能会产生新任务，等待后再领取
+                    self._cond.wait(1.0)
+                continue
+
+            try:
+                if task['kind'] == KIND_OUTLINE:
+                    units = self._run_outline(task)
+                    self.queue.finish_task(task, subtasks=units)
+                    self.log_message(f"[{task['title']}] 大纲已拆分为{len(units)}个任务")
+                else:
+                    self._run_unit(task)
+                    self.queue.finish_task(task)
+            except GenerationCancelled:
+                self.queue.finish_task(task, "任务已取消", retry=True)
+                return
+            except Exception as e:
+                retry = task['attempts'] < self.max_task_attempts
+                self.queue.finish_task(task, str(e), retry=retry)
+                self.log_message(f"[{task['title']}] 任务失败{'，稍后重试' if retry else ''}: {str(e)}")
+            finally:
+                with self._cond:
+                    self._cond.notify_all()
+
+    def run(self) -> List[Dict]:
+        """
+        执行队列中的所有任务，直到队列为空或被取消
+
+        Returns:
+            list: 所有作业的最终状态
+        """
+        recovered = self.queue.recover()
+        if recovered:
+            self.log_message(f"重新排队{recovered}个中断或失败的任务")
+
+        threads = [threading.Thread(target=self._worker, name=f'job-worker-{i}', daemon=True)
+                   for i in range(self.workers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return self.queue.jobs()
+
+    def cancel(self) -> None:
+        self.control.cancel()
+        with self._cond:
+            self._cond.notify_all()
@@ -1,32 +1,25 @@
 # 导入必要的库
 import sys
 import os
-import re
-import platform
 import logging
+from collections import deque
 from functools import lru_cache
-from dotenv import load_dotenv
 from PyQt6.QtWidgets import (QApplication, QWidget, QVBoxLayout, QHBoxLayout, 
-                             QLineEdit, QPushButton, QLabel, QTextEdit, QProgressBar, QMessageBox, QMainWindow, QDialog, QGridLayout, QFrame)
+                             QLineEdit, QPushButton, QLabel, QPlainTextEdit, QProgressBar, QMessageBox, QMainWindow, QDialog, QGridLayout, QFrame, QCheckBox)
 from PyQt6.QtGui import QIntValidator, QDesktopServices
 from PyQt6.QtCore import Qt, QUrl, QTimer
-from zhipuai import ZhipuAI
 from config import CONFIG, VERSION
-from prompt_functions import generate_course_outline, generate_section_content
-from api_client import chat_with_moonshot
+from api_client import chat_with_moonshot, create_client
+from course_files import create_course_directory, sanitize_filename
+from generation_engine import generate_outline, generate_sections
+from course_model import load_course
+from generation_worker import create_worker
+from app_logging import setup_logging, get_logger
 from login_window import LoginWindow
 import time
 
-# 初始化客户端
+# API 客户端在主窗口显示后由后台线程创建，避免 zhipuai 及其 HTTP 依赖拖慢启动
 client = None
-if CONFIG['ZHIPU_API_KEY']:
-    try:
-        client = ZhipuAI(api_key=CONFIG['ZHIPU_API_KEY'])
-        print("API 客户端初始化成功")
-    except Exception as e:
-        print(f"初始化智谱 API 客户端失败: {str(e)}")
-else:
-    print("API key 获取失败")
 
 def get_root_dir():
     """获取程序根目录"""
@@ -35,36 +28,6 @@ def get_root_dir():
     else:
         return os.path.dirname(os.path.abspath(__file__))
 
-def ensure_temp_directory():
-    """确保临时目录存在"""
-    dir_path = "优课工坊"
-    if platform.system() == "Windows":
-        temp_dir = 'D:\\' + dir_path
-    else:  # macOS or Linux
-        temp_dir = os.path.expanduser('~/Desktop/' + dir_path)
-    
-    if not os.path.exists(temp_dir):
-        try:
-            os.makedirs(temp_dir)
-            print(f"创建目录成功: {temp_dir}")
-        except Exception as e:
-            print(f"创建目录失败: {temp_dir}. 错误: {str(e)}")
-    return temp_dir
-
-def create_course_directory(title):
-    """创建课程目录"""
-    base_dir = ensure_temp_directory()
-    course_dir = os.path.join(base_dir, sanitize_filename(title))
-    if not os.path.exists(course_dir):
-        os.makedirs(course_dir)
-    return course_dir
-
-@lru_cache(maxsize=128)
-def sanitize_filename(filename):
-    """清理文件名"""
-    sanitized = re.sub(r'[\\/*?:"<>|]', '', filename)
-    return sanitized.replace(' ', '_')
-
 @lru_cache(maxsize=32)
 def get_formatted_title(title):
     """缓存常用的标题格式化结果"""
@@ -86,7 +49,13 @@ class MainWindow(QMainWindow):
         super().__init__()
         self.token = token
         self.chat_history = []
-        self.log_buffer = []  # 添加日志缓冲区
+        self.worker_thread = None  # 当前后台线程
+        self.worker = None  # 当前后台任务
+        self.client_thread = None  # 初始化API客户端的后台线程
+        self.client_loader = None
+        self.close_requested = False  # 关闭窗口时等待后台任务结束后再关闭
+        self.log_buffer = deque(maxlen=CONFIG['LOG_BUFFER_SIZE'])  # 添加日志缓冲区
+        self.logger = get_logger()
         self.log_timer = QTimer()  # 添加定时器
         self.log_timer.timeout.connect(self.flush_log_buffer)
         self.log_timer.start(1000)  # 每秒更新一次日志
@@ -94,16 +63,41 @@ class MainWindow(QMainWindow):
         self._setup_api_client()
         
     def _setup_api_client(self):
-        """初始化API客户端"""
-        global client
-        if client is not None:
-            print("API 密钥加载成功")
-            self.submit_button.setEnabled(True)
-            self.execute_button.setEnabled(True)
-        else:
-            print("API 客户端未初始化，请检查配置")
-            self.submit_button.setEnabled(False)
-            self.execute_button.setEnabled(False)
+        """在窗口显示后，于后台线程中加载 zhipuai 并初始化API客户端"""
+        self.submit_button.setEnabled(False)
+        self.execute_button.setEnabled(False)
+
+        def load_client(worker):
+            global client
+            setup_logging()
+            # 不传参数，配置了多个接口时得到负载均衡的接口池
+            client = create_client()
+            if client is None:
+                raise Exception("API key 获取失败")
+            from provider_pool import ProviderPool
+            if isinstance(client, ProviderPool):
+                client.window = self
+                return f"API 客户端初始化成功（{len(client.providers)}个接口）"
+            return "API 客户端初始化成功"
+
+        self.client_thread, self.client_loader = create_worker(self, load_client)
+        self.client_loader.result.connect(self._on_client_ready)
+        self.client_loader.failed.connect(
+            lambda error: self.log_message(f"API 客户端未初始化，请检查配置: {error}")
+        )
+        self.client_loader.finished.connect(self._on_client_loader_finished)
+        # 等事件循环开始后再启动，保证窗口先完成首次绘制
+        QTimer.singleShot(0, self.client_thread.start)
+
+    def _on_client_ready(self, message):
+        """API客户端初始化完成"""
+        print(message)
+        if self.worker_thread is None:
+            self.set_running(False)
+
+    def _on_client_loader_finished(self):
+        self.client_thread = None
+        self.client_loader = None
 
     def initUI(self):
         """初始化主界面"""
@@ -196,11 +190,18 @@ class MainWindow(QMainWindow):
         chapter_layout.addWidget(self.chapter_input)
         chapter_layout.addWidget(section_label)
         chapter_layout.addWidget(self.section_input)
+
+        self.resume_checkbox = QCheckBox('断点续传', self)
+        self.resume_checkbox.setChecked(CONFIG['RESUME'])
+        self.resume_checkbox.setToolTip('跳过已生成的小节，只重新生成失败或缺失的小节')
+        chapter_layout.addWidget(self.resume_checkbox)
         main_layout.addLayout(chapter_layout)
         
         # 创建日志显示区域
-        self.log_display = QTextEdit(self)
+        self.log_display = QPlainTextEdit(self)
         self.log_display.setReadOnly(True)
+        # 只保留最近的若干行，追加新行的开销与已有日志长度无关
+        self.log_display.setMaximumBlockCount(CONFIG['LOG_MAX_LINES'])
         self.log_display.setMinimumHeight(200)
         main_layout.addWidget(self.log_display)
         
@@ -223,6 +224,18 @@ class MainWindow(QMainWindow):
         self.execute_button.setFixedHeight(50)
         self.execute_button.clicked.connect(self.execute_content)
         
+        self.pause_button = QPushButton('暂停', self)
+        self.pause_button.setObjectName("pauseButton")
+        self.pause_button.setFixedHeight(50)
+        self.pause_button.setEnabled(False)
+        self.pause_button.clicked.connect(self.toggle_pause)
+
+        self.cancel_button = QPushButton('取消', self)
+        self.cancel_button.setObjectName("cancelButton")
+        self.cancel_button.setFixedHeight(50)
+        self.cancel_button.setEnabled(False)
+        self.cancel_button.clicked.connect(self.cancel_task)
+
         self.open_dir_button = QPushButton('打开课程目录', self)
         self.open_dir_button.setObjectName("openDirButton")
         self.open_dir_button.setFixedHeight(50)
@@ -235,6 +248,8 @@ class MainWindow(QMainWindow):
         
         button_layout.addWidget(self.submit_button)
         button_layout.addWidget(self.execute_button)
+        button_layout.addWidget(self.pause_button)
+        button_layout.addWidget(self.cancel_button)
         button_layout.addWidget(self.open_dir_button)
         button_layout.addWidget(self.close_button)
         main_layout.addLayout(button_layout)
@@ -261,121 +276,128 @@ class MainWindow(QMainWindow):
         """生成课程大纲"""
         if not self.validate_inputs():
             return
-        
-        self.submit_button.setEnabled(False)
-        
-        try:
-            title = self.course_title.text()
-            users = self.target_users.text()
-            chapters = self.chapter_input.text()
-            sections = self.section_input.text()
-            
-            course_dir = create_course_directory(title)
-            self.log_message(f"创建课程目录: {course_dir}")
-            
-            prompt = generate_course_outline(
+
+        title = self.course_title.text()
+        users = self.target_users.text()
+        chapters = self.chapter_input.text()
+        sections = self.section_input.text()
+
+        course_dir = create_course_directory(title)
+        self.log_message(f"创建课程目录: {course_dir}")
+
+        def task(worker):
+            outline_file = generate_outline(
+                client=client,
                 title=title,
                 student=users,
                 chapter=chapters,
-                section=sections
+                section=sections,
+                course_dir=course_dir,
+                window=worker,
+                control=worker.control
             )
-            
-            history = []
-            
-            self.log_message("开始用AI设计课程大纲...")
-            content = chat_with_moonshot(client=client, prompt=prompt, history=history, window=self)
-            self.log_message("课程大纲设计完成")
-            
-            outline_file = os.path.join(course_dir, '课程大纲.txt')
-            
-            with open(outline_file, 'w', encoding='utf-8') as f:
-                f.write(content)
-            self.log_message(f'课程大纲已经保存到：{outline_file}')
-            self.log_message("--------------------------------")
-        except Exception as e:
-            self.log_message(f"生成课程大纲时发生错误: {str(e)}")
-            import traceback
-            self.log_message(traceback.format_exc())
-        finally:
-            self.submit_button.setEnabled(True)
+            worker.log_message("--------------------------------")
+            return outline_file
+
+        self.start_task(task, show_progress=False)
 
     def execute_content(self):
         """生成课程内容"""
-        try:
-            if not self.validate_inputs():
-                return
+        if not self.validate_inputs():
+            return
 
-            self.execute_button.setEnabled(False)
-            self.progress_bar.show()
+        title = self.course_title.text()
+        users = self.target_users.text()
+        course_dir = create_course_directory(title)
+        resume = self.resume_checkbox.isChecked()
+
+        def task(worker):
+            course = load_course(course_dir, title, users)
+            sections = course.sections
+            worker.log_message(f"共{len(course.chapters)}章{len(sections)}节，并发数{CONFIG['MAX_WORKERS']}，上下文策略{CONFIG['CONTEXT_STRATEGY']}")
+
+            def on_progress(done, total, section_title):
+                worker.report_progress(done / total * 100)
+
+            generate_sections(
+                client=client,
+                sections=sections,
+                course_dir=course_dir,
+                window=worker,
+                progress=on_progress,
+                control=worker.control,
+                resume=resume
+            )
+            return course_dir
+
+        self.start_task(task, show_progress=True)
+
+    def start_task(self, task, show_progress):
+        """在后台线程中执行生成任务，界面线程只负责接收日志和进度"""
+        if self.worker_thread is not None:
+            self.log_message("已有任务正在执行，请等待完成或取消")
+            return
+
+        self.set_running(True)
+        if show_progress:
             self.progress_bar.setValue(0)
+            self.progress_bar.show()
 
-            title = self.course_title.text()
-            course_dir = create_course_directory(title)
-            outline_path = os.path.join(course_dir, '课程大纲.txt')
-            
-            def content_generator():
-                with open(outline_path, 'r', encoding='utf-8') as f:
-                    for line in f:
-                        if line.startswith('## '):
-                            yield line[3:].strip()
-
-            sections = list(content_generator())
-            total_steps = len(sections)
-            
-            # 限制历史记录长度
-            history = []
-            for i, section_title in enumerate(sections):
-                current_progress = int((i + 1) / total_steps * 100)
-                self.update_progress(current_progress)
-                self.log_message(f"开始用AI设计[{section_title}]的内容...")
-                
-                # 控制历史记录长度
-                if len(history) > CONFIG['MAX_HISTORY_LENGTH']*2:
-                    history = history[-CONFIG['MAX_HISTORY_LENGTH']*2:]
-                    
-                prompt = generate_section_content(title=section_title, history=history)
-                content = chat_with_moonshot(client=client, prompt=prompt, history=history, window=self)
-                self.log_message(f"[{section_title}]的内容设计完成")
-                
-                # 更新历史记录
-                history.append({"role": "user", "content": prompt})
-                history.append({"role": "assistant", "content": content})
-                
-                # 及时保存并释放内容
-                self.save_section_content(section_title, content, course_dir)
-                content = None  # 释放内容
-                
-            # 循环结束后清理
-            history.clear()
-            sections.clear()
+        self.worker_thread, self.worker = create_worker(self, task)
+        self.worker.log.connect(self.log_message)
+        self.worker.progress.connect(self.update_progress)
+        self.worker.failed.connect(lambda error: self.log_message(f"\n错误: {error}"))
+        self.worker.cancelled.connect(lambda: self.log_message("任务已取消"))
+        self.worker.finished.connect(self.on_task_finished)
+        self.worker_thread.start()
 
-        except Exception as e:
-            self.log_message(f"\n错误: {str(e)}")
-        finally:
-            self.execute_button.setEnabled(True)
-            self.progress_bar.hide()
+    def on_task_finished(self):
+        """后台任务结束后恢复界面状态"""
+        # worker.finished 先触发 thread.quit，此时线程只剩退出事件循环，等待很快
+        self.worker_thread.wait()
+        self.worker_thread = None
+        self.worker = None
+        self.set_running(False)
+        self.progress_bar.hide()
+        if self.close_requested:
+            self.close()
 
-    def save_section_content(self, title, content, course_dir):
-        """优化文件写入"""
-        try:
-            formatted_content = f"# {title}\n\n{content}"
-            filename = f'{sanitize_filename(title)}.txt'
-            filepath = os.path.join(course_dir, filename)
-            
-            with open(filepath, 'w', encoding='utf-8', buffering=8192) as f:
-                f.write(formatted_content)
-            self.log_message(f"[{title}]已保存到: {filepath}")
-            
-        except Exception as e:
-            self.log_message(f"保存失败: {str(e)}")
-            raise
+    def set_running(self, running):
+        """切换任务执行中的按钮状态"""
+        self.submit_button.setEnabled(not running and client is not None)
+        self.execute_button.setEnabled(not running and client is not None)
+        self.pause_button.setEnabled(running)
+        self.cancel_button.setEnabled(running)
+        self.pause_button.setText('暂停')
+
+    def toggle_pause(self):
+        """暂停/继续当前任务（正在进行中的请求会先完成）"""
+        if self.worker is None:
+            return
+        control = self.worker.control
+        if control.paused:
+            control.resume()
+            self.pause_button.setText('暂停')
+            self.log_message("任务继续")
+        else:
+            control.pause()
+            self.pause_button.setText('继续')
+            self.log_message("任务已暂停，正在进行中的请求完成后停止")
+
+    def cancel_task(self):
+        """取消当前任务（正在进行中的请求会先完成）"""
+        if self.worker is None:
+            return
+        self.worker.control.cancel()
+        self.cancel_button.setEnabled(False)
+        self.pause_button.setEnabled(False)
+        self.log_message("正在取消任务...")
 
     def update_progress(self, value):
         """更新进度条"""
         int_value = int(value)
         int_value = max(0, min(100, int_value))
         self.progress_bar.setValue(int_value)
-        QApplication.processEvents()
 
     def validate_inputs(self):
         """验证输入字段"""
@@ -412,24 +434,22 @@ class MainWindow(QMainWindow):
     def log_message(self, message):
         """优化日志显示和内存管理"""
         try:
+            # 完整日志写入滚动日志文件
+            self.logger.info(message)
+
             if hasattr(self, 'log_display'):
                 # 添加时间戳
                 timestamp = time.strftime("%H:%M:%S", time.localtime())
                 formatted_message = f"[{timestamp}] {message}"
                 
-                # 将新消息添加到缓冲区
+                # 将新消息添加到缓冲区（缓冲区有上限，超出时丢弃最早的消息）
                 self.log_buffer.append(formatted_message)
-                
-                # 控制缓冲区大小（保留最新的100条消息）
-                max_buffer = 100
-                if len(self.log_buffer) > max_buffer:
-                    self.log_buffer = self.log_buffer[-max_buffer:]
             
         except Exception as e:
             print(f"日志错误: {str(e)}")
 
     def flush_log_buffer(self):
-        """优化日志缓冲区刷新"""
+        """把缓冲区中的新日志追加到日志窗口"""
         if not self.log_buffer:
             return
         
@@ -438,26 +458,14 @@ class MainWindow(QMainWindow):
             scrollbar = self.log_display.verticalScrollBar()
             was_at_bottom = scrollbar.value() == scrollbar.maximum()
             
-            # 保持现有文本，添加新内容
-            current_text = self.log_display.toPlainText()
-            new_text = '\n'.join(self.log_buffer)
-            
-            if current_text:
-                combined_text = f"{current_text}\n{new_text}"
-            else:
-                combined_text = new_text
-            
-            self.log_display.setPlainText(combined_text)
+            # 只追加新内容，不重写已有文本
+            lines = [self.log_buffer.popleft() for _ in range(len(self.log_buffer))]
+            self.log_display.appendPlainText('\n'.join(lines))
             
             # 如果之前滚动条在底部，则保持在底部
             if was_at_bottom:
                 scrollbar.setValue(scrollbar.maximum())
             
-            # 清空缓冲区
-            self.log_buffer = []
-            
-            QApplication.processEvents()
-            
         except Exception as e:
             print(f"刷新日志错误: {str(e)}")
 
@@ -474,11 +482,7 @@ class MainWindow(QMainWindow):
                 self.log_message("请先输入课程标题")
                 return
             
-            base_dir = ensure_temp_directory()
-            course_dir = os.path.join(base_dir, sanitize_filename(title))
-            
-            if not os.path.exists(course_dir):
-                os.makedirs(course_dir)
+            course_dir = create_course_directory(title)
             
             url = QUrl.fromLocalFile(course_dir)
             QDesktopServices.openUrl(url)
@@ -487,12 +491,35 @@ class MainWindow(QMainWindow):
             self.log_message(f"打开目录失败: {str(e)}")
 
     def closeEvent(self, event):
-        """关闭窗口时确保日志被完全写入"""
+        """
+        关闭窗口时取消后台任务并确保日志被完全写入
+
+        后台任务正在执行时先忽略关闭，取消任务后等它结束（进行中的请求完成）再关闭窗口，
+        避免 QThread 在运行中被销毁
+        """
+        if self.worker_thread is not None:
+            if not self.close_requested:
+                self.close_requested = True
+                self.worker.control.cancel()
+                self.cancel_button.setEnabled(False)
+                self.pause_button.setEnabled(False)
+                self.log_message("正在取消任务，当前请求完成后关闭窗口...")
+            event.ignore()
+            return
+        if self.client_thread is not None:
+            # 初始化客户端不能取消，耗时很短，直接等它结束
+            self.client_thread.quit()
+            self.client_thread.wait()
         self.flush_log_buffer()
         super().closeEvent(event)
 
 # 主程序入口
 if __name__ == '__main__':
+    if '--profile-imports' in sys.argv:
+        # 导入耗时分析：python main.py --profile-imports
+        from startup_profile import main as profile_main
+        sys.exit(profile_main([arg for arg in sys.argv[1:] if arg != '--profile-imports']))
+
     try:
         app = QApplication(sys.argv)
         
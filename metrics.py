@@ -0,0 +1,266 @@
+import os
+import csv
+import json
+import math
+import time
+import uuid
+import threading
+from typing import TYPE_CHECKING, Dict, List, Optional
+
+from config import CONFIG
+
+if TYPE_CHECKING:
+    from http.server import ThreadingHTTPServer
+
+METRICS_JSON = 'metrics.json'
+METRICS_CSV = 'metrics.csv'
+
+# 导出到 CSV 的单次调用字段
+CALL_FIELDS = ['time', 'course', 'kind', 'latency', 'attempts', 'prompt_tokens', 'completion_tokens',
+               'cached_tokens', 'cache_hit', 'hedge', 'error']
+
+
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    """最近秩法计算分位数"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100.0 * len(ordered)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+def _usage_value(usage, name: str) -> int:
+    if usage is None:
+        return 0
+    value = usage.get(name) if isinstance(usage, dict) else getattr(usage, name, None)
+    return int(value or 0)
+
+
+def _cached_tokens(usage) -> int:
+    """服务端前缀缓存命中的输入 token 数（prompt_tokens_details.cached_tokens，未返回时为 0）"""
+    if usage is None:
+        return 0
+    details = usage.get('prompt_tokens_details') if isinstance(usage, dict) else getattr(usage, 'prompt_tokens_details', None)
+    return _usage_value(details, 'cached_tokens')
+
+
+class MetricsRegistry:
+    """
+    API 调用指标
+
+    记录每次调用的耗时、重试次数、token 用量、缓存命中和写入字节数，
+    按课程和整次运行汇总，可导出为课程目录下的 JSON/CSV 报告和 Prometheus 文本格式。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.run_id = uuid.uuid4().hex[:12]
+        self.started_at = time.time()
+        self.calls: Dict[str, List[Dict]] = {}
+        self.bytes_written: Dict[str, int] = {}
+        self.tokens_saved: Dict[str, int] = {}
+        self.hedge_saved: Dict[str, float] = {}
+
+    def record_call(self, course: Optional[str], latency: float, attempts: int = 1, usage=None,
+                    cache_hit: bool = False, error: Optional[str] = None, kind: str = 'chat',
+                    hedge: Optional[str] = None) -> None:
+        """
+        记录一次 API 调用（缓存命中也算一次调用，token 用量为 0）
+
+        hedge 为发出对冲请求时被采用的一方（primary / hedge），未对冲时为 None；
+        批处理结果（kind='batch'）没有单次请求的耗时，不计入耗时统计
+        """
+        row = {
+            'time': round(time.time(), 3),
+            'course': course or '',
+            'kind': kind,
+            'latency': round(latency, 4),
+            'attempts': attempts,
+            'prompt_tokens': _usage_value(usage, 'prompt_tokens'),
+            'completion_tokens': _usage_value(usage, 'completion_tokens'),
+            'cached_tokens': _cached_tokens(usage),
+            'cache_hit': cache_hit,
+            'hedge': hedge or '',
+            'error': error
+        }
+        with self._lock:
+            self.calls.setdefault(row['course'], []).append(row)
+
+    def record_bytes(self, course: Optional[str], size: int) -> None:
+        with self._lock:
+            key = course or ''
+            self.bytes_written[key] = self.bytes_written.get(key, 0) + int(size)
+
+    def record_tokens_saved(self, course: Optional[str], tokens: int) -> None:
+        """记录历史记录精简后少发送的输入 token 数"""
+        with self._lock:
+            key = course or ''
+            self.tokens_saved[key] = self.tokens_saved.get(key, 0) + int(tokens)
+
+    def record_hedge_saved(self, course: Optional[str], seconds: float) -> None:
+        """记录对冲请求胜出时比原请求少等待的秒数"""
+        with self._lock:
+            key = course or ''
+            self.hedge_saved[key] = self.hedge_saved.get(key, 0.0) + float(seconds)
+
+    def _aggregate(self, rows: List[Dict], bytes_written: int, tokens_saved: int, hedge_saved: float) -> Dict:
+        api_rows = [r for r in rows if not r['cache_hit']]
+        latencies = [r['latency'] for r in api_rows if not r['error'] and r['kind'] != 'batch']
+        prompt_tokens = sum(r['prompt_tokens'] for r in rows)
+        cached_tokens = sum(r['cached_tokens'] for r in rows)
+        return {
+            'calls': len(rows),
+            'api_calls': len(api_rows),
+            'errors': sum(1 for r in rows if r['error']),
+            'retries': sum(max(0, r['attempts'] - 1) for r in rows),
+            'cache_hits': len(rows) - len(api_rows),
+            'prompt_tokens': prompt_tokens,
+            'completion_tokens': sum(r['completion_tokens'] for r in rows),
+            'cached_prompt_tokens': cached_tokens,
+            'history_tokens_saved': tokens_saved,
+            'hedged_calls': sum(1 for r in rows if r['hedge']),
+            'hedge_wins': sum(1 for r in rows if r['hedge'] == 'hedge'),
+            'hedge_saved_s': round(hedge_saved, 3),
+            'prefix_cache_hit_rate': round(cached_tokens / prompt_tokens, 4) if prompt_tokens else None,
+            'bytes_written': bytes_written,
+            'latency_total_s': round(sum(latencies), 3),
+            'latency_p50_s': percentile(latencies, 50),
+            'latency_p95_s': percentile(latencies, 95),
+            'latency_max_s': max(latencies) if latencies else None
+        }
+
+    def summary(self, course: Optional[str] = None) -> Dict:
+        """课程汇总（指定 course）或整次运行的汇总"""
+        with self._lock:
+            if course is not None:
+                rows = list(self.calls.get(course, []))
+                size = self.bytes_written.get(course, 0)
+                saved = self.tokens_saved.get(course, 0)
+                hedge_saved = self.hedge_saved.get(course, 0.0)
+            else:
+                rows = [row for course_rows in self.calls.values() for row in course_rows]
+                size = sum(self.bytes_written.values())
+                saved = sum(self.tokens_saved.values())
+                hedge_saved = sum(self.hedge_saved.values())
+        return self._aggregate(rows, size, saved, hedge_saved)
+
+    def report(self) -> Dict:
+        """整次运行的报告，包含各课程汇总"""
+        with self._lock:
+            courses = sorted(set(self.calls) | set(self.bytes_written) | set(self.tokens_saved))
+        return {
+            'run_id': self.run_id,
+            'started_at': self.started_at,
+            'elapsed_s': round(time.time() - self.started_at, 3),
+            'total': self.summary(),
+            'courses': {course: self.summary(course) for course in courses}
+        }
+
+    def write_course_report(self, course: str, course_dir: str) -> None:
+        """在课程目录下写入 metrics.json（汇总）和 metrics.csv（逐次调用）"""
+        with self._lock:
+            rows = list(self.calls.get(course, []))
+        data = {
+            'run_id': self.run_id,
+            'course': course,
+            'generated_at': time.time(),
+            'summary': self.summary(course)
+        }
+        json_path = os.path.join(course_dir, METRICS_JSON)
+        with open(json_path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+        os.replace(json_path + '.tmp', json_path)
+
+        csv_path = os.path.join(course_dir, METRICS_CSV)
+        with open(csv_path + '.tmp', 'w', encoding='utf-8', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=CALL_FIELDS)
+            writer.writeheader()
+            writer.writerows(rows)
+        os.replace(csv_path + '.tmp', csv_path)
+
+        if CONFIG['METRICS_PROMETHEUS_FILE']:
+            self.write_prometheus(CONFIG['METRICS_PROMETHEUS_FILE'])
+
+    def to_prometheus(self) -> str:
+        """Prometheus 文本格式"""
+        report = self.report()
+        lines = []
+
+        def metric(name, kind, help_text, values):
+            lines.append(f"# HELP courseforge_{name} {help_text}")
+            lines.append(f"# TYPE courseforge_{name} {kind}")
+            for course, value in values:
+                if value is None:
+                    continue
+                label = course.replace('\\', '\\\\').replace('"', '\\"')
+                lines.append(f'courseforge_{name}{{course="{label}"}} {value}')
+
+        series = list(report['courses'].items())
+        for key, kind, help_text in (
+            ('calls', 'counter', 'API 调用次数（含缓存命中）'),
+            ('api_calls', 'counter', '实际发出的 API 调用次数'),
+            ('errors', 'counter', '失败的调用次数'),
+            ('retries', 'counter', '重试次数'),
+            ('cache_hits', 'counter', '响应缓存命中次数'),
+            ('prompt_tokens', 'counter', '输入 token 数'),
+            ('completion_tokens', 'counter', '输出 token 数'),
+            ('cached_prompt_tokens', 'counter', '服务端前缀缓存命中的输入 token 数'),
+            ('history_tokens_saved', 'counter', '历史记录精简后少发送的输入 token 数'),
+            ('hedged_calls', 'counter', '发出了对冲请求的调用次数'),
+            ('hedge_wins', 'counter', '对冲请求先返回的次数'),
+            ('hedge_saved_s', 'counter', '对冲请求胜出时少等待的秒数'),
+            ('bytes_written', 'counter', '写入的字节数'),
+            ('latency_total_s', 'counter', '成功调用的累计耗时（秒）'),
+            ('latency_p50_s', 'gauge', '调用耗时中位数（秒）'),
+            ('latency_p95_s', 'gauge', '调用耗时 p95（秒）'),
+        ):
+            name = key[:-2] + '_seconds' if key.endswith('_s') else key + ('_total' if kind == 'counter' else '')
+            metric(name, kind, help_text, [(course, summary[key]) for course, summary in series])
+        return '\n'.join(lines) + '\n'
+
+    def write_prometheus(self, path: str) -> None:
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(path + '.tmp', 'w', encoding='utf-8') as f:
+            f.write(self.to_prometheus())
+        os.replace(path + '.tmp', path)
+
+
+_registry = MetricsRegistry()
+
+def get_metrics() -> MetricsRegistry:
+    """获取当前运行的指标"""
+    return _registry
+
+def reset_metrics() -> MetricsRegistry:
+    """开始新的一次运行"""
+    global _registry
+    _registry = MetricsRegistry()
+    return _registry
+
+
+def serve_prometheus(port: int, host: str = '127.0.0.1') -> 'ThreadingHTTPServer':
+    """
+    在后台线程中提供 Prometheus 抓取接口
+
+    http.server 在这里才导入，未开启抓取接口时不会加载到启动路径上
+    """
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class PrometheusHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = get_metrics().to_prometheus().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), PrometheusHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='metrics', daemon=True).start()
+    return server
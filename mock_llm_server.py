@@ -0,0 +1,438 @@
+"""
+本地模拟的大模型对话接口（兼容智谱 / OpenAI 的 chat/completions 格式）
+
+用于基准测试和离线调试，不访问网络:
+
+    python mock_llm_server.py --port 8765 --latency 0.8 --jitter 0.3 --error-rate 0.02
+
+客户端 base_url 设为 http://127.0.0.1:8765/api/paas/v4 即可。
+大纲请求按提示词中的章节数返回合法大纲（可按 --outline-drift 的概率少返回章节，
+用于测试大纲修复），补充章节的请求只返回缺失部分，其余请求返回约 800 字的课程内容。
+开头的 system 消息与之前的请求相同的部分按前缀缓存命中计入 usage.prompt_tokens_details.cached_tokens。
+同时提供批处理接口（POST /files、POST /batches、GET /batches/<id>、GET /files/<id>/content），
+批处理任务在后台按 --batch-latency 的总耗时完成。
+"""
+import os
+import re
+import sys
+import json
+import time
+import uuid
+import random
+import argparse
+import threading
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_PREFIX = '/api/paas/v4'
+
+_CHINESE_NUMBERS = '一二三四五六七八九十'
+
+
+class MockSettings:
+    """模拟服务的行为参数，运行中可以直接修改"""
+
+    def __init__(self, latency=0.5, jitter=0.2, error_rate=0.0, throttle_rate=0.0,
+                 chunk_size=20, chunk_delay=0.01, content_chars=800, seed=None, outline_drift=0.0,
+                 batch_latency=0.5, slow_rate=0.0, slow_factor=10.0):
+        self.latency = latency  # 首字节前的平均等待秒数
+        self.jitter = jitter  # 等待时间的随机波动比例
+        self.error_rate = error_rate  # 返回 500 的概率
+        self.throttle_rate = throttle_rate  # 返回 429 的概率
+        self.chunk_size = chunk_size  # 流式输出每段的字符数
+        self.chunk_delay = chunk_delay  # 流式输出每段之间的间隔秒数
+        self.content_chars = content_chars  # 课程内容的字符数
+        self.outline_drift = outline_drift  # 大纲少返回最后一章和第一章最后一节的概率
+        self.batch_latency = batch_latency  # 批处理任务从提交到完成的秒数
+        self.slow_rate = slow_rate  # 响应特别慢（长尾）的概率
+        self.slow_factor = slow_factor  # 长尾响应的延迟倍数
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = 0
+        self._prefixes = []  # 最近见过的 system 消息，用于模拟前缀缓存
+
+    def cached_prefix(self, messages):
+        """与之前请求的 system 消息相同的最长前缀字符数"""
+        if not messages or messages[0].get('role') != 'system':
+            return 0
+        text = messages[0].get('content') or ''
+        with self.lock:
+            best = max((len(os.path.commonprefix([text, seen])) for seen in self._prefixes), default=0)
+            if text not in self._prefixes:
+                self._prefixes = (self._prefixes + [text])[-64:]
+        return best
+
+    def sample_drift(self):
+        with self.lock:
+            return self.random.random() < self.outline_drift
+
+    def sample_latency(self):
+        with self.lock:
+            self.requests += 1
+            factor = self.random.lognormvariate(0, self.jitter) if self.jitter else 1.0
+            roll = self.random.random()
+            if self.random.random() < self.slow_rate:
+                factor *= self.slow_factor
+        status = None
+        if roll < self.throttle_rate:
+            status = 429
+        elif roll < self.throttle_rate + self.error_rate:
+            status = 500
+        return self.latency * factor, status
+
+
+def _outline_lines(first_chapter, last_chapter, sections):
+    lines = []
+    for c in range(first_chapter, last_chapter + 1):
+        name = _CHINESE_NUMBERS[c - 1] if c <= len(_CHINESE_NUMBERS) else str(c)
+        lines.append(f"# 第{name}章 模拟章节{c}")
+        for s in range(1, sections + 1):
+            lines.append(f"## {c}.{s} 模拟小节{c}-{s}")
+    return lines
+
+
+def build_outline(prompt, drift=False):
+    """根据大纲提示词中的“共N章，每章M节”生成大纲，drift 时少返回最后一章和第一章的最后一节"""
+    match = re.search(r'共(\d+)章，每章(\d+)节', prompt)
+    chapters, sections = (int(match.group(1)), int(match.group(2))) if match else (4, 4)
+    lines = _outline_lines(1, chapters, sections)
+    if drift and chapters > 1 and sections > 1:
+        lines = lines[:-(sections + 1)]
+        del lines[sections]
+    return '\n'.join(lines)
+
+
+def build_repair(prompt):
+    """补充章节的请求只返回缺失部分"""
+    match = re.search(r'补充第(\d+)章到第(\d+)章，共\d+章，每章(\d+)节', prompt)
+    if match:
+        return '\n'.join(_outline_lines(int(match.group(1)), int(match.group(2)), int(match.group(3))))
+    match = re.search(r'编号从(\d+)\.(\d+)到\d+\.(\d+)', prompt)
+    if match:
+        c, start, end = (int(g) for g in match.groups())
+        return '\n'.join(f"## {c}.{s} 模拟小节{c}-{s}" for s in range(start, end + 1))
+    return ''
+
+
+def build_section(prompt, chars):
+    match = re.search(r'理解(.+?)这个主题', prompt)
+    topic = match.group(1) if match else '模拟主题'
+    skeleton = f"# PPT内容\n{topic}\n    要点一\n    要点二\n    要点三\n\n# 授课台词\n"
+    body = (f"同学们好，今天我们一起学习{topic}。" * (chars // 12 + 1))[:chars]
+    return skeleton + body
+
+
+def build_reply(messages, settings):
+    prompt = messages[-1].get('content', '') if messages else ''
+    if '已有大纲' in prompt:
+        return build_repair(prompt)
+    if '课程大纲' in prompt:
+        return build_outline(prompt, settings.sample_drift())
+    return build_section(prompt, settings.content_chars)
+
+
+def estimate_tokens(text):
+    return max(1, len(text))
+
+
+def build_usage(messages, content, settings):
+    prompt_tokens = sum(estimate_tokens(m.get('content') or '') for m in messages)
+    return {
+        'prompt_tokens': prompt_tokens,
+        'completion_tokens': estimate_tokens(content),
+        'total_tokens': prompt_tokens + estimate_tokens(content),
+        'prompt_tokens_details': {'cached_tokens': settings.cached_prefix(messages)}
+    }
+
+
+def build_completion(request, content, usage):
+    return {
+        'id': f'mock-{uuid.uuid4().hex[:16]}',
+        'created': int(time.time()),
+        'model': request.get('model', 'mock-model'),
+        'choices': [{
+            'index': 0,
+            'finish_reason': 'stop',
+            'message': {'role': 'assistant', 'content': content}
+        }],
+        'usage': usage
+    }
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    server_version = 'MockLLM/1.0'
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        if status == 429:
+            self.send_header('Retry-After', '1')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_json(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        return json.loads(self.rfile.read(length) or b'{}')
+
+    def _not_found(self):
+        self._send_json(404, {'error': {'code': '404', 'message': f'未知接口: {self.path}'}})
+
+    def do_POST(self):
+        path = self.path.rstrip('/')
+        match = re.search(r'/batches/([\w-]+)/cancel$', path)
+        if path.endswith('/chat/completions'):
+            self._chat_completions()
+        elif path.endswith('/files'):
+            self._upload_file()
+        elif path.endswith('/batches'):
+            self._create_batch()
+        elif match:
+            batch = self.server.cancel_batch(match.group(1))
+            self._send_json(200, batch) if batch else self._not_found()
+        else:
+            self._not_found()
+
+    def do_GET(self):
+        path = self.path.rstrip('/')
+        file_match = re.search(r'/files/([\w-]+)/content$', path)
+        batch_match = re.search(r'/batches/([\w-]+)$', path)
+        if file_match:
+            data = self.server.files.get(file_match.group(1))
+            if data is None:
+                self._not_found()
+                return
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/jsonl')
+            self.send_header('Content-Length', str(len(data['content'])))
+            self.end_headers()
+            self.wfile.write(data['content'])
+        elif batch_match and batch_match.group(1) in self.server.batches:
+            with self.server.store_lock:
+                self._send_json(200, dict(self.server.batches[batch_match.group(1)]))
+        else:
+            self._not_found()
+
+    def _upload_file(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        raw = self.rfile.read(length)
+        header = f"Content-Type: {self.headers.get('Content-Type')}\r\n\r\n".encode('utf-8')
+        message = BytesParser(policy=HTTP).parsebytes(header + raw)
+        fields = {}
+        filename = 'upload.jsonl'
+        for part in message.iter_parts():
+            name = part.get_param('name', header='content-disposition')
+            fields[name] = part.get_payload(decode=True)
+            if name == 'file' and part.get_filename():
+                filename = part.get_filename()
+        if not fields.get('file'):
+            self._send_json(400, {'error': {'code': '400', 'message': '缺少文件'}})
+            return
+        purpose = (fields.get('purpose') or b'batch').decode('utf-8')
+        self._send_json(200, self.server.add_file(fields['file'], filename, purpose))
+
+    def _create_batch(self):
+        request = self._read_json()
+        if request.get('input_file_id') not in self.server.files:
+            self._send_json(400, {'error': {'code': '400', 'message': '输入文件不存在'}})
+            return
+        self._send_json(200, self.server.create_batch(request))
+
+    def _chat_completions(self):
+        settings = self.server.settings
+        request = self._read_json()
+        delay, status = settings.sample_latency()
+        time.sleep(delay)
+
+        if status == 429:
+            self._send_json(429, {'error': {'code': '1302', 'message': '模拟限流'}})
+            return
+        if status == 500:
+            self._send_json(500, {'error': {'code': '500', 'message': '模拟服务端错误'}})
+            return
+
+        messages = request.get('messages') or []
+        content = build_reply(messages, settings)
+        usage = build_usage(messages, content, settings)
+        base = {
+            'id': f'mock-{int(time.time() * 1000)}-{threading.get_ident()}',
+            'created': int(time.time()),
+            'model': request.get('model', 'mock-model'),
+        }
+
+        if request.get('stream'):
+            self._stream(base, content, usage, settings)
+            return
+
+        self._send_json(200, build_completion(request, content, usage))
+
+    def _stream(self, base, content, usage, settings):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream; charset=utf-8')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        self.close_connection = True
+
+        def send(payload):
+            data = payload if isinstance(payload, str) else json.dumps(payload, ensure_ascii=False)
+            self.wfile.write(f"data: {data}\n\n".encode('utf-8'))
+            self.wfile.flush()
+
+        size = max(1, settings.chunk_size)
+        for i in range(0, len(content), size):
+            send({**base, 'choices': [{'index': 0, 'delta': {'role': 'assistant', 'content': content[i:i + size]}}]})
+            if settings.chunk_delay:
+                time.sleep(settings.chunk_delay)
+        send({**base, 'choices': [{'index': 0, 'finish_reason': 'stop', 'delta': {'role': 'assistant', 'content': ''}}],
+              'usage': usage})
+        send('[DONE]')
+
+
+class MockLLMServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # 异步客户端会同时建立上百个连接，默认的监听队列（5）会导致连接被重置
+    request_queue_size = 512
+
+    def __init__(self, host='127.0.0.1', port=0, settings=None, verbose=False):
+        super().__init__((host, port), MockHandler)
+        self.settings = settings or MockSettings()
+        self.verbose = verbose
+        self._thread = None
+        self.store_lock = threading.Lock()
+        self.files = {}
+        self.batches = {}
+
+    def add_file(self, content, filename, purpose):
+        file_id = f"file-{uuid.uuid4().hex[:16]}"
+        info = {'id': file_id, 'object': 'file', 'bytes': len(content), 'created_at': int(time.time()),
+                'filename': filename, 'purpose': purpose}
+        with self.store_lock:
+            self.files[file_id] = {**info, 'content': content}
+        return info
+
+    def create_batch(self, request):
+        batch_id = f"batch-{uuid.uuid4().hex[:16]}"
+        batch = {
+            'id': batch_id, 'object': 'batch', 'endpoint': request.get('endpoint'),
+            'input_file_id': request['input_file_id'],
+            'completion_window': request.get('completion_window') or '24h',
+            'status': 'validating', 'created_at': int(time.time()), 'metadata': request.get('metadata'),
+            'output_file_id': None, 'error_file_id': None,
+            'request_counts': {'total': 0, 'completed': 0, 'failed': 0}
+        }
+        with self.store_lock:
+            self.batches[batch_id] = batch
+        threading.Thread(target=self._process_batch, args=(batch_id,), daemon=True).start()
+        return dict(batch)
+
+    def cancel_batch(self, batch_id):
+        with self.store_lock:
+            batch = self.batches.get(batch_id)
+            if batch is None:
+                return None
+            if batch['status'] not in ('completed', 'failed', 'expired', 'cancelled'):
+                batch['status'] = 'cancelled'
+                batch['cancelled_at'] = int(time.time())
+            return dict(batch)
+
+    def _process_batch(self, batch_id):
+        """逐行生成结果，成功的写入输出文件，失败的写入错误文件"""
+        with self.store_lock:
+            batch = self.batches[batch_id]
+            lines = self.files[batch['input_file_id']]['content'].decode('utf-8').splitlines()
+            batch['status'] = 'in_progress'
+            batch['request_counts']['total'] = len([line for line in lines if line.strip()])
+
+        outputs, errors = [], []
+        delay = self.settings.batch_latency / max(1, len(lines))
+        for line in lines:
+            if not line.strip():
+                continue
+            time.sleep(delay)
+            with self.store_lock:
+                if batch['status'] == 'cancelled':
+                    return
+            item = json.loads(line)
+            request = item.get('body') or {}
+            _, status = self.settings.sample_latency()
+            if status:
+                record = {'custom_id': item.get('custom_id'), 'response': {
+                    'status_code': status, 'body': {'error': {'code': str(status), 'message': '模拟服务端错误'}}}}
+                errors.append(record)
+            else:
+                messages = request.get('messages') or []
+                content = build_reply(messages, self.settings)
+                body = build_completion(request, content, build_usage(messages, content, self.settings))
+                outputs.append({'custom_id': item.get('custom_id'), 'response': {'status_code': 200, 'body': body}})
+            with self.store_lock:
+                batch['request_counts']['completed' if not status else 'failed'] += 1
+
+        def store(records, name):
+            if not records:
+                return None
+            content = ''.join(json.dumps(r, ensure_ascii=False) + '\n' for r in records).encode('utf-8')
+            return self.add_file(content, f"{batch_id}_{name}.jsonl", 'batch')['id']
+
+        output_file_id, error_file_id = store(outputs, 'output'), store(errors, 'error')
+        with self.store_lock:
+            batch.update(status='completed', completed_at=int(time.time()),
+                         output_file_id=output_file_id, error_file_id=error_file_id)
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}{DEFAULT_PREFIX}"
+
+    def start(self):
+        """在后台线程中启动服务"""
+        self._thread = threading.Thread(target=self.serve_forever, name='mock-llm', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='本地模拟大模型接口')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', type=float, default=0.5, help='平均响应延迟（秒）')
+    parser.add_argument('--jitter', type=float, default=0.2, help='延迟波动（对数正态分布的 sigma）')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='返回 500 的概率')
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help='返回 429 的概率')
+    parser.add_argument('--chunk-size', type=int, default=20, help='流式输出每段字符数')
+    parser.add_argument('--chunk-delay', type=float, default=0.01, help='流式输出每段间隔（秒）')
+    parser.add_argument('--outline-drift', type=float, default=0.0, help='大纲缺少章节的概率')
+    parser.add_argument('--slow-rate', type=float, default=0.0, help='长尾慢响应的概率')
+    parser.add_argument('--slow-factor', type=float, default=10.0, help='长尾慢响应的延迟倍数')
+    parser.add_argument('--batch-latency', type=float, default=0.5, help='批处理任务从提交到完成的秒数')
+    parser.add_argument('--verbose', action='store_true', help='打印每个请求')
+    args = parser.parse_args(argv)
+
+    settings = MockSettings(args.latency, args.jitter, args.error_rate, args.throttle_rate,
+                            args.chunk_size, args.chunk_delay, outline_drift=args.outline_drift,
+                            batch_latency=args.batch_latency, slow_rate=args.slow_rate,
+                            slow_factor=args.slow_factor)
+    server = MockLLMServer(args.host, args.port, settings, verbose=args.verbose)
+    print(f"模拟服务已启动: {server.base_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
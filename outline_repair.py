@@ -0,0 +1,154 @@
+from dataclasses import dataclass, field
+from typing import List, Optional, Tuple
+
+from config import CONFIG
+from api_client import chat_with_moonshot
+from course_model import Course, Chapter, Section, parse_outline, render_outline
+from prompt_functions import generate_missing_chapters, generate_missing_sections
+
+
+@dataclass(slots=True)
+class OutlineIssues:
+    """大纲与要求的章节数不一致之处，章序号从 0 开始"""
+    missing_chapters: int = 0
+    extra_chapters: int = 0
+    short_chapters: List[Tuple[int, int]] = field(default_factory=list)  # (章序号, 缺少的节数)
+    long_chapters: List[Tuple[int, int]] = field(default_factory=list)  # (章序号, 多出的节数)
+
+    @property
+    def ok(self) -> bool:
+        return not (self.missing_chapters or self.extra_chapters or self.short_chapters or self.long_chapters)
+
+    def describe(self) -> str:
+        parts = []
+        if self.missing_chapters:
+            parts.append(f"缺少{self.missing_chapters}章")
+        if self.extra_chapters:
+            parts.append(f"多出{self.extra_chapters}章")
+        parts.extend(f"第{index + 1}章缺少{count}节" for index, count in self.short_chapters)
+        parts.extend(f"第{index + 1}章多出{count}节" for index, count in self.long_chapters)
+        return '，'.join(parts)
+
+
+def validate_outline(course: Course, chapters: int, sections: int) -> OutlineIssues:
+    """比较课程结构与要求的章数、每章节数"""
+    issues = OutlineIssues()
+    if len(course.chapters) < chapters:
+        issues.missing_chapters = chapters - len(course.chapters)
+    elif len(course.chapters) > chapters:
+        issues.extra_chapters = len(course.chapters) - chapters
+
+    for chapter in course.chapters[:chapters]:
+        count = len(chapter.sections)
+        if count < sections:
+            issues.short_chapters.append((chapter.index, sections - count))
+        elif count > sections:
+            issues.long_chapters.append((chapter.index, count - sections))
+    return issues
+
+
+def trim_outline(course: Course, chapters: int, sections: int) -> int:
+    """在本地删掉多出的章和节，不调用 API，返回删掉的小节数"""
+    removed = sum(len(chapter.sections) for chapter in course.chapters[chapters:])
+    del course.chapters[chapters:]
+    for chapter in course.chapters:
+        removed += max(0, len(chapter.sections) - sections)
+        del chapter.sections[sections:]
+    course.reindex()
+    return removed
+
+
+def _request(client, prompt, window, course_label):
+    return parse_outline(chat_with_moonshot(client=client, prompt=prompt, history=[], window=window,
+                                            use_cache=False, course=course_label))
+
+
+def _add_chapters(client, course: Course, missing: int, sections: int, window, course_label) -> int:
+    start = len(course.chapters) + 1
+    prompt = generate_missing_chapters(course.title, course.student, render_outline(course), start, missing, sections)
+    added = 0
+    for chapter in _request(client, prompt, window, course_label).chapters:
+        if added >= missing:
+            break
+        # 模型只返回了节而没有章名时无法补成一章
+        if not chapter.title:
+            continue
+        course.chapters.append(Chapter(len(course.chapters), chapter.title, chapter.number, chapter.sections))
+        added += 1
+    course.reindex()
+    return added
+
+
+def _add_sections(client, course: Course, chapter: Chapter, missing: int, window, course_label) -> int:
+    existing = {section.title for section in course.sections}
+    start = len(chapter.sections) + 1
+    prompt = generate_missing_sections(course.title, render_outline(course), chapter.title or f"第{chapter.index + 1}章",
+                                       chapter.index + 1, start, missing)
+    added = 0
+    for section in _request(client, prompt, window, course_label).sections:
+        if added >= missing:
+            break
+        if section.title in existing:
+            continue
+        chapter.sections.append(Section(0, chapter.index, section.title, section.number))
+        existing.add(section.title)
+        added += 1
+    course.reindex()
+    return added
+
+
+def repair_outline(client, course: Course, chapters: int, sections: int, window=None,
+                   rounds: Optional[int] = None, course_label: Optional[str] = None) -> bool:
+    """
+    校验大纲并就地修复
+
+    多出的章节直接在本地删掉；缺少的章、节分别用只针对缺失部分的小提示词补充，
+    而不是重新生成整份大纲。修复轮数用完后仍不完整时只记录日志，按现有大纲继续。
+
+    Args:
+        rounds: 最多修复轮数，默认取 CONFIG['OUTLINE_REPAIR_ROUNDS']，0 为只校验和删减
+
+    Returns:
+        bool: 课程结构是否被修改
+    """
+    chapters, sections = int(chapters), int(sections)
+    if rounds is None:
+        rounds = CONFIG['OUTLINE_REPAIR_ROUNDS']
+
+    issues = validate_outline(course, chapters, sections)
+    if issues.ok:
+        return False
+    if window:
+        window.log_message(f"课程大纲与要求不一致: {issues.describe()}")
+
+    changed = False
+    removed = trim_outline(course, chapters, sections)
+    if removed or issues.extra_chapters:
+        changed = True
+        if window:
+            window.log_message(f"已删掉多出的章节（{removed}节）")
+
+    for _ in range(rounds):
+        issues = validate_outline(course, chapters, sections)
+        if issues.ok:
+            break
+        if issues.missing_chapters:
+            if window:
+                window.log_message(f"补充缺少的{issues.missing_chapters}章...")
+            changed |= _add_chapters(client, course, issues.missing_chapters, sections, window, course_label) > 0
+            issues = validate_outline(course, chapters, sections)
+        for index, missing in issues.short_chapters:
+            chapter = course.chapters[index]
+            if window:
+                window.log_message(f"为[{chapter.title or index + 1}]补充{missing}节...")
+            changed |= _add_sections(client, course, chapter, missing, window, course_label) > 0
+        # 补充的内容本身也可能多出章节
+        changed |= trim_outline(course, chapters, sections) > 0
+
+    issues = validate_outline(course, chapters, sections)
+    if window:
+        if issues.ok:
+            window.log_message("课程大纲已修复")
+        else:
+            window.log_message(f"课程大纲仍不完整（{issues.describe()}），按现有大纲继续")
+    return changed
@@ -1,48 +1,139 @@
+import os
+import sys
+import hashlib
+import threading
+from string import Formatter
+from typing import Dict, List, Optional, Tuple
+
+from config import CONFIG
+
+TEMPLATE_SUFFIX = '.txt'
+
+
+def default_prompt_dir() -> str:
+    """提示词模板目录，打包后的程序从 PyInstaller 解包目录读取（需要 --add-data 打包 prompts 目录）"""
+    base = getattr(sys, '_MEIPASS', None) or os.path.dirname(os.path.abspath(__file__))
+    return os.path.join(base, 'prompts')
+
+
+class PromptTemplate:
+    """
+    预编译的提示词模板
+
+    模板使用 {name} 占位符，加载时拆分为“固定文本 + 占位符”片段，渲染时只做拼接。
+    """
+
+    __slots__ = ('name', 'text', 'version', 'fields', '_parts')
+
+    def __init__(self, name: str, text: str):
+        self.name = name
+        self.text = text
+        self.version = hashlib.sha256(text.encode('utf-8')).hexdigest()[:12]
+        self._parts: List[Tuple[str, Optional[str]]] = [
+            (literal, field) for literal, field, _, _ in Formatter().parse(text)
+        ]
+        self.fields = frozenset(field for _, field in self._parts if field)
+
+    def render(self, **values) -> str:
+        missing = self.fields - values.keys()
+        if missing:
+            raise KeyError(f"提示词模板 {self.name} 缺少参数: {', '.join(sorted(missing))}")
+        return ''.join(literal + (str(values[field]) if field else '') for literal, field in self._parts)
+
+
+class PromptRegistry:
+    """
+    提示词模板注册表
+
+    从 <模板目录>/<版本>/ 下一次性加载全部 .txt 模板并预编译。
+    切换 PROMPT_VERSION 即可对比不同版本的提示词，无需改代码；
+    version 是全部模板内容的哈希，响应缓存和生成清单都以它为键的一部分。
+    """
+
+    def __init__(self, directory: Optional[str] = None, version: Optional[str] = None):
+        self.directory = directory or CONFIG['PROMPT_DIR'] or default_prompt_dir()
+        self.name = version or CONFIG['PROMPT_VERSION']
+        path = os.path.join(self.directory, self.name)
+        if not os.path.isdir(path):
+            raise FileNotFoundError(f"提示词模板目录不存在: {path}")
+
+        self.templates: Dict[str, PromptTemplate] = {}
+        for filename in sorted(os.listdir(path)):
+            if filename.endswith(TEMPLATE_SUFFIX):
+                with open(os.path.join(path, filename), 'r', encoding='utf-8') as f:
+                    name = filename[:-len(TEMPLATE_SUFFIX)]
+                    self.templates[name] = PromptTemplate(name, f.read())
+
+        digest = hashlib.sha256(self.name.encode('utf-8'))
+        for name, template in self.templates.items():
+            digest.update(f"{name}:{template.version}".encode('utf-8'))
+        self.version = f"{self.name}-{digest.hexdigest()[:12]}"
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.templates
+
+    def get(self, name: str) -> PromptTemplate:
+        try:
+            return self.templates[name]
+        except KeyError:
+            raise KeyError(f"提示词模板不存在: {self.name}/{name}") from None
+
+    def render(self, name: str, **values) -> str:
+        return self.get(name).render(**values)
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+def get_prompt_registry() -> PromptRegistry:
+    """获取全局模板注册表，首次调用时加载"""
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = PromptRegistry()
+    return _registry
+
+def reload_prompts(directory: Optional[str] = None, version: Optional[str] = None) -> PromptRegistry:
+    """重新加载模板（修改模板文件或切换版本后调用）"""
+    global _registry
+    with _registry_lock:
+        _registry = PromptRegistry(directory, version)
+    return _registry
+
+def render_prompt(name: str, **values) -> str:
+    return get_prompt_registry().render(name, **values)
+
+def prompt_version() -> str:
+    """当前模板版本哈希"""
+    return get_prompt_registry().version
+
+
+def chapter_name(number):
+    """章序号的中文写法（1-10），超出范围时使用阿拉伯数字"""
+    names = '一二三四五六七八九十'
+    return names[number - 1] if 1 <= number <= len(names) else str(number)
+
 def generate_course_outline(title, student, chapter, section):
-    prompt = f"""## 任务（Task）：
-您的任务是做一个课程标题{title}，目标学员为{student}的课程大纲。
-
-## 规则与限制（Rules & Restrictions）：
-1、课程大纲只有两层结构，章和节。
-2、共{chapter}章，每章{section}节。
-3、只写章名称和节的名字。
-
-## 示例（Example）：
-# 第一章 名称
-## 1.1 名称
-# 第二章 名称
-## 2.1 名称
-
-## 输入格式（Format）：
-markdown
-
-最后你必须严格按照 <规则与限制><示例>的规则输出;不得输出其他任何无关的内容，更不要做任何多余的解释；"""
-    return prompt
-
-def generate_section_content(title, history=None):
-    prompt = f"""
-您的任务是理解{title}这个主题，并制作一个课程PPT和授课台词。
-
-## 规则与限制（Rules & Restrictions）：
-1、PPT内容为Mircosoft Powerpoint里的SmartArt格式。
-2、授课台词要800个字右
-
-## 示例（Example）：
-# PPT内容
-上线准备
-    发布计划
-    测试和部署
-    培训和文档
-发布活动
-    营销推广
-    用户教育    
-    反馈收集
-
-# 授课台词
-台词台词
-
-## 输入格式（Format）：
-markdown
-
-最后你必须严格按照 <规则与限制>和<示例>的规则输出;不得输出其他任何无关的内容，更不要做任何多余的解释；"""
-    return prompt
+    return render_prompt('course_outline', title=title, student=student, chapter=chapter, section=section)
+
+def generate_section_content(title):
+    return render_prompt('section_content', title=title)
+
+def section_system_prompt() -> Optional[str]:
+    """
+    小节内容的固定说明（规则和示例），作为 system 消息放在每个请求的最前面
+
+    所有小节请求的开头完全相同，服务端可以复用前缀缓存；
+    模板版本中没有 section_system 模板时返回 None（说明全部写在 section_content 中）。
+    """
+    registry = get_prompt_registry()
+    return registry.render('section_system') if 'section_system' in registry else None
+
+def generate_missing_chapters(title, student, outline, start, count, section):
+    return render_prompt('missing_chapters', title=title, student=student, outline=outline, start=start,
+                         end=start + count - 1, count=count, section=section, start_name=chapter_name(start))
+
+def generate_missing_sections(title, outline, chapter_title, chapter_number, start, count):
+    return render_prompt('missing_sections', title=title, outline=outline, chapter_title=chapter_title,
+                         chapter_number=chapter_number, start=start, end=start + count - 1, count=count)
@@ -0,0 +1,399 @@
+"""
+多 key / 多接口负载均衡
+
+providers.json（或 CONFIG['PROVIDERS']）中每一项是一个 OpenAI 兼容接口:
+
+    [
+        {"name": "zhipu-1", "api_key": "...", "model": "glm-4-flash", "weight": 2, "rpm": 600},
+        {"name": "zhipu-2", "api_key_env": "ZHIPU_KEY_2", "model": "glm-4-flash"},
+        {"name": "local", "api_key": "local", "base_url": "http://127.0.0.1:8765/v4", "model": "qwen2.5"}
+    ]
+
+ProviderPool 的用法与单个客户端相同（client.chat.completions.create），每次请求按权重轮询
+或最少进行中请求选择一个接口，请求失败时立即换下一个接口重试。各接口的模型不同时，
+调用方先用 choose_model 确定本次请求的模型（响应缓存键中包含模型），请求只发给使用该模型的接口。连续失败或被限流的接口
+暂停使用一段时间（冷却期按次数加倍），冷却结束后重新放行请求；也可以主动发一个极小的
+请求检查各接口是否可用。每个接口可以单独设置 rpm / tpm / 并发上限，总配额为各接口之和。
+"""
+import os
+import json
+import time
+import random
+import threading
+from contextlib import nullcontext
+from dataclasses import dataclass, field
+from types import SimpleNamespace
+from typing import Dict, Iterator, List, Optional
+
+from config import CONFIG
+from rate_limiter import RateLimiter, is_throttle_error
+from token_budget import estimate_request_tokens
+from retry_policy import error_retry_after, error_status_code
+
+# 路由策略
+ROUTING_STRATEGIES = ('weighted', 'least-outstanding')
+
+# 请求本身有问题（换接口也不会成功）的状态码，不切换接口
+_REQUEST_ERROR_STATUS = {400, 413, 422}
+
+
+class NoProviderError(Exception):
+    """没有配置任何接口"""
+
+
+@dataclass(slots=True, eq=False)
+class Provider:
+    """一个接口（key + 地址 + 模型）及其运行状态，按对象本身比较和哈希"""
+    name: str
+    api_key: str
+    base_url: str
+    model: Optional[str] = None
+    weight: int = 1
+    backend: str = 'httpx'
+    limiter: Optional[RateLimiter] = None
+    client: object = None
+    outstanding: int = 0
+    current_weight: int = 0
+    failures: int = 0
+    cooldown_until: float = 0.0
+    last_error: Optional[str] = None
+    stats: Dict[str, int] = field(default_factory=lambda: {'requests': 0, 'errors': 0, 'failovers': 0})
+
+    @property
+    def healthy(self) -> bool:
+        return time.monotonic() >= self.cooldown_until
+
+    @property
+    def effective_model(self) -> str:
+        return self.model or CONFIG['MODEL']
+
+    def get_client(self):
+        if self.client is None:
+            from api_client import create_client
+            self.client = create_client(self.api_key, self.base_url, backend=self.backend)
+        return self.client
+
+
+def load_providers(entries: Optional[List[Dict]] = None) -> List[Provider]:
+    """
+    读取接口配置，未传入时依次取 CONFIG['PROVIDERS'] 和 CONFIG['PROVIDERS_FILE']
+
+    Raises:
+        ValueError: 配置项缺少 api_key
+    """
+    if entries is None:
+        entries = CONFIG['PROVIDERS']
+    if entries is None and CONFIG['PROVIDERS_FILE'] and os.path.exists(CONFIG['PROVIDERS_FILE']):
+        with open(CONFIG['PROVIDERS_FILE'], 'r', encoding='utf-8') as f:
+            entries = json.load(f)
+
+    # 异步客户端各自运行在独立的事件循环中，不能混用，负载均衡时统一使用同步客户端
+    default_backend = 'sdk' if CONFIG['HTTP_BACKEND'] == 'sdk' else 'httpx'
+    providers = []
+    for i, entry in enumerate(entries or []):
+        api_key = entry.get('api_key') or os.environ.get(entry.get('api_key_env') or '', '')
+        if not api_key:
+            raise ValueError(f"接口配置第{i + 1}项缺少 api_key")
+        rpm, tpm = entry.get('rpm', 0), entry.get('tpm', 0)
+        max_concurrency = entry.get('max_concurrency')
+        limiter = None
+        if rpm or tpm or max_concurrency:
+            limiter = RateLimiter(rpm=rpm, tpm=tpm, min_concurrency=CONFIG['CONCURRENCY_MIN'],
+                                  max_concurrency=max_concurrency or CONFIG['CONCURRENCY_MAX'])
+        providers.append(Provider(
+            name=entry.get('name') or f"provider-{i + 1}",
+            api_key=api_key,
+            base_url=entry.get('base_url') or CONFIG['BASE_URL'],
+            model=entry.get('model'),
+            weight=max(1, int(entry.get('weight', 1))),
+            backend=entry.get('backend') or default_backend,
+            limiter=limiter
+        ))
+    return providers
+
+
+class ProviderPool:
+    """
+    接口池，与 SDK 客户端一样通过 chat.completions.create 调用
+
+    Args:
+        providers: 接口列表
+        routing: weighted（平滑加权轮询）或 least-outstanding（进行中请求数 / 权重最小）
+        cooldown: 接口失败后暂停使用的基础秒数
+        failure_threshold: 连续失败多少次后暂停使用（限流立即暂停）
+    """
+
+    is_async = False
+
+    def __init__(self, providers: List[Provider], routing: Optional[str] = None,
+                 cooldown: Optional[float] = None, failure_threshold: Optional[int] = None, window=None):
+        if not providers:
+            raise NoProviderError("没有可用的接口配置")
+        self.providers = providers
+        self.routing = routing or CONFIG['PROVIDER_ROUTING']
+        if self.routing not in ROUTING_STRATEGIES:
+            raise ValueError(f"未知的路由策略: {self.routing}，可选: {', '.join(ROUTING_STRATEGIES)}")
+        self.cooldown = CONFIG['PROVIDER_COOLDOWN'] if cooldown is None else cooldown
+        self.failure_threshold = CONFIG['PROVIDER_FAILURE_THRESHOLD'] if failure_threshold is None else failure_threshold
+        self.window = window
+        self._lock = threading.Lock()
+        self._health_thread = None
+        self.chat = SimpleNamespace(completions=self)
+
+    def _log(self, message: str) -> None:
+        if self.window:
+            self.window.log_message(message)
+
+    @property
+    def models(self) -> List[str]:
+        """各接口使用的模型（去重排序），用于生成清单中的提示词哈希"""
+        return sorted({p.effective_model for p in self.providers})
+
+    @property
+    def default_timeout(self):
+        """各接口都使用 http_client 的客户端时为其默认的 (连接, 读取) 超时，否则为 None（SDK 使用自己的默认值）"""
+        if any(p.backend == 'sdk' for p in self.providers):
+            return None
+        from http_client import default_timeout
+        return default_timeout()
+
+    def choose_model(self) -> str:
+        """按各模型可用接口的权重之和随机选择本次请求的模型"""
+        with self._lock:
+            providers = [p for p in self.providers if p.healthy] or self.providers
+            weights: Dict[str, int] = {}
+            for p in providers:
+                weights[p.effective_model] = weights.get(p.effective_model, 0) + p.weight
+        if len(weights) == 1:
+            return next(iter(weights))
+        return random.choices(list(weights), weights=list(weights.values()))[0]
+
+    def _group(self, model: Optional[str]) -> List[Provider]:
+        """使用该模型的接口；没有接口使用该模型时（如未经 choose_model 的请求）为全部接口"""
+        group = [p for p in self.providers if p.effective_model == model]
+        return group or self.providers
+
+    def _select(self, group, exclude) -> Optional[Provider]:
+        """选择一个接口并占用一个进行中名额；全部在冷却中时选冷却最先结束的"""
+        with self._lock:
+            candidates = [p for p in group if p not in exclude]
+            if not candidates:
+                return None
+            healthy = [p for p in candidates if p.healthy]
+            if not healthy:
+                chosen = min(candidates, key=lambda p: p.cooldown_until)
+            elif self.routing == 'least-outstanding':
+                chosen = min(healthy, key=lambda p: (p.outstanding / p.weight, -p.weight))
+            else:
+                # 平滑加权轮询（同 nginx）：权重大的接口被均匀地穿插选中
+                total = sum(p.weight for p in healthy)
+                for p in healthy:
+                    p.current_weight += p.weight
+                chosen = max(healthy, key=lambda p: p.current_weight)
+                chosen.current_weight -= total
+            chosen.outstanding += 1
+            chosen.stats['requests'] += 1
+            return chosen
+
+    def _release(self, provider: Provider, failed: bool = False, failover: bool = False) -> None:
+        """归还进行中名额；请求失败时同时累计错误数和切换次数（接口池由多个线程共享，计数都在锁内更新）"""
+        with self._lock:
+            provider.outstanding -= 1
+            if failed:
+                provider.stats['errors'] += 1
+            if failover:
+                provider.stats['failovers'] += 1
+
+    def _mark_success(self, provider: Provider) -> None:
+        with self._lock:
+            if provider.failures or provider.cooldown_until:
+                provider.failures = 0
+                provider.cooldown_until = 0.0
+                recovered = True
+            else:
+                recovered = False
+        if recovered:
+            self._log(f"接口 {provider.name} 已恢复")
+
+    def _mark_failure(self, provider: Provider, error: Exception) -> None:
+        with self._lock:
+            provider.failures += 1
+            provider.last_error = str(error)
+            throttled = is_throttle_error(error)
+            if throttled or provider.failures >= self.failure_threshold:
+                extra = max(0, provider.failures - self.failure_threshold)
+                delay = min(self.cooldown * 2 ** extra, self.cooldown * 16)
+                delay = max(delay, error_retry_after(error) or 0)
+                provider.cooldown_until = time.monotonic() + delay
+            else:
+                delay = 0
+        if delay:
+            self._log(f"接口 {provider.name} {'被限流' if throttled else '连续失败'}，暂停使用{delay:.0f}秒: {str(error)}")
+
+    def _request(self, provider: Provider, params: Dict):
+        request = dict(params)
+        if provider.model:
+            request['model'] = provider.model
+        client = provider.get_client()
+        if request.get('stream'):
+            # 取到第一段才算请求成功，之前失败的可以换接口重试
+            chunks = self._stream_chunks(provider, client, request)
+            first = next(chunks, None)
+            return _prepend(first, chunks) if first is not None else iter(())
+
+        if provider.limiter is None:
+            return client.chat.completions.create(**request)
+        with provider.limiter.request(_estimate(request)) as ticket:
+            response = client.chat.completions.create(**request)
+            ticket.record_usage(getattr(response, 'usage', None))
+        return response
+
+    def _stream_chunks(self, provider: Provider, client, request: Dict) -> Iterator:
+        """流式请求在整个输出期间（直到输出结束或被中断）占用该接口的配额"""
+        quota = provider.limiter.request(_estimate(request)) if provider.limiter else nullcontext()
+        with quota as ticket:
+            for chunk in client.chat.completions.create(**request):
+                if ticket is not None and getattr(chunk, 'usage', None):
+                    ticket.record_usage(chunk.usage)
+                yield chunk
+
+    def create(self, **params):
+        """
+        发出请求，失败时依次换其他接口，所有接口都失败时抛出最后一个错误
+
+        请求参数本身有误（400 等）时不换接口，直接抛出。只在使用 params['model'] 的接口之间切换。
+
+        指定了 timeout 时（chat_with_moonshot 每次尝试都按 RETRY_DEADLINE 剩余的时间设置），切换接口的
+        总时长不超过其中的读取超时：时间用完后不再切换，切换后的请求超时也按剩余时间缩短。
+        chat_with_moonshot 每次尝试调用一次 create，所以一次调用最多发出 RETRY_MAX_ATTEMPTS × 接口数个请求，
+        总时长仍不超过 RETRY_DEADLINE。
+        """
+        group = self._group(params.get('model'))
+        timeout = params.get('timeout')
+        budget = _timeout_budget(timeout)
+        deadline = time.monotonic() + budget if budget else None
+        tried = set()
+        last_error = None
+        while True:
+            if last_error is not None and deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise last_error
+                params = {**params, 'timeout': _shorten_timeout(timeout, remaining)}
+            provider = self._select(group, tried)
+            if provider is None:
+                raise last_error
+            tried.add(provider)
+            try:
+                response = self._request(provider, params)
+            except Exception as e:
+                request_error = error_status_code(e) in _REQUEST_ERROR_STATUS
+                failover = not request_error and len(tried) < len(group)
+                self._release(provider, failed=True, failover=failover)
+                self._mark_failure(provider, e)
+                if request_error:
+                    raise
+                last_error = e
+                if failover:
+                    self._log(f"接口 {provider.name} 请求失败，切换到其他接口: {str(e)}")
+                continue
+            self._mark_success(provider)
+            if params.get('stream'):
+                return self._track_stream(provider, response)
+            self._release(provider)
+            return response
+
+    def _track_stream(self, provider: Provider, chunks: Iterator) -> Iterator:
+        """流式输出结束（或中断）后才释放进行中名额"""
+        try:
+            yield from chunks
+        finally:
+            self._release(provider)
+
+    def check_health(self) -> Dict[str, Optional[str]]:
+        """
+        向每个接口发一个极小的请求，更新其状态
+
+        Returns:
+            dict: 接口名 -> None（可用）或错误信息
+        """
+        return {provider.name: self._probe(provider) for provider in self.providers}
+
+    def start_health_checks(self, interval: Optional[float] = None) -> None:
+        """在后台定期检查冷却结束的接口，interval 为 0 时不检查"""
+        interval = CONFIG['PROVIDER_HEALTH_INTERVAL'] if interval is None else interval
+        if not interval or self._health_thread is not None:
+            return
+
+        def loop():
+            while True:
+                time.sleep(interval)
+                for provider in self.providers:
+                    if provider.failures and provider.healthy:
+                        self._probe(provider)
+
+        self._health_thread = threading.Thread(target=loop, name='provider-health', daemon=True)
+        self._health_thread.start()
+
+    def _probe(self, provider: Provider) -> Optional[str]:
+        """发一个极小的请求，返回错误信息，可用时返回 None"""
+        try:
+            provider.get_client().chat.completions.create(
+                model=provider.model or CONFIG['MODEL'],
+                messages=[{"role": "user", "content": "ping"}],
+                max_tokens=1
+            )
+        except Exception as e:
+            self._mark_failure(provider, e)
+            return str(e)
+        self._mark_success(provider)
+        return None
+
+    def status(self) -> List[Dict]:
+        """各接口的当前状态和累计请求数"""
+        with self._lock:
+            return [{
+                'name': p.name,
+                'model': p.model or CONFIG['MODEL'],
+                'weight': p.weight,
+                'healthy': p.healthy,
+                'outstanding': p.outstanding,
+                'last_error': p.last_error,
+                **p.stats
+            } for p in self.providers]
+
+
+def _timeout_budget(timeout) -> Optional[float]:
+    """请求超时中的读取超时（秒），即切换接口的总时长上限；未指定时为 None"""
+    if isinstance(timeout, (int, float)):
+        return timeout
+    if isinstance(timeout, (tuple, list)):
+        return timeout[1]
+    return getattr(timeout, 'read', None)
+
+
+def _shorten_timeout(timeout, seconds: float):
+    """把请求超时缩短到不超过 seconds（剩余时间总是不超过原来的读取超时）"""
+    seconds = max(seconds, 0.1)
+    if isinstance(timeout, (tuple, list)):
+        return tuple(None if value is None else min(value, seconds) for value in timeout)
+    return seconds
+
+
+def _estimate(request: Dict) -> int:
+    return estimate_request_tokens(request.get('messages') or [], request.get('max_tokens') or 0)
+
+
+def _prepend(first, rest: Iterator) -> Iterator:
+    yield first
+    yield from rest
+
+
+def create_provider_pool(window=None) -> Optional[ProviderPool]:
+    """按配置创建接口池，没有配置多个接口时返回 None（使用单个客户端）"""
+    providers = load_providers()
+    if not providers:
+        return None
+    pool = ProviderPool(providers, window=window)
+    pool.start_health_checks()
+    return pool
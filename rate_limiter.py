@@ -0,0 +1,289 @@
+import time
+import asyncio
+import threading
+from collections import deque
+from contextlib import contextmanager, asynccontextmanager
+from typing import Optional
+
+from config import CONFIG
+
+
+def is_throttle_error(error: Exception) -> bool:
+    """
+    是否为限流（429）或超时错误，这类错误说明当前并发过高
+
+    只按错误类型和状态码判断，不匹配错误信息中的文字（其中的 token 数、路径等可能恰好包含 429）
+    """
+    name = type(error).__name__
+    if name in ('APIReachLimitError', 'APIServerFlowExceedError', 'RateLimitError') or 'Timeout' in name:
+        return True
+    status = getattr(error, 'status_code', None)
+    if status is None and getattr(error, 'response', None) is not None:
+        status = getattr(error.response, 'status_code', None)
+    return status == 429
+
+
+class TokenBucket:
+    """
+    令牌桶
+
+    容量为每分钟配额，按配额匀速补充。请求数和 token 数各用一个桶。
+    """
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.rate = self.capacity / 60.0
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def acquire(self, amount: float = 1) -> float:
+        """
+        取出指定数量的令牌，不足时阻塞等待
+
+        Returns:
+            float: 等待的秒数
+        """
+        waited = 0.0
+        while True:
+            delay = self.try_acquire(amount)
+            if not delay:
+                return waited
+            time.sleep(delay)
+            waited += delay
+
+    async def acquire_async(self, amount: float = 1) -> float:
+        """acquire 的协程版本，等待时不阻塞事件循环"""
+        waited = 0.0
+        while True:
+            delay = self.try_acquire(amount)
+            if not delay:
+                return waited
+            await asyncio.sleep(delay)
+            waited += delay
+
+    def try_acquire(self, amount: float = 1) -> float:
+        """
+        尝试取出令牌，不等待
+
+        Returns:
+            float: 0 表示已取出；否则为令牌补足还需等待的秒数
+        """
+        amount = min(float(amount), self.capacity)
+        with self._lock:
+            self._refill()
+            if self.tokens >= amount:
+                self.tokens -= amount
+                return 0.0
+            return (amount - self.tokens) / self.rate
+
+    def adjust(self, amount: float) -> None:
+        """归还（正数）或追扣（负数）令牌，用于按实际用量修正预估值"""
+        with self._lock:
+            self._refill()
+            self.tokens = min(self.capacity, self.tokens + amount)
+
+
+class AdaptiveConcurrency:
+    """
+    AIMD 并发控制器
+
+    每次成功请求让并发上限增加 1/上限（约每一轮并发请求加 1），
+    遇到限流或超时时上限减半，但不低于最小值。
+    """
+
+    def __init__(self, minimum: int, maximum: int, initial: Optional[int] = None,
+                 decrease_factor: float = 0.5):
+        self.minimum = max(1, int(minimum))
+        self.maximum = max(self.minimum, int(maximum))
+        self.limit = float(initial if initial is not None else self.maximum)
+        self.limit = max(self.minimum, min(self.maximum, self.limit))
+        self.decrease_factor = decrease_factor
+        self.in_flight = 0
+        self._cond = threading.Condition()
+        # 等待名额的协程：(事件循环, Future)，名额空出时由释放名额的线程唤醒
+        self._async_waiters = deque()
+
+    def acquire(self) -> None:
+        with self._cond:
+            while self.in_flight >= int(self.limit):
+                self._cond.wait()
+            self.in_flight += 1
+
+    def try_acquire(self) -> bool:
+        """不等待地占用一个并发名额"""
+        with self._cond:
+            if self.in_flight >= int(self.limit):
+                return False
+            self.in_flight += 1
+            return True
+
+    async def acquire_async(self) -> None:
+        """acquire 的协程版本，名额由线程和协程共享；没有名额时挂起等待唤醒，不占用事件循环"""
+        loop = asyncio.get_running_loop()
+        while True:
+            with self._cond:
+                if self.in_flight < int(self.limit):
+                    self.in_flight += 1
+                    return
+                waiter = loop.create_future()
+                self._async_waiters.append((loop, waiter))
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                with self._cond:
+                    try:
+                        self._async_waiters.remove((loop, waiter))
+                    except ValueError:
+                        # 已被唤醒却被取消，把唤醒让给下一个
+                        self._wake_async()
+                raise
+
+    def _wake_async(self) -> None:
+        """按空闲名额数唤醒等待的协程（调用时持有 _cond）"""
+        free = int(self.limit) - self.in_flight
+        while free > 0 and self._async_waiters:
+            loop, waiter = self._async_waiters.popleft()
+            loop.call_soon_threadsafe(_set_waiter, waiter)
+            free -= 1
+
+    def release(self) -> None:
+        with self._cond:
+            self.in_flight -= 1
+            self._cond.notify_all()
+            self._wake_async()
+
+    def on_success(self) -> None:
+        with self._cond:
+            self.limit = min(self.maximum, self.limit + 1.0 / self.limit)
+            self._cond.notify_all()
+            self._wake_async()
+
+    def on_throttle(self) -> None:
+        with self._cond:
+            self.limit = max(self.minimum, self.limit * self.decrease_factor)
+
+
+def _set_waiter(waiter: asyncio.Future) -> None:
+    if not waiter.done():
+        waiter.set_result(None)
+
+
+class RequestTicket:
+    """单次请求占用的配额，请求完成后用实际 token 用量修正预估值"""
+
+    def __init__(self, limiter: 'RateLimiter', estimated_tokens: int):
+        self.limiter = limiter
+        self.estimated_tokens = estimated_tokens
+
+    def record_usage(self, usage) -> None:
+        """根据响应中的 usage 归还多预留的 token 配额"""
+        total = getattr(usage, 'total_tokens', None) if usage is not None else None
+        if total and self.limiter.tpm_bucket:
+            self.limiter.tpm_bucket.adjust(self.estimated_tokens - total)
+
+
+class RateLimiter:
+    """
+    共享的限流层
+
+    同时限制每分钟请求数（RPM）、每分钟 token 数（TPM）和并发请求数，
+    所有经过 api_client 的请求都要先取得配额。
+    """
+
+    def __init__(self, rpm: float = 0, tpm: float = 0, min_concurrency: int = 1,
+                 max_concurrency: int = 8, initial_concurrency: Optional[int] = None):
+        self.rpm_bucket = TokenBucket(rpm) if rpm else None
+        self.tpm_bucket = TokenBucket(tpm) if tpm else None
+        self.concurrency = AdaptiveConcurrency(min_concurrency, max_concurrency, initial_concurrency)
+
+    @contextmanager
+    def request(self, estimated_tokens: int = 0):
+        """
+        占用一次请求的配额
+
+        正常结束视为成功并提升并发上限；抛出限流或超时错误时降低并发上限。
+        """
+        self.concurrency.acquire()
+        try:
+            if self.rpm_bucket:
+                self.rpm_bucket.acquire(1)
+            if self.tpm_bucket and estimated_tokens:
+                self.tpm_bucket.acquire(estimated_tokens)
+        except BaseException:
+            self.concurrency.release()
+            raise
+        with self._held(estimated_tokens) as ticket:
+            yield ticket
+
+    @asynccontextmanager
+    async def request_async(self, estimated_tokens: int = 0):
+        """request 的协程版本，与线程中的请求共享同一份配额"""
+        await self.concurrency.acquire_async()
+        try:
+            if self.rpm_bucket:
+                await self.rpm_bucket.acquire_async(1)
+            if self.tpm_bucket and estimated_tokens:
+                await self.tpm_bucket.acquire_async(estimated_tokens)
+        except BaseException:
+            self.concurrency.release()
+            raise
+        with self._held(estimated_tokens) as ticket:
+            yield ticket
+
+    def try_request(self, estimated_tokens: int = 0):
+        """
+        不等待地占用一次请求的配额（用于对冲请求等可有可无的请求）
+
+        Returns:
+            与 request 用法相同的上下文管理器；并发、RPM 或 TPM 没有空闲时返回 None
+        """
+        if not self.concurrency.try_acquire():
+            return None
+        if self.rpm_bucket and self.rpm_bucket.try_acquire(1):
+            self.concurrency.release()
+            return None
+        if self.tpm_bucket and estimated_tokens and self.tpm_bucket.try_acquire(estimated_tokens):
+            if self.rpm_bucket:
+                self.rpm_bucket.adjust(1)
+            self.concurrency.release()
+            return None
+        return self._held(estimated_tokens)
+
+    @contextmanager
+    def _held(self, estimated_tokens: int):
+        """已取得配额的请求：按结果调整并发上限，结束时释放并发名额"""
+        try:
+            try:
+                yield RequestTicket(self, estimated_tokens)
+            except Exception as e:
+                if is_throttle_error(e):
+                    self.concurrency.on_throttle()
+                raise
+            else:
+                self.concurrency.on_success()
+        finally:
+            self.concurrency.release()
+
+
+_limiter = None
+_limiter_lock = threading.Lock()
+
+def get_rate_limiter() -> RateLimiter:
+    """获取全局共享的限流器，异步客户端的并发上限取 CONFIG['ASYNC_CONCURRENCY_MAX']"""
+    global _limiter
+    with _limiter_lock:
+        if _limiter is None:
+            async_backend = CONFIG['HTTP_BACKEND'] == 'async'
+            _limiter = RateLimiter(
+                rpm=CONFIG['RATE_LIMIT_RPM'],
+                tpm=CONFIG['RATE_LIMIT_TPM'],
+                min_concurrency=CONFIG['CONCURRENCY_MIN'],
+                max_concurrency=CONFIG['ASYNC_CONCURRENCY_MAX' if async_backend else 'CONCURRENCY_MAX']
+            )
+        return _limiter
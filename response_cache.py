@@ -0,0 +1,158 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from typing import Dict, List, Optional
+
+from config import CONFIG
+
+
+class ResponseCache:
+    """
+    基于 SQLite 的大模型响应缓存
+
+    以模型参数、对话历史和提示词的哈希作为键，相同请求直接返回上次的结果。
+    超过有效期的条目会被删除；总大小超过上限时，按最近访问时间淘汰最旧的条目。
+    """
+
+    # 每写入多少条执行一次淘汰
+    EVICT_INTERVAL = 50
+
+    def __init__(self, path: str, max_age_days: float = 30, max_size_mb: float = 200):
+        self.path = path
+        self.max_age = max_age_days * 86400
+        self.max_size = int(max_size_mb * 1024 * 1024)
+        self._lock = threading.Lock()
+        self._puts = 0
+
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS responses (
+                    key TEXT PRIMARY KEY,
+                    content TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL
+                )
+            """)
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_accessed ON responses (accessed_at)")
+            self._conn.commit()
+        self.evict()
+
+    @staticmethod
+    def make_key(model: str, temperature: float, top_p: float, max_tokens: int,
+                 messages: List[Dict], prompt_version: str = '') -> str:
+        """根据模型参数、提示词模板版本和完整消息列表（上下文 + 提示词）计算缓存键"""
+        payload = json.dumps(
+            [model, temperature, top_p, max_tokens, messages, prompt_version],
+            ensure_ascii=False,
+            sort_keys=True
+        )
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        """读取缓存，过期或不存在时返回 None"""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT content, created_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            content, created_at = row
+            if self.max_age and now - created_at > self.max_age:
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._conn.commit()
+                return None
+            self._conn.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            return content
+
+    def put(self, key: str, content: str) -> None:
+        """写入缓存"""
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, content, size, created_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, content, len(content.encode('utf-8')), now, now)
+            )
+            self._conn.commit()
+            self._puts += 1
+            need_evict = self._puts % self.EVICT_INTERVAL == 0
+        if need_evict:
+            self.evict()
+
+    def evict(self) -> int:
+        """
+        淘汰过期条目以及超出容量上限的最久未访问条目
+
+        Returns:
+            int: 删除的条目数
+        """
+        removed = 0
+        with self._lock:
+            if self.max_age:
+                cursor = self._conn.execute(
+                    "DELETE FROM responses WHERE created_at < ?", (time.time() - self.max_age,)
+                )
+                removed += cursor.rowcount
+
+            if self.max_size:
+                total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+                if total > self.max_size:
+                    rows = self._conn.execute(
+                        "SELECT key, size FROM responses ORDER BY accessed_at ASC"
+                    ).fetchall()
+                    stale = []
+                    for key, size in rows:
+                        if total <= self.max_size:
+                            break
+                        stale.append((key,))
+                        total -= size
+                    self._conn.executemany("DELETE FROM responses WHERE key = ?", stale)
+                    removed += len(stale)
+
+            self._conn.commit()
+        return removed
+
+    def clear(self) -> None:
+        """清空缓存"""
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+            self._conn.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_response_cache() -> Optional[ResponseCache]:
+    """获取全局响应缓存，CONFIG['CACHE_ENABLED'] 关闭或初始化失败时返回 None"""
+    global _cache
+    if not CONFIG['CACHE_ENABLED']:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            try:
+                _cache = ResponseCache(
+                    CONFIG['CACHE_PATH'],
+                    max_age_days=CONFIG['CACHE_MAX_AGE_DAYS'],
+                    max_size_mb=CONFIG['CACHE_MAX_SIZE_MB']
+                )
+            except Exception as e:
+                print(f"初始化响应缓存失败: {str(e)}")
+                CONFIG['CACHE_ENABLED'] = False
+                return None
+        return _cache
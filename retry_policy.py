@@ -0,0 +1,232 @@
+import time
+import random
+import asyncio
+from dataclasses import dataclass
+from typing import Callable, List, Optional
+
+from config import CONFIG
+
+# 错误分类
+RETRYABLE = 'retryable'
+FATAL = 'fatal'
+
+# 明确不可重试的错误（鉴权失败、请求参数错误等），重试只会浪费时间
+_FATAL_ERROR_NAMES = {'APIAuthenticationError', 'APIRequestFailedError', 'AuthenticationError',
+                      'PermissionDeniedError', 'BadRequestError', 'NotFoundError'}
+_RETRYABLE_ERROR_NAMES = {'APIReachLimitError', 'APIInternalError', 'APIServerFlowExceedError',
+                          'APITimeoutError', 'APIConnectionError', 'RateLimitError'}
+_FATAL_STATUS = {400, 401, 403, 404, 405, 413, 422}
+# 程序本身的错误（导入失败、参数类型错误、访问不存在的属性或键等），重试也不会成功
+_PROGRAMMING_ERRORS = (ImportError, NameError, TypeError, AttributeError, LookupError, AssertionError,
+                       NotImplementedError)
+
+
+class NonRetryableError(Exception):
+    """调用方明确标记为不可重试的错误，例如流式输出已写出部分内容后中断"""
+
+
+class RetryExhaustedError(Exception):
+    """重试次数或总时长用尽"""
+
+    def __init__(self, message, attempts, last_error):
+        super().__init__(message)
+        self.attempts = attempts
+        self.last_error = last_error
+
+
+@dataclass
+class AttemptRecord:
+    """单次尝试的记录"""
+    attempt: int
+    latency: float
+    error: Optional[str] = None
+    category: Optional[str] = None
+    delay: float = 0.0
+
+
+def error_status_code(error: Exception) -> Optional[int]:
+    """错误对应的 HTTP 状态码（status_code 或 response.status_code），没有时为 None"""
+    status = getattr(error, 'status_code', None)
+    if status is None and getattr(error, 'response', None) is not None:
+        status = getattr(error.response, 'status_code', None)
+    return status
+
+
+def classify_error(error: Exception) -> str:
+    """
+    判断错误是否值得重试
+
+    Returns:
+        str: RETRYABLE 或 FATAL；导入失败、类型错误等程序错误不重试，
+            其他无法识别的错误（网络中断、返回内容为空等）按可重试处理，与原有行为一致
+    """
+    if isinstance(error, (NonRetryableError, *_PROGRAMMING_ERRORS)):
+        return FATAL
+    name = type(error).__name__
+    if name in _FATAL_ERROR_NAMES:
+        return FATAL
+    if name in _RETRYABLE_ERROR_NAMES:
+        return RETRYABLE
+    status = error_status_code(error)
+    if status in _FATAL_STATUS:
+        return FATAL
+    return RETRYABLE
+
+
+def error_retry_after(error: Exception) -> Optional[float]:
+    """读取服务端返回的 Retry-After 头（秒）"""
+    response = getattr(error, 'response', None)
+    headers = getattr(response, 'headers', None)
+    if not headers:
+        return None
+    try:
+        value = headers.get('retry-after')
+        return float(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+class RetryPolicy:
+    """
+    重试策略：指数退避 + 随机抖动 + 总时长限制
+
+    用法::
+
+        for attempt in policy.attempts(on_retry=...):
+            with attempt:
+                ...  # 抛出可重试错误时自动等待后进入下一次尝试
+
+    协程中改用 ``async with attempt:``，等待时不阻塞事件循环。
+    总时长只在两次尝试之间检查，请求本身的超时应不超过 ``attempt.remaining``。
+    致命错误立即抛出；可重试错误在次数或总时长用尽时抛出 RetryExhaustedError。
+    """
+
+    def __init__(self, max_attempts: int = 3, base_delay: float = 1.0, max_delay: float = 30.0,
+                 multiplier: float = 2.0, jitter: float = 0.5, deadline: float = 0,
+                 sleep: Callable[[float], None] = time.sleep):
+        self.max_attempts = max(1, int(max_attempts))
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.multiplier = multiplier
+        self.jitter = max(0.0, min(1.0, jitter))
+        self.deadline = deadline
+        self.sleep = sleep
+
+    @classmethod
+    def from_config(cls) -> 'RetryPolicy':
+        return cls(
+            max_attempts=CONFIG['RETRY_MAX_ATTEMPTS'],
+            base_delay=CONFIG['RETRY_BASE_DELAY'],
+            max_delay=CONFIG['RETRY_MAX_DELAY'],
+            jitter=CONFIG['RETRY_JITTER'],
+            deadline=CONFIG['RETRY_DEADLINE']
+        )
+
+    def compute_delay(self, attempt: int, error: Optional[Exception] = None) -> float:
+        """第 attempt 次失败后的等待时间，抖动比例为 jitter，服务端指定 Retry-After 时取较大值"""
+        delay = min(self.max_delay, self.base_delay * self.multiplier ** (attempt - 1))
+        delay *= 1 - self.jitter * random.random()
+        retry_after = error_retry_after(error) if error is not None else None
+        if retry_after:
+            delay = max(delay, min(retry_after, self.max_delay))
+        return delay
+
+    def attempts(self, on_retry: Optional[Callable[[AttemptRecord], None]] = None,
+                 records: Optional[List[AttemptRecord]] = None) -> '_RetryLoop':
+        """
+        生成一轮重试循环
+
+        Args:
+            on_retry: 每次失败且即将重试时调用，参数为本次尝试的记录
+            records: 传入列表时，每次尝试的记录（含耗时）都会追加到其中
+        """
+        return _RetryLoop(self, on_retry, records if records is not None else [])
+
+
+class _RetryLoop:
+    def __init__(self, policy: RetryPolicy, on_retry, records: List[AttemptRecord]):
+        self.policy = policy
+        self.on_retry = on_retry
+        self.records = records
+        self.started_at = None
+        self.done = False
+
+    def __iter__(self):
+        self.started_at = time.monotonic()
+        attempt = 0
+        while not self.done:
+            attempt += 1
+            yield _Attempt(self, attempt)
+
+
+class _Attempt:
+    def __init__(self, loop: _RetryLoop, number: int):
+        self.loop = loop
+        self.number = number
+        self.started_at = None
+
+    @property
+    def remaining(self) -> Optional[float]:
+        """距离总时长上限（deadline）还剩的秒数，未设置上限时为 None，调用方据此限制本次请求的超时"""
+        deadline = self.loop.policy.deadline
+        if not deadline:
+            return None
+        return max(0.0, deadline - (time.monotonic() - self.loop.started_at))
+
+    def __enter__(self):
+        self.started_at = time.monotonic()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        delay = self._finish(exc)
+        if delay is None:
+            return False
+        self.loop.policy.sleep(delay)
+        return True
+
+    async def __aenter__(self):
+        return self.__enter__()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        delay = self._finish(exc)
+        if delay is None:
+            return False
+        await asyncio.sleep(delay)
+        return True
+
+    def _finish(self, exc) -> Optional[float]:
+        """记录本次尝试，返回重试前要等待的秒数，不再重试时返回 None"""
+        loop = self.loop
+        policy = loop.policy
+        latency = time.monotonic() - self.started_at
+
+        if exc is None:
+            loop.records.append(AttemptRecord(self.number, latency))
+            loop.done = True
+            return None
+        if not isinstance(exc, Exception):
+            # GeneratorExit / KeyboardInterrupt / 协程取消等直接向上传递
+            loop.done = True
+            return None
+
+        category = classify_error(exc)
+        record = AttemptRecord(self.number, latency, str(exc), category)
+        loop.records.append(record)
+
+        if category == FATAL:
+            loop.done = True
+            return None
+
+        delay = policy.compute_delay(self.number, exc)
+        elapsed = time.monotonic() - loop.started_at
+        out_of_time = policy.deadline and elapsed + delay > policy.deadline
+        if self.number >= policy.max_attempts or out_of_time:
+            loop.done = True
+            raise RetryExhaustedError(
+                f"API调用失败，已重试{self.number}次: {str(exc)}", self.number, exc
+            ) from exc
+
+        record.delay = delay
+        if loop.on_retry:
+            loop.on_retry(record)
+        return delay
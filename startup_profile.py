@@ -0,0 +1,128 @@
+"""
+启动导入耗时分析
+
+用 `python -X importtime` 在子进程中导入指定模块，汇总各模块的累计导入耗时，
+便于在每次发布前对比启动性能是否退化:
+
+    python startup_profile.py                      # 分析 main 模块
+    python startup_profile.py --module cli --top 30
+    python startup_profile.py --json startup.json  # 保存报告，便于与历史版本对比
+    python main.py --profile-imports               # 等价于分析 main 模块
+"""
+import sys
+import json
+import time
+import argparse
+import subprocess
+from typing import Dict, List
+
+from config import VERSION
+
+
+def parse_importtime(output: str) -> List[Dict]:
+    """
+    解析 -X importtime 的输出
+
+    Returns:
+        list: 每个模块一项，包含 module、self_us、cumulative_us、depth（缩进层级）
+    """
+    records = []
+    for line in output.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        parts = line[len('import time:'):].split('|')
+        if len(parts) != 3:
+            continue
+        try:
+            self_us = int(parts[0].strip())
+            cumulative_us = int(parts[1].strip())
+        except ValueError:
+            continue
+        raw_name = parts[2].rstrip()
+        stripped = raw_name.lstrip()
+        records.append({
+            'module': stripped,
+            'self_us': self_us,
+            'cumulative_us': cumulative_us,
+            'depth': (len(raw_name) - len(stripped) - 1) // 2
+        })
+    return records
+
+
+def profile_imports(module: str = 'main') -> Dict:
+    """
+    在子进程中导入模块并收集导入耗时
+
+    Returns:
+        dict: 包含总耗时、墙钟时间和各模块明细的报告
+    """
+    if getattr(sys, 'frozen', False):
+        raise RuntimeError("打包后的程序不支持 -X importtime，请在源码环境中运行")
+
+    started_at = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        capture_output=True,
+        text=True,
+        encoding='utf-8',
+        errors='replace'
+    )
+    wall_time = time.perf_counter() - started_at
+
+    records = parse_importtime(result.stderr)
+    top_level = [r for r in records if r['depth'] == 0]
+    return {
+        'version': VERSION,
+        'module': module,
+        'python': sys.version.split()[0],
+        'returncode': result.returncode,
+        'wall_time_s': round(wall_time, 4),
+        'total_import_us': sum(r['cumulative_us'] for r in top_level),
+        'modules': records,
+        'error': result.stderr.strip().splitlines()[-1] if result.returncode else None
+    }
+
+
+def format_report(report: Dict, top: int = 20) -> str:
+    """生成按累计耗时排序的文本摘要"""
+    lines = [
+        f"CourseForge v{report['version']} 导入耗时（模块 {report['module']}，Python {report['python']}）",
+        f"子进程总用时: {report['wall_time_s'] * 1000:.1f} ms，"
+        f"顶层导入合计: {report['total_import_us'] / 1000:.1f} ms",
+    ]
+    if report['error']:
+        lines.append(f"导入失败: {report['error']}")
+
+    lines.append(f"{'累计(ms)':>10} {'自身(ms)':>10}  模块")
+    heaviest = sorted(report['modules'], key=lambda r: r['cumulative_us'], reverse=True)[:top]
+    for record in heaviest:
+        lines.append(
+            f"{record['cumulative_us'] / 1000:>10.1f} {record['self_us'] / 1000:>10.1f}  "
+            f"{'  ' * record['depth']}{record['module']}"
+        )
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='启动导入耗时分析')
+    parser.add_argument('--module', default='main', help='要分析的模块，默认 main')
+    parser.add_argument('--top', type=int, default=20, help='显示耗时最多的前 N 个模块')
+    parser.add_argument('--json', help='把完整报告保存为 JSON 文件')
+    args = parser.parse_args(argv)
+
+    try:
+        report = profile_imports(args.module)
+    except RuntimeError as e:
+        print(str(e), file=sys.stderr)
+        return 2
+
+    print(format_report(report, args.top))
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"报告已保存到: {args.json}")
+    return 1 if report['returncode'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,151 @@
+"""
+测试公共设施
+
+StubClient 与 SDK 客户端一样通过 chat.completions.create 调用，在进程内按提示词返回
+mock_llm_server 生成的大纲或小节内容，不发出网络请求；可以按顺序注入错误和延迟。
+每个测试使用独立的配置副本和全局单例（限流器、响应缓存、对冲策略、指标）。
+"""
+import os
+import sys
+import time
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from config import CONFIG  # noqa: E402
+from mock_llm_server import MockSettings, build_reply  # noqa: E402
+
+
+class StubCompletions:
+    def __init__(self, client):
+        self.client = client
+
+    def create(self, **params):
+        return self.client.create(**params)
+
+
+class StubClient:
+    """
+    进程内的模拟客户端
+
+    Args:
+        errors: 依次抛出的异常，用完后正常返回
+        latency: 每次请求的耗时（秒），可以是函数，参数为本次请求的参数
+        reply: 生成回复内容的函数，参数为消息列表，默认使用 mock_llm_server.build_reply
+    """
+
+    def __init__(self, errors=None, latency=0.0, reply=None):
+        self.errors = list(errors or [])
+        self.latency = latency
+        self.reply = reply or (lambda messages: build_reply(messages, MockSettings(seed=1)))
+        self.calls = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+        self.chat = SimpleNamespace(completions=StubCompletions(self))
+
+    @property
+    def prompts(self):
+        return [params['messages'][-1]['content'] for params in self.calls]
+
+    def create(self, **params):
+        with self._lock:
+            self.calls.append(params)
+            error = self.errors.pop(0) if self.errors else None
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            latency = self.latency(params) if callable(self.latency) else self.latency
+            if latency:
+                time.sleep(latency)
+            if error is not None:
+                raise error
+            content = self.reply(params['messages'])
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+        if params.get('stream'):
+            return iter([_chunk(content[i:i + 50]) for i in range(0, len(content), 50)])
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content=content))],
+            usage=SimpleNamespace(prompt_tokens=10, completion_tokens=len(content), total_tokens=10 + len(content))
+        )
+
+
+def _chunk(text):
+    return SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=text))], usage=None)
+
+
+class StatusError(Exception):
+    """带 HTTP 状态码的错误，用于测试错误分类"""
+
+    def __init__(self, status_code, message='', headers=None):
+        super().__init__(message or f"HTTP {status_code}")
+        self.status_code = status_code
+        self.response = SimpleNamespace(status_code=status_code, headers=headers or {})
+
+
+class RecordingLog:
+    """代替主窗口收集日志"""
+
+    def __init__(self):
+        self.messages = []
+
+    def log_message(self, message):
+        self.messages.append(message)
+
+
+@pytest.fixture(autouse=True)
+def isolated_config(tmp_path, monkeypatch):
+    """每个测试使用临时目录、关闭缓存和限流、缩短重试等待，并重置全局单例"""
+    import file_writer
+    import hedging
+    import metrics
+    import rate_limiter
+    import response_cache
+
+    overrides = {
+        'CACHE_ENABLED': False,
+        'CACHE_PATH': str(tmp_path / 'cache' / 'response_cache.db'),
+        'METRICS_ENABLED': False,
+        'RATE_LIMIT_RPM': 0,
+        'RATE_LIMIT_TPM': 0,
+        'RETRY_BASE_DELAY': 0.01,
+        'RETRY_MAX_DELAY': 0.05,
+        'RETRY_JITTER': 0.0,
+        'HEDGE_ENABLED': False,
+        'FILE_FSYNC': False,
+        'FILE_WRITE_LINGER': 0.0,
+        'BATCH_DIR': str(tmp_path / 'batches'),
+        'LOG_DIR': str(tmp_path / 'logs'),
+        'PROVIDERS': None,
+        'PROVIDERS_FILE': None,
+        'BUNDLE_PATH': None,
+        'OUTPUT_FORMAT': 'files',
+        'HTTP_BACKEND': 'sdk',
+    }
+    for key, value in overrides.items():
+        monkeypatch.setitem(CONFIG, key, value)
+    monkeypatch.setattr(rate_limiter, '_limiter', None)
+    monkeypatch.setattr(response_cache, '_cache', None)
+    monkeypatch.setattr(hedging, '_policy', None)
+    monkeypatch.setattr(file_writer, '_writer', None)
+    metrics.reset_metrics()
+    yield
+
+
+@pytest.fixture
+def course_dir(tmp_path):
+    path = tmp_path / '测试课程'
+    path.mkdir()
+    return str(path)
+
+
+@pytest.fixture
+def log():
+    return RecordingLog()
@@ -0,0 +1,130 @@
+import pytest
+
+from config import CONFIG
+from conftest import StatusError, StubClient
+from api_client import chat_with_moonshot, stream_with_moonshot
+from metrics import get_metrics
+from provider_pool import Provider, ProviderPool
+from retry_policy import NonRetryableError, RetryExhaustedError
+
+
+def test_chat_retries_retryable_errors(log):
+    client = StubClient(errors=[StatusError(500), StatusError(429)])
+    assert chat_with_moonshot(client, '请为[1.1 起源]制作课程PPT', window=log).startswith('# PPT内容')
+    assert len(client.calls) == 3
+    assert sum('重试' in message for message in log.messages) == 2
+
+
+def test_chat_gives_up_after_max_attempts(monkeypatch):
+    monkeypatch.setitem(CONFIG, 'RETRY_MAX_ATTEMPTS', 2)
+    client = StubClient(errors=[StatusError(500)] * 5)
+    with pytest.raises(RetryExhaustedError):
+        chat_with_moonshot(client, '提示词')
+    assert len(client.calls) == 2
+
+
+def test_programming_errors_are_not_retried():
+    client = StubClient(errors=[ImportError("No module named 'httpx'")])
+    with pytest.raises(ImportError):
+        chat_with_moonshot(client, '提示词')
+    assert len(client.calls) == 1
+
+
+def test_messages_put_system_prefix_first():
+    client = StubClient()
+    history = [{'role': 'system', 'content': '本章大纲'}, {'role': 'user', 'content': '上一节'}]
+    chat_with_moonshot(client, '本节', history=history, system='固定说明')
+    messages = client.calls[0]['messages']
+    assert messages[0] == {'role': 'system', 'content': '固定说明\n\n本章大纲'}
+    assert [m['content'] for m in messages[1:]] == ['上一节', '本节']
+
+
+def test_response_cache_skips_repeated_requests(monkeypatch):
+    monkeypatch.setitem(CONFIG, 'CACHE_ENABLED', True)
+    monkeypatch.setitem(CONFIG, 'METRICS_ENABLED', True)
+    client = StubClient()
+    first = chat_with_moonshot(client, '提示词', course='课程')
+    assert chat_with_moonshot(client, '提示词', course='课程') == first
+    assert len(client.calls) == 1
+    assert chat_with_moonshot(client, '提示词', use_cache=False) == first
+    assert len(client.calls) == 2
+    assert get_metrics().summary()['cache_hits'] == 1
+
+
+def test_attempt_timeout_is_capped_by_retry_deadline(monkeypatch):
+    monkeypatch.setitem(CONFIG, 'RETRY_DEADLINE', 2)
+    # SDK 等没有 default_timeout 的客户端只以剩余时间为上限
+    client = StubClient()
+    chat_with_moonshot(client, '提示词')
+    assert 0 < client.calls[0]['timeout'] <= 2
+
+    # 指定的 (连接, 读取) 超时按剩余时间截短
+    client = StubClient()
+    chat_with_moonshot(client, '提示词', timeout=(5, 30))
+    connect, read, write, pool = client.calls[0]['timeout']
+    assert connect <= 2 and read <= 2 and pool is None
+
+    # http_client 的客户端以默认超时为上限
+    client = StubClient()
+    client.default_timeout = (1, 300)
+    chat_with_moonshot(client, '提示词')
+    assert client.calls[0]['timeout'][0] == 1 and client.calls[0]['timeout'][1] <= 2
+
+    monkeypatch.setitem(CONFIG, 'RETRY_DEADLINE', 0)
+    client = StubClient()
+    chat_with_moonshot(client, '提示词')
+    assert 'timeout' not in client.calls[0]
+    chat_with_moonshot(client, '提示词', timeout=30)
+    assert client.calls[1]['timeout'] == (CONFIG['HTTP_CONNECT_TIMEOUT'], 30, CONFIG['HTTP_CONNECT_TIMEOUT'], None)
+
+
+def test_stream_retries_only_before_first_chunk():
+    client = StubClient(errors=[StatusError(500)])
+    content = ''.join(stream_with_moonshot(client, '请为[1.1 起源]制作课程PPT'))
+    assert content.startswith('# PPT内容')
+    assert len(client.calls) == 2
+
+    class BrokenStream(StubClient):
+        def create(self, **params):
+            chunks = super().create(**params)
+
+            def broken():
+                yield next(chunks)
+                raise StatusError(500)
+            return broken()
+
+    client = BrokenStream()
+    with pytest.raises(NonRetryableError):
+        list(stream_with_moonshot(client, '提示词'))
+    assert len(client.calls) == 1
+
+
+def test_chat_through_provider_pool_uses_pool_models():
+    default = StubClient(errors=[StatusError(500)] * 10)
+    other = StubClient()
+    pool = ProviderPool([
+        Provider('default', 'key', 'http://localhost', client=default),
+        Provider('other', 'key', 'http://localhost', model='glm-other', client=other),
+    ], cooldown=60, failure_threshold=1)
+    for _ in range(3):
+        assert chat_with_moonshot(pool, '提示词')
+    # 默认模型的接口失败后，重试时改选仍可用的接口的模型
+    assert len(default.calls) <= 1
+    assert all(call['model'] == 'glm-other' for call in other.calls)
+
+
+def test_hedged_chat_uses_faster_response(monkeypatch):
+    monkeypatch.setitem(CONFIG, 'HEDGE_ENABLED', True)
+    monkeypatch.setitem(CONFIG, 'HEDGE_MIN_SAMPLES', 3)
+    monkeypatch.setitem(CONFIG, 'HEDGE_MIN_DELAY', 0.05)
+    monkeypatch.setitem(CONFIG, 'HEDGE_BUDGET', 1.0)
+    client = StubClient()
+    for _ in range(3):
+        chat_with_moonshot(client, '提示词')
+
+    # 原请求很慢，对冲请求很快
+    slow = iter([0.5])
+    client.latency = lambda params: next(slow, 0.0)
+    calls = len(client.calls)
+    chat_with_moonshot(client, '提示词')
+    assert len(client.calls) == calls + 2
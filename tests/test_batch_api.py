@@ -0,0 +1,92 @@
+import json
+from types import SimpleNamespace
+
+from config import CONFIG
+from conftest import StubClient
+from batch_api import build_batch_file, run_batch
+from course_files import read_section_content
+from course_manifest import CourseManifest, STATUS_DONE
+from course_model import load_course
+from generation_engine import generate_course, generate_outline, generate_sections
+from metrics import get_metrics
+from provider_pool import Provider, ProviderPool
+
+
+class StubBatchClient(StubClient):
+    """在进程内“执行”上传的批处理文件，提交后立即完成"""
+
+    def __init__(self, **options):
+        super().__init__(**options)
+        self.uploads = {}
+        self.files = SimpleNamespace(create=self._upload, content=self._content)
+        self.batches = SimpleNamespace(create=self._create_batch, retrieve=self._retrieve, cancel=lambda batch_id: None)
+        self._batches = {}
+
+    def _upload(self, file, purpose):
+        file_id = f"file-{len(self.uploads)}"
+        self.uploads[file_id] = file.read().decode('utf-8')
+        return SimpleNamespace(id=file_id)
+
+    def _create_batch(self, input_file_id, **options):
+        lines = []
+        for line in self.uploads[input_file_id].splitlines():
+            request = json.loads(line)
+            response = self.create(**request['body'])
+            lines.append(json.dumps({'custom_id': request['custom_id'], 'response': {'status_code': 200, 'body': {
+                'choices': [{'message': {'content': response.choices[0].message.content}}],
+                'usage': {'prompt_tokens': 10, 'completion_tokens': 20}
+            }}}, ensure_ascii=False))
+        output_id = f"file-out-{len(self._batches)}"
+        self.uploads[output_id] = '\n'.join(lines)
+        batch = SimpleNamespace(id=f"batch-{len(self._batches)}", status='completed', output_file_id=output_id,
+                                error_file_id=None, request_counts=None)
+        self._batches[batch.id] = batch
+        return batch
+
+    def _retrieve(self, batch_id):
+        return self._batches[batch_id]
+
+    def _content(self, file_id):
+        return SimpleNamespace(content=self.uploads[file_id].encode('utf-8'))
+
+
+def test_run_batch_saves_sections_and_engine_resume_skips_them(course_dir):
+    client = StubBatchClient()
+    generate_outline(client, '瑜伽入门', '上班族', 2, 2, course_dir)
+    result = run_batch(client, [course_dir], poll_interval=0)
+    assert (result['submitted'], result['succeeded'], result['failed']) == (4, 4, 0)
+
+    course = load_course(course_dir)
+    manifest = CourseManifest(course_dir)
+    for section in course.sections:
+        assert manifest.get(section.title)['status'] == STATUS_DONE
+        assert read_section_content(section.title, course_dir).startswith('# PPT内容')
+
+    # 批处理生成的小节与逐节生成的提示词哈希相同，续跑时不再请求
+    calls = len(client.calls)
+    generate_sections(client, course.sections, course_dir)
+    assert len(client.calls) == calls
+
+
+def test_batch_skips_sections_generated_by_engine_with_provider_pool(course_dir, tmp_path):
+    pool = ProviderPool([
+        Provider('a', 'key', 'http://localhost', client=StubClient()),
+        Provider('b', 'key', 'http://localhost', model='glm-other', client=StubClient()),
+    ])
+    generate_course(pool, '瑜伽入门', '上班族', 2, 2, course_dir)
+    assert build_batch_file(pool, [course_dir], str(tmp_path / 'batch.jsonl')) == []
+    # 不传入接口池时模型不同，哈希不同，需要重新生成
+    assert len(build_batch_file(StubClient(), [course_dir], str(tmp_path / 'batch.jsonl'))) == 4
+
+
+def test_batch_results_are_not_counted_in_latency(course_dir, monkeypatch):
+    monkeypatch.setitem(CONFIG, 'METRICS_ENABLED', True)
+    client = StubBatchClient(latency=0.05)
+    generate_outline(client, '瑜伽入门', '上班族', 1, 2, course_dir)
+    run_batch(client, [course_dir], poll_interval=0)
+
+    summary = get_metrics().summary()
+    assert summary['api_calls'] == 1 + 2
+    # 只有大纲请求有耗时，批处理结果不把分位数拉向 0
+    assert summary['latency_p50_s'] >= 0.05
+    assert summary['prompt_tokens'] == 2 * 10 + 10
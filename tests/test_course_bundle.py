@@ -0,0 +1,76 @@
+import os
+
+from conftest import StubClient
+from course_bundle import CourseBundle, export_bundle, pack_course, restore_course
+from course_files import OUTLINE_FILENAME, read_section_content
+from course_manifest import CourseManifest
+from course_model import load_course
+from generation_engine import generate_course
+
+
+def _generate(course_dir, chapters=2, sections=2):
+    generate_course(StubClient(), '瑜伽入门', '上班族', chapters, sections, course_dir)
+    return load_course(course_dir)
+
+
+def test_pack_and_read_sections(course_dir):
+    course = _generate(course_dir)
+    path = pack_course(course_dir, remove_files=False)
+    assert path == course_dir + '.course.db'
+
+    bundle = CourseBundle(path)
+    try:
+        name = os.path.basename(course_dir)
+        assert bundle.courses()[0]['saved_sections'] == 4
+        first = course.sections[0]
+        assert bundle.get_section(name, first.index) == read_section_content(first.title, course_dir)
+        assert bundle.get_section(name, first.title) == bundle.get_section(name, 0)
+        assert [s['title'] for s in bundle.sections(name)] == [s.title for s in course.sections]
+        assert 'manifest.json' in bundle.files(name)
+    finally:
+        bundle.close()
+
+
+def test_pack_removes_only_packed_files(course_dir):
+    _generate(course_dir)
+    os.makedirs(os.path.join(course_dir, '素材'))
+    pack_course(course_dir)
+    # 子目录没有打包，保留课程目录和子目录
+    assert os.listdir(course_dir) == ['素材']
+
+    os.rmdir(os.path.join(course_dir, '素材'))
+    _generate(course_dir)
+    pack_course(course_dir)
+    assert not os.path.exists(course_dir)
+
+
+def test_incomplete_course_keeps_files(course_dir):
+    course = _generate(course_dir)
+    os.remove(CourseManifest(course_dir).get(course.sections[-1].title)['path'])
+    pack_course(course_dir)
+    assert os.path.exists(os.path.join(course_dir, OUTLINE_FILENAME))
+
+
+def test_restore_and_resume_without_api_calls(course_dir):
+    course = _generate(course_dir)
+    contents = {s.title: read_section_content(s.title, course_dir) for s in course.sections}
+    pack_course(course_dir)
+    assert not os.path.exists(course_dir)
+
+    assert restore_course(course_dir)
+    assert {s.title: read_section_content(s.title, course_dir) for s in course.sections} == contents
+    # 清单中的路径指向还原后的目录，续跑时全部跳过
+    client = StubClient()
+    generate_course(client, '瑜伽入门', '上班族', 2, 2, course_dir)
+    assert client.calls == []
+
+
+def test_binary_metadata_round_trips(course_dir, tmp_path):
+    _generate(course_dir)
+    with open(os.path.join(course_dir, 'cover.bin'), 'wb') as f:
+        f.write(bytes(range(256)))
+    path = pack_course(course_dir, bundle_path=str(tmp_path / 'all.course.db'))
+
+    exported = export_bundle(path, str(tmp_path / '导出'))
+    with open(os.path.join(exported[0], 'cover.bin'), 'rb') as f:
+        assert f.read() == bytes(range(256))
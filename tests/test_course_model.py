@@ -0,0 +1,83 @@
+import os
+import time
+
+from course_files import OUTLINE_FILENAME, save_outline
+from course_model import Course, load_course, model_path, parse_outline, render_outline
+
+STANDARD = """# 第一章 认识瑜伽
+## 1.1 瑜伽的起源
+## 1.2 瑜伽的流派
+# 第二章 基础体式
+## 2.1 山式
+## 2.2 树式
+"""
+
+
+def _structure(course):
+    return [(chapter.title, [section.title for section in chapter.sections]) for chapter in course.chapters]
+
+
+def test_parse_standard_outline():
+    course = parse_outline(STANDARD, '瑜伽入门', '上班族')
+    assert _structure(course) == [
+        ('第一章 认识瑜伽', ['1.1 瑜伽的起源', '1.2 瑜伽的流派']),
+        ('第二章 基础体式', ['2.1 山式', '2.2 树式']),
+    ]
+    assert [section.index for section in course.sections] == [0, 1, 2, 3]
+    assert [section.chapter for section in course.sections] == [0, 0, 1, 1]
+    assert course.chapters[1].number == '二'
+    assert course.sections[3].number == '2.2'
+
+
+def test_parse_tolerates_format_drift():
+    text = """```markdown
+# 瑜伽入门课程大纲
+## **第一章 认识瑜伽**
+### - 1.1 瑜伽的起源
+＃＃＃ 1.2 瑜伽的流派
+## 第二章 基础体式
+### 2.1 山式
+```"""
+    course = parse_outline(text)
+    assert _structure(course) == [
+        ('第一章 认识瑜伽', ['1.1 瑜伽的起源', '1.2 瑜伽的流派']),
+        ('第二章 基础体式', ['2.1 山式']),
+    ]
+
+
+def test_parse_lines_without_headings():
+    text = "第一章 认识瑜伽\n1.1 瑜伽的起源\n1.2 瑜伽的流派\n第二章 基础体式\n2.1 山式\n"
+    assert [len(chapter.sections) for chapter in parse_outline(text).chapters] == [2, 1]
+
+
+def test_single_heading_level_is_split_by_content():
+    text = "# 第一章 认识瑜伽\n# 1.1 瑜伽的起源\n# 1.2 瑜伽的流派\n"
+    assert _structure(parse_outline(text)) == [('第一章 认识瑜伽', ['1.1 瑜伽的起源', '1.2 瑜伽的流派'])]
+
+
+def test_sections_before_first_chapter_get_untitled_chapter():
+    course = parse_outline("## 1.1 开场\n# 第一章 正文\n## 1.2 内容\n")
+    assert _structure(course) == [('', ['1.1 开场']), ('第一章 正文', ['1.2 内容'])]
+
+
+def test_render_outline_round_trips():
+    course = parse_outline(STANDARD)
+    assert _structure(parse_outline(render_outline(course))) == _structure(course)
+
+
+def test_dict_round_trip():
+    course = parse_outline(STANDARD, '瑜伽入门', '上班族')
+    assert Course.from_dict(course.to_dict()) == course
+
+
+def test_load_course_caches_model_until_outline_changes(course_dir):
+    save_outline(STANDARD, course_dir)
+    course = load_course(course_dir, '瑜伽入门', '上班族')
+    assert os.path.exists(model_path(course_dir))
+    assert len(course.sections) == 4
+
+    # 大纲比课程结构文件新时重新解析
+    save_outline(STANDARD + "## 2.3 三角式\n", course_dir)
+    future = time.time() + 5
+    os.utime(os.path.join(course_dir, OUTLINE_FILENAME), (future, future))
+    assert len(load_course(course_dir).sections) == 5
@@ -0,0 +1,69 @@
+import os
+import threading
+
+import pytest
+
+from file_writer import FileWriter, atomic_write
+
+
+def test_atomic_write_replaces_file_without_leftovers(tmp_path):
+    path = str(tmp_path / 'a.txt')
+    assert atomic_write(path, '第一版', fsync=True) == len('第一版'.encode('utf-8'))
+    atomic_write(path, b'\x00\x01', fsync=False)
+    with open(path, 'rb') as f:
+        assert f.read() == b'\x00\x01'
+    assert os.listdir(tmp_path) == ['a.txt']
+
+
+def test_writes_are_batched_and_last_write_wins(tmp_path):
+    writer = FileWriter(batch_size=10, linger=0.05, fsync=False)
+    path = str(tmp_path / 'a.txt')
+    futures = [writer.write(path, f"版本{i}") for i in range(5)]
+    other = writer.write(str(tmp_path / 'b.txt'), '另一个文件')
+    assert writer.flush(timeout=5)
+
+    with open(path, 'r', encoding='utf-8') as f:
+        assert f.read() == '版本4'
+    # 被覆盖的写入与最后一次共享结果
+    assert {future.result() for future in futures} == {len('版本4'.encode('utf-8'))}
+    assert other.result() == len('另一个文件'.encode('utf-8'))
+    assert sorted(os.listdir(tmp_path)) == ['a.txt', 'b.txt']
+
+
+def test_callback_runs_before_future_completes(tmp_path):
+    writer = FileWriter(linger=0, fsync=False)
+    seen = []
+    future = writer.write(str(tmp_path / 'a.txt'), '内容', callback=lambda done: seen.append(done.result()))
+    assert future.result(timeout=5) == len('内容'.encode('utf-8'))
+    assert seen == [future.result()]
+
+
+def test_write_error_is_reported_on_future(tmp_path):
+    writer = FileWriter(linger=0, fsync=False)
+    errors = []
+    future = writer.write(str(tmp_path / 'missing' / 'a.txt'), '内容',
+                          callback=lambda done: errors.append(done.exception()))
+    with pytest.raises(OSError):
+        future.result(timeout=5)
+    assert isinstance(errors[0], OSError)
+
+
+def test_writer_survives_unexpected_errors(tmp_path, monkeypatch):
+    writer = FileWriter(linger=0, fsync=False)
+    original = writer._write_batch
+    failed = threading.Event()
+
+    def fail_once(jobs):
+        if not failed.is_set():
+            failed.set()
+            raise RuntimeError('意外错误')
+        original(jobs)
+
+    monkeypatch.setattr(writer, '_write_batch', fail_once)
+    first = writer.write(str(tmp_path / 'a.txt'), '第一次')
+    with pytest.raises(RuntimeError):
+        first.result(timeout=5)
+
+    second = writer.write(str(tmp_path / 'a.txt'), '第二次')
+    assert second.result(timeout=5) == len('第二次'.encode('utf-8'))
+    assert writer.flush(timeout=5)
@@ -0,0 +1,143 @@
+import os
+import json
+import random
+
+import pytest
+
+from config import CONFIG
+from conftest import StubClient, StatusError
+from course_files import OUTLINE_FILENAME, read_section_content
+from course_manifest import CourseManifest, MANIFEST_FILENAME, STATUS_DONE, STATUS_FAILED
+from course_model import load_course
+from generation_engine import (JobControl, GenerationCancelled, build_work_units, generate_course,
+                               generate_outline, generate_sections)
+from retry_policy import RetryExhaustedError
+
+
+def _outline(client, course_dir, chapters=2, sections=3):
+    generate_outline(client, '瑜伽入门', '上班族', chapters, sections, course_dir)
+    return load_course(course_dir)
+
+
+def test_generate_outline_saves_outline_and_model(course_dir):
+    client = StubClient()
+    course = _outline(client, course_dir, chapters=3, sections=2)
+    assert os.path.exists(os.path.join(course_dir, OUTLINE_FILENAME))
+    assert [len(chapter.sections) for chapter in course.chapters] == [2, 2, 2]
+    assert [section.index for section in course.sections] == list(range(6))
+    assert len(client.calls) == 1
+
+
+def test_build_work_units_follows_context_strategy(course_dir):
+    course = _outline(StubClient(), course_dir, chapters=2, sections=3)
+    independent = build_work_units(course.sections, 'chapter-outline')
+    assert [len(unit) for unit in independent] == [1] * 6
+    by_chapter = build_work_units(course.sections, 'previous-section')
+    assert [[section.chapter for _, section in unit] for unit in by_chapter] == [[0, 0, 0], [1, 1, 1]]
+    with pytest.raises(ValueError):
+        build_work_units(course.sections, 'unknown')
+
+
+@pytest.mark.parametrize('strategy', ['chapter-outline', 'previous-section'])
+def test_generate_sections_writes_every_section_and_reports_in_order(course_dir, strategy):
+    client = StubClient()
+    course = _outline(client, course_dir)
+    # 让后面的小节更快完成，检查进度仍按大纲顺序上报
+    client.latency = lambda params: random.uniform(0, 0.02)
+    progress = []
+    generate_sections(client, course.sections, course_dir, workers=4, context_strategy=strategy,
+                      progress=lambda done, total, title: progress.append((done, total, title)))
+
+    assert progress == [(i + 1, 6, section.title) for i, section in enumerate(course.sections)]
+    manifest = CourseManifest(course_dir)
+    for section in course.sections:
+        assert manifest.get(section.title)['status'] == STATUS_DONE
+        assert read_section_content(section.title, course_dir).startswith('# PPT内容')
+
+
+def test_generate_sections_respects_worker_limit(course_dir):
+    client = StubClient()
+    course = _outline(client, course_dir, chapters=4, sections=2)
+    client.latency = 0.02
+    generate_sections(client, course.sections, course_dir, workers=3)
+    assert 1 < client.max_in_flight <= 3
+
+
+def test_resume_skips_completed_sections(course_dir):
+    client = StubClient()
+    course = _outline(client, course_dir)
+    generate_sections(client, course.sections, course_dir)
+    calls = len(client.calls)
+
+    generate_sections(client, course.sections, course_dir)
+    assert len(client.calls) == calls
+
+    # 删掉一节的文件后只重新生成这一节
+    os.remove(CourseManifest(course_dir).get(course.sections[1].title)['path'])
+    generate_sections(client, course.sections, course_dir)
+    assert len(client.calls) == calls + 1
+
+
+def test_resume_hash_covers_context_messages(course_dir):
+    """上下文策略变化后实际发送的消息不同，已完成的小节需要重新生成"""
+    client = StubClient()
+    course = _outline(client, course_dir)
+    generate_sections(client, course.sections, course_dir, context_strategy='none')
+    calls = len(client.calls)
+
+    generate_sections(client, course.sections, course_dir, context_strategy='chapter-outline')
+    assert len(client.calls) == calls + len(course.sections)
+
+
+def test_no_resume_regenerates(course_dir):
+    client = StubClient()
+    course = _outline(client, course_dir)
+    generate_sections(client, course.sections, course_dir)
+    calls = len(client.calls)
+    generate_sections(client, course.sections, course_dir, resume=False)
+    assert len(client.calls) == calls + len(course.sections)
+
+
+def test_failed_section_is_recorded_and_raised(course_dir, monkeypatch):
+    monkeypatch.setitem(CONFIG, 'RETRY_MAX_ATTEMPTS', 2)
+    client = StubClient()
+    course = _outline(client, course_dir, chapters=1, sections=1)
+    client.errors = [StatusError(500), StatusError(500)]
+    with pytest.raises(RetryExhaustedError):
+        generate_sections(client, course.sections, course_dir)
+    assert CourseManifest(course_dir).get(course.sections[0].title)['status'] == STATUS_FAILED
+
+    # 再次运行时只重新生成失败的小节
+    generate_sections(client, course.sections, course_dir)
+    assert CourseManifest(course_dir).get(course.sections[0].title)['status'] == STATUS_DONE
+
+
+def test_cancelled_control_stops_generation(course_dir):
+    client = StubClient()
+    course = _outline(client, course_dir)
+    control = JobControl()
+    control.cancel()
+    with pytest.raises(GenerationCancelled):
+        generate_sections(client, course.sections, course_dir, control=control)
+    assert len(client.calls) == 1
+
+
+def test_generate_course_reuses_existing_outline(course_dir):
+    client = StubClient()
+    generate_course(client, '瑜伽入门', '上班族', 2, 2, course_dir)
+    assert len(client.calls) == 1 + 4
+    with open(os.path.join(course_dir, MANIFEST_FILENAME), 'r', encoding='utf-8') as f:
+        assert len(json.load(f)['sections']) == 4
+
+    generate_course(client, '瑜伽入门', '上班族', 2, 2, course_dir)
+    assert len(client.calls) == 5
+
+
+def test_stream_writes_sections(course_dir):
+    client = StubClient()
+    course = _outline(client, course_dir, chapters=1, sections=2)
+    generate_sections(client, course.sections, course_dir, stream=True)
+    assert all(call.get('stream') for call in client.calls[1:])
+    for section in course.sections:
+        assert read_section_content(section.title, course_dir).startswith('# PPT内容')
+        assert CourseManifest(course_dir).get(section.title)['status'] == STATUS_DONE
@@ -0,0 +1,141 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from hedging import HEDGE, HedgePolicy, HedgeSkipped
+
+
+def _policy(budget=1.0):
+    policy = HedgePolicy(pct=50, budget=budget, min_samples=3, window=10, min_delay=0.05)
+    for _ in range(3):
+        policy.record_latency(0.05)
+    return policy
+
+
+def _request(primary_latency, hedge_latency=0.0, queued=0.0, calls=None):
+    """模拟请求函数：原请求先排队 queued 秒再发出，发出后分别耗时 primary_latency / hedge_latency"""
+    def func(request):
+        if calls is not None:
+            calls.append(request.is_hedge)
+        if not request.is_hedge and queued:
+            time.sleep(queued)
+        request.mark_sent()
+        time.sleep(hedge_latency if request.is_hedge else primary_latency)
+        return 'hedge' if request.is_hedge else 'primary'
+    return func
+
+
+def test_no_hedge_without_enough_samples():
+    policy = HedgePolicy(pct=50, budget=1.0, min_samples=3, min_delay=0.01)
+    calls = []
+    assert policy.call(_request(0.01, calls=calls)) == ('primary', None)
+    assert calls == [False]
+
+
+def test_fast_primary_is_not_hedged():
+    calls = []
+    assert _policy().call(_request(0.0, calls=calls)) == ('primary', None)
+    assert calls == [False]
+
+
+def test_slow_primary_is_hedged_and_savings_recorded():
+    saved = []
+    done = threading.Event()
+    policy = _policy()
+
+    def on_saved(seconds):
+        saved.append(seconds)
+        done.set()
+
+    result = policy.call(_request(0.4, 0.01), on_saved=on_saved)
+    assert result == ('hedge', HEDGE)
+    assert policy.hedges == 1
+    # 被丢弃的原请求完成后才统计节省的时间
+    assert done.wait(2)
+    assert 0.2 < saved[0] < 0.4
+
+
+def test_hedge_timer_starts_when_primary_is_sent():
+    """在线程池中排队或等待限流的时间不计入对冲等待时间"""
+    calls = []
+    assert _policy().call(_request(0.01, queued=0.2, calls=calls)) == ('primary', None)
+    assert calls == [False]
+
+
+def test_budget_limits_hedges():
+    calls = []
+    policy = _policy(budget=0.0)
+    assert policy.call(_request(0.15, calls=calls)) == ('primary', None)
+    assert calls == [False]
+
+
+def test_skipped_hedge_refunds_budget():
+    policy = _policy()
+
+    def func(request):
+        if request.is_hedge:
+            raise HedgeSkipped("没有空闲配额")
+        request.mark_sent()
+        time.sleep(0.15)
+        return 'primary'
+
+    assert policy.call(func) == ('primary', None)
+    assert policy.hedges == 0
+
+
+def test_errors_surface_when_both_requests_fail():
+    def func(request):
+        request.mark_sent()
+        time.sleep(0.1 if not request.is_hedge else 0)
+        raise RuntimeError('hedge' if request.is_hedge else 'primary')
+
+    with pytest.raises(RuntimeError):
+        _policy().call(func)
+
+
+def test_async_hedge_cancels_slow_primary():
+    policy = _policy()
+    cancelled = []
+
+    def factory(request):
+        async def run():
+            request.mark_sent()
+            try:
+                await asyncio.sleep(0.01 if request.is_hedge else 1.0)
+            except asyncio.CancelledError:
+                cancelled.append(request.is_hedge)
+                raise
+            return 'hedge' if request.is_hedge else 'primary'
+        return run()
+
+    async def main():
+        started_at = time.perf_counter()
+        result = await policy.call_async(factory)
+        return result, time.perf_counter() - started_at
+
+    result, elapsed = asyncio.run(main())
+    assert result == ('hedge', HEDGE)
+    assert elapsed < 0.5
+    assert cancelled == [False]
+
+
+def test_async_hedge_records_savings_when_primary_finishes():
+    policy = _policy()
+    saved = []
+
+    def factory(request):
+        async def run():
+            request.mark_sent()
+            await asyncio.sleep(0.01 if request.is_hedge else 0.3)
+            return 'hedge' if request.is_hedge else 'primary'
+        return run()
+
+    async def main():
+        result = await policy.call_async(factory, on_saved=saved.append)
+        await asyncio.sleep(0.4)
+        return result
+
+    assert asyncio.run(main()) == ('hedge', HEDGE)
+    assert len(saved) == 1 and 0.1 < saved[0] < 0.3
@@ -0,0 +1,113 @@
+import os
+
+import pytest
+
+from config import CONFIG
+from conftest import StubClient
+from course_manifest import CourseManifest, STATUS_DONE
+from course_model import load_course
+from job_queue import DONE, FAILED, KIND_OUTLINE, KIND_UNIT, PENDING, RUNNING, JobQueue, JobScheduler
+
+
+@pytest.fixture
+def queue(tmp_path):
+    queue = JobQueue(str(tmp_path / 'jobs.db'))
+    yield queue
+    queue.close()
+
+
+def test_enqueue_claim_and_finish(queue, tmp_path):
+    job_id = queue.enqueue('瑜伽入门', '上班族', 2, 2, base_dir=str(tmp_path))
+    task = queue.claim_next()
+    assert task['job_id'] == job_id and task['kind'] == KIND_OUTLINE and task['attempts'] == 1
+    assert queue.jobs()[0]['status'] == RUNNING
+    assert queue.claim_next() is None
+
+    queue.finish_task(task)
+    assert queue.jobs()[0]['status'] == DONE
+    assert not queue.has_unfinished()
+
+
+def test_failed_task_marks_job_failed_until_recovered(queue):
+    queue.enqueue('瑜伽入门', '上班族', 2, 2)
+    queue.finish_task(queue.claim_next(), '出错了')
+    job = queue.jobs()[0]
+    assert (job['status'], job['error']) == (FAILED, '出错了')
+
+    assert queue.recover() == 1
+    assert queue.jobs()[0]['status'] == PENDING
+    assert queue.claim_next()['attempts'] == 1
+
+
+def test_recover_requeues_interrupted_tasks(tmp_path):
+    path = str(tmp_path / 'jobs.db')
+    queue = JobQueue(path)
+    queue.enqueue('瑜伽入门', '上班族', 2, 2)
+    queue.claim_next()
+    queue.close()
+
+    # 重新打开队列（模拟程序中断后重启）
+    queue = JobQueue(path)
+    try:
+        assert queue.recover(retry_failed=False) == 1
+        assert queue.claim_next() is not None
+    finally:
+        queue.close()
+
+
+def test_subtasks_are_added_when_outline_task_finishes(queue):
+    queue.enqueue('瑜伽入门', '上班族', 2, 2)
+    queue.claim_next()
+    # 大纲任务执行中程序中断，重新执行时不会留下上一次拆分出的任务
+    assert queue.recover(retry_failed=False) == 1
+    task = queue.claim_next()
+    queue.finish_task(task, subtasks=[(KIND_UNIT, [0, 1]), (KIND_UNIT, [2, 3])])
+    assert [queue.claim_next()['payload'] for _ in range(2)] == [[0, 1], [2, 3]]
+    assert queue.claim_next() is None
+
+
+def test_failed_task_does_not_add_subtasks(queue):
+    queue.enqueue('瑜伽入门', '上班族', 2, 2)
+    queue.finish_task(queue.claim_next(), '出错了', subtasks=[(KIND_UNIT, [0])])
+    assert queue.recover() == 1
+    assert queue.claim_next()['kind'] == KIND_OUTLINE
+    assert queue.claim_next() is None
+
+
+def test_priority_then_fairness(queue):
+    low = queue.enqueue('低优先级', '上班族', 1, 1, priority=0)
+    high = queue.enqueue('高优先级', '上班族', 1, 1, priority=5)
+    assert queue.claim_next()['job_id'] == high
+    assert queue.claim_next()['job_id'] == low
+
+
+def test_find_job_matches_title_and_base_dir(queue, tmp_path):
+    job_id = queue.enqueue('瑜伽入门', '上班族', 2, 2, base_dir=str(tmp_path))
+    assert queue.find_job('瑜伽入门', str(tmp_path))['id'] == job_id
+    assert queue.find_job('瑜伽入门', str(tmp_path / '其他')) is None
+    assert queue.find_job('瑜伽入门') is None
+    no_base = queue.enqueue('瑜伽入门', '上班族', 2, 2)
+    assert queue.find_job('瑜伽入门')['id'] == no_base
+
+
+def test_scheduler_generates_all_courses(queue, tmp_path):
+    client = StubClient()
+    for title in ('瑜伽入门', '茶艺'):
+        queue.enqueue(title, '上班族', 2, 2, base_dir=str(tmp_path))
+    jobs = JobScheduler(queue, client, workers=3).run()
+
+    assert [job['status'] for job in jobs] == [DONE, DONE]
+    assert len(client.calls) == 2 * (1 + 4)
+    for job in jobs:
+        manifest = CourseManifest(job['course_dir'])
+        for section in load_course(job['course_dir']).sections:
+            assert manifest.get(section.title)['status'] == STATUS_DONE
+            assert os.path.exists(manifest.get(section.title)['path'])
+
+
+def test_scheduler_retries_failed_tasks(queue, tmp_path, monkeypatch):
+    monkeypatch.setitem(CONFIG, 'RETRY_MAX_ATTEMPTS', 1)
+    client = StubClient(errors=[RuntimeError('大纲请求失败')])
+    queue.enqueue('瑜伽入门', '上班族', 1, 2, base_dir=str(tmp_path))
+    jobs = JobScheduler(queue, client, workers=1, max_task_attempts=2).run()
+    assert jobs[0]['status'] == DONE
@@ -0,0 +1,47 @@
+import subprocess
+import sys
+import urllib.request
+
+from conftest import ROOT
+from metrics import MetricsRegistry, percentile, serve_prometheus
+
+
+def test_percentile():
+    assert percentile([], 50) is None
+    assert percentile([3, 1, 2], 50) == 2
+    assert percentile(list(range(1, 101)), 95) == 95
+
+
+def test_summary_counts_calls_tokens_and_cache_hits():
+    metrics = MetricsRegistry()
+    usage = {'prompt_tokens': 100, 'completion_tokens': 50, 'prompt_tokens_details': {'cached_tokens': 40}}
+    metrics.record_call('课程', 1.0, attempts=2, usage=usage)
+    metrics.record_call('课程', 3.0, usage=usage)
+    metrics.record_call('课程', 0.0, cache_hit=True)
+    metrics.record_call('课程', 9.0, error='超时')
+    summary = metrics.summary('课程')
+    assert (summary['calls'], summary['api_calls'], summary['cache_hits']) == (4, 3, 1)
+    assert (summary['errors'], summary['retries']) == (1, 1)
+    assert summary['prefix_cache_hit_rate'] == 0.4
+    # 失败的调用不计入耗时
+    assert summary['latency_max_s'] == 3.0
+
+
+def test_prometheus_endpoint(monkeypatch):
+    import metrics
+    registry = MetricsRegistry()
+    registry.record_call('课程', 1.5)
+    monkeypatch.setattr(metrics, '_registry', registry)
+    server = serve_prometheus(0)
+    try:
+        with urllib.request.urlopen(f"http://127.0.0.1:{server.server_address[1]}/metrics") as response:
+            body = response.read().decode('utf-8')
+    finally:
+        server.shutdown()
+    assert 'courseforge_calls_total{course="课程"} 1' in body
+
+
+def test_import_does_not_load_http_server():
+    code = "import sys, metrics; print('http.server' in sys.modules)"
+    result = subprocess.run([sys.executable, '-c', code], cwd=ROOT, capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == 'False'
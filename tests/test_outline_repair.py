@@ -0,0 +1,61 @@
+from conftest import StubClient
+from course_model import parse_outline
+from mock_llm_server import build_outline
+from outline_repair import repair_outline, trim_outline, validate_outline
+
+
+def _outline(chapters, sections):
+    return parse_outline(build_outline(f"共{chapters}章，每章{sections}节"), '瑜伽入门', '上班族')
+
+
+def test_validate_outline_reports_differences():
+    course = _outline(2, 3)
+    del course.chapters[0].sections[2]
+    issues = validate_outline(course, 3, 2)
+    assert issues.missing_chapters == 1
+    assert issues.long_chapters == [(1, 1)]
+    assert issues.short_chapters == []
+    assert not issues.ok
+    assert validate_outline(_outline(2, 2), 2, 2).ok
+
+
+def test_trim_outline_removes_extra_chapters_and_sections():
+    course = _outline(3, 3)
+    assert trim_outline(course, 2, 2) == 3 + 2
+    assert [len(chapter.sections) for chapter in course.chapters] == [2, 2]
+    assert [section.index for section in course.sections] == [0, 1, 2, 3]
+
+
+def test_repair_adds_missing_chapters_and_sections_with_small_prompts():
+    client = StubClient()
+    course = _outline(2, 3)
+    del course.chapters[1]
+    del course.chapters[0].sections[2]
+    course.reindex()
+
+    assert repair_outline(client, course, 2, 3, rounds=2)
+    assert validate_outline(course, 2, 3).ok
+    assert [section.index for section in course.sections] == list(range(6))
+    assert [section.chapter for section in course.sections] == [0, 0, 0, 1, 1, 1]
+    # 只请求缺失的部分，不重新生成整份大纲
+    assert len(client.calls) == 2
+    assert all('已有大纲' in prompt for prompt in client.prompts)
+
+
+def test_repair_without_rounds_only_trims():
+    client = StubClient()
+    course = _outline(3, 3)
+    del course.chapters[0].sections[0]
+    course.reindex()
+
+    # 多出的第三章被删掉，第一章缺少的一节不补充
+    assert repair_outline(client, course, 2, 3, rounds=0)
+    assert client.calls == []
+    assert len(course.chapters) == 2
+    assert validate_outline(course, 2, 3).short_chapters == [(0, 1)]
+
+
+def test_complete_outline_is_unchanged():
+    client = StubClient()
+    assert not repair_outline(client, _outline(2, 2), 2, 2)
+    assert client.calls == []
@@ -0,0 +1,153 @@
+import threading
+
+import pytest
+
+from config import CONFIG
+from conftest import StatusError, StubClient
+from provider_pool import NoProviderError, Provider, ProviderPool, load_providers
+from rate_limiter import RateLimiter
+
+MESSAGES = [{'role': 'user', 'content': '请为[1.1 起源]制作课程PPT'}]
+
+
+def _provider(name, client, model=None, weight=1, limiter=None):
+    return Provider(name=name, api_key='key', base_url='http://localhost', model=model, weight=weight,
+                    client=client, limiter=limiter)
+
+
+def _pool(*providers, **options):
+    options.setdefault('cooldown', 60)
+    options.setdefault('failure_threshold', 1)
+    return ProviderPool(list(providers), **options)
+
+
+def test_weighted_routing_spreads_requests_by_weight():
+    clients = [StubClient(), StubClient()]
+    pool = _pool(_provider('a', clients[0], weight=3), _provider('b', clients[1], weight=1))
+    for _ in range(8):
+        pool.chat.completions.create(model=CONFIG['MODEL'], messages=MESSAGES)
+    assert [len(client.calls) for client in clients] == [6, 2]
+
+
+def test_failover_and_cooldown():
+    bad = StubClient(errors=[StatusError(500)] * 10)
+    good = StubClient()
+    pool = _pool(_provider('bad', bad), _provider('good', good))
+
+    for _ in range(3):
+        response = pool.chat.completions.create(model=CONFIG['MODEL'], messages=MESSAGES)
+        assert response.choices[0].message.content
+    # 失败后进入冷却，之后的请求不再发给它
+    assert len(bad.calls) == 1
+    assert len(good.calls) == 3
+    status = {item['name']: item for item in pool.status()}
+    assert not status['bad']['healthy'] and status['bad']['failovers'] == 1
+    assert all(item['outstanding'] == 0 for item in status.values())
+
+
+def test_request_errors_are_not_failed_over():
+    bad = StubClient(errors=[StatusError(400)])
+    good = StubClient()
+    pool = _pool(_provider('bad', bad, weight=10), _provider('good', good))
+    with pytest.raises(StatusError):
+        pool.chat.completions.create(model=CONFIG['MODEL'], messages=MESSAGES)
+    assert good.calls == []
+
+
+def test_all_providers_failing_raises_last_error():
+    pool = _pool(_provider('a', StubClient(errors=[StatusError(500)])),
+                 _provider('b', StubClient(errors=[StatusError(503)])))
+    with pytest.raises(StatusError):
+        pool.chat.completions.create(model=CONFIG['MODEL'], messages=MESSAGES)
+
+
+def test_failover_stops_when_timeout_budget_is_used_up():
+    slow = StubClient(errors=[StatusError(500)], latency=0.2)
+    good = StubClient()
+    pool = _pool(_provider('slow', slow, weight=10), _provider('good', good))
+    with pytest.raises(StatusError):
+        pool.chat.completions.create(model=CONFIG['MODEL'], messages=MESSAGES, timeout=0.1)
+    assert good.calls == []
+
+
+def test_failover_shortens_timeout_to_remaining_budget():
+    slow = StubClient(errors=[StatusError(500)], latency=0.2)
+    good = StubClient()
+    pool = _pool(_provider('slow', slow, weight=10), _provider('good', good))
+    pool.chat.completions.create(model=CONFIG['MODEL'], messages=MESSAGES, timeout=(1, 5, 1, None))
+    connect, read, write, limit = good.calls[0]['timeout']
+    assert connect == 1 and read < 4.9 and limit is None
+
+
+def test_stats_are_consistent_under_concurrency():
+    clients = [StubClient(errors=[StatusError(500)] * 200), StubClient()]
+    pool = _pool(_provider('a', clients[0]), _provider('b', clients[1]), failure_threshold=10 ** 6)
+
+    def work():
+        for _ in range(50):
+            pool.chat.completions.create(model=CONFIG['MODEL'], messages=MESSAGES)
+
+    threads = [threading.Thread(target=work) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    status = {item['name']: item for item in pool.status()}
+    assert status['a']['requests'] + status['b']['requests'] == 400 + status['a']['failovers']
+    assert status['a']['errors'] == len(clients[0].calls) == status['a']['failovers']
+    assert status['b']['requests'] == len(clients[1].calls) == 400
+
+
+def test_model_override_and_failover_within_model_group():
+    default = StubClient(errors=[StatusError(500)])
+    other = StubClient()
+    pool = _pool(_provider('default', default), _provider('other', other, model='glm-other'))
+    assert pool.models == sorted([CONFIG['MODEL'], 'glm-other'])
+
+    # 使用默认模型的请求不会切换到使用其他模型的接口
+    with pytest.raises(StatusError):
+        pool.chat.completions.create(model=CONFIG['MODEL'], messages=MESSAGES)
+    assert other.calls == []
+
+    pool.chat.completions.create(model='glm-other', messages=MESSAGES)
+    assert other.calls[0]['model'] == 'glm-other'
+    # 默认模型的接口在冷却中，选择模型时优先选择可用的接口
+    assert pool.choose_model() == 'glm-other'
+
+
+def test_stream_holds_provider_slot_until_finished():
+    limiter = RateLimiter(max_concurrency=1, initial_concurrency=1)
+    provider = _provider('a', StubClient(), limiter=limiter)
+    pool = _pool(provider)
+    chunks = pool.chat.completions.create(model=CONFIG['MODEL'], messages=MESSAGES, stream=True)
+    next(chunks)
+    assert provider.outstanding == 1
+    assert limiter.concurrency.in_flight == 1
+    list(chunks)
+    assert provider.outstanding == 0
+    assert limiter.concurrency.in_flight == 0
+
+
+def test_closed_stream_releases_slot():
+    limiter = RateLimiter(max_concurrency=1, initial_concurrency=1)
+    provider = _provider('a', StubClient(), limiter=limiter)
+    chunks = _pool(provider).chat.completions.create(model=CONFIG['MODEL'], messages=MESSAGES, stream=True)
+    next(chunks)
+    chunks.close()
+    assert provider.outstanding == 0
+    assert limiter.concurrency.in_flight == 0
+
+
+def test_load_providers(monkeypatch):
+    monkeypatch.setenv('COURSEFORGE_TEST_KEY', 'from-env')
+    providers = load_providers([
+        {'name': 'main', 'api_key': 'k1', 'weight': 2, 'rpm': 60},
+        {'api_key_env': 'COURSEFORGE_TEST_KEY', 'model': 'glm-other'},
+    ])
+    assert [p.name for p in providers] == ['main', 'provider-2']
+    assert providers[0].limiter is not None and providers[1].limiter is None
+    assert providers[1].api_key == 'from-env'
+    with pytest.raises(ValueError):
+        load_providers([{'name': 'no-key'}])
+    with pytest.raises(NoProviderError):
+        ProviderPool([])
@@ -0,0 +1,146 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from conftest import StatusError
+from rate_limiter import AdaptiveConcurrency, RateLimiter, TokenBucket, is_throttle_error
+
+
+def test_token_bucket_reports_wait_when_empty():
+    bucket = TokenBucket(60)  # 每秒补充 1 个
+    assert bucket.try_acquire(60) == 0
+    delay = bucket.try_acquire(1)
+    assert 0.9 < delay <= 1.0
+    bucket.adjust(5)
+    assert bucket.try_acquire(5) == 0
+
+
+def test_token_bucket_caps_request_at_capacity():
+    bucket = TokenBucket(10)
+    # 超过容量的请求按容量计算，不会永远等不到
+    assert bucket.try_acquire(100) == 0
+
+
+def test_is_throttle_error():
+    assert is_throttle_error(StatusError(429))
+    assert not is_throttle_error(StatusError(500))
+
+    class RateLimitError(Exception):
+        pass
+    assert is_throttle_error(RateLimitError('请求过于频繁'))
+    assert is_throttle_error(TimeoutError())
+    # 错误信息中恰好出现 429 不算限流
+    assert not is_throttle_error(StatusError(400, '输入共 4290 个 token，超出上限'))
+    assert not is_throttle_error(ValueError('/tmp/run-429/section.txt'))
+
+
+def test_adaptive_concurrency_aimd():
+    concurrency = AdaptiveConcurrency(1, 8, initial=8)
+    concurrency.on_throttle()
+    assert concurrency.limit == 4
+    for _ in range(4):
+        concurrency.on_success()
+    assert 4.9 < concurrency.limit < 5.1
+    for _ in range(10):
+        concurrency.on_throttle()
+    assert concurrency.limit == 1
+
+
+def test_request_releases_slot_and_adjusts_limit():
+    limiter = RateLimiter(max_concurrency=4, initial_concurrency=4)
+    with limiter.request() as ticket:
+        assert limiter.concurrency.in_flight == 1
+        assert ticket is not None
+    assert limiter.concurrency.in_flight == 0
+
+    with pytest.raises(StatusError):
+        with limiter.request():
+            raise StatusError(429)
+    assert limiter.concurrency.in_flight == 0
+    assert limiter.concurrency.limit == 2
+
+
+def test_request_blocks_at_concurrency_limit():
+    limiter = RateLimiter(max_concurrency=2, initial_concurrency=2)
+    peak = []
+    lock = threading.Lock()
+    running = [0]
+
+    def work():
+        with limiter.request():
+            with lock:
+                running[0] += 1
+                peak.append(running[0])
+            time.sleep(0.02)
+            with lock:
+                running[0] -= 1
+
+    threads = [threading.Thread(target=work) for _ in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert max(peak) == 2
+
+
+def test_try_request_does_not_wait():
+    limiter = RateLimiter(max_concurrency=1, initial_concurrency=1)
+    with limiter.request():
+        assert limiter.try_request() is None
+    quota = limiter.try_request()
+    assert quota is not None
+    with quota:
+        assert limiter.concurrency.in_flight == 1
+    assert limiter.concurrency.in_flight == 0
+
+
+def test_try_request_respects_rpm():
+    limiter = RateLimiter(rpm=1, max_concurrency=4)
+    with limiter.request():
+        pass
+    assert limiter.try_request() is None
+    # 没有取到 RPM 配额时并发名额也已归还
+    assert limiter.concurrency.in_flight == 0
+
+
+def test_record_usage_returns_unused_tokens():
+    limiter = RateLimiter(tpm=1000)
+    with limiter.request(600) as ticket:
+        ticket.record_usage(type('Usage', (), {'total_tokens': 100})())
+    assert limiter.tpm_bucket.try_acquire(800) == 0
+
+
+def test_async_waiter_is_woken_by_thread_release():
+    limiter = RateLimiter(max_concurrency=1, initial_concurrency=1)
+    limiter.concurrency.acquire()
+
+    async def main():
+        threading.Timer(0.05, limiter.concurrency.release).start()
+        started_at = time.monotonic()
+        async with limiter.request_async():
+            waited = time.monotonic() - started_at
+        return waited
+
+    waited = asyncio.run(main())
+    assert 0.03 < waited < 1.0
+    assert limiter.concurrency.in_flight == 0
+
+
+def test_cancelled_async_waiter_passes_wakeup_on():
+    concurrency = AdaptiveConcurrency(1, 1)
+    concurrency.acquire()
+
+    async def main():
+        first = asyncio.ensure_future(concurrency.acquire_async())
+        second = asyncio.ensure_future(concurrency.acquire_async())
+        await asyncio.sleep(0.01)
+        # 名额先交给第一个等待者，它在醒来前被取消，名额应转给下一个
+        concurrency.release()
+        first.cancel()
+        await asyncio.wait_for(second, 1.0)
+        return first.cancelled()
+
+    assert asyncio.run(main())
+    assert concurrency.in_flight == 1
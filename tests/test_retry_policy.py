@@ -0,0 +1,103 @@
+import asyncio
+import time
+
+import pytest
+
+from conftest import StatusError
+from retry_policy import (FATAL, RETRYABLE, NonRetryableError, RetryExhaustedError, RetryPolicy,
+                          classify_error)
+
+
+def _run(policy, errors, on_retry=None, records=None):
+    """按顺序抛出 errors 中的异常，全部抛完后返回尝试次数"""
+    errors = list(errors)
+    calls = 0
+    for attempt in policy.attempts(on_retry=on_retry, records=records):
+        with attempt:
+            calls += 1
+            if errors:
+                raise errors.pop(0)
+    return calls
+
+
+def _policy(**options):
+    options.setdefault('sleep', lambda delay: None)
+    return RetryPolicy(base_delay=0.01, max_delay=0.05, jitter=0, **options)
+
+
+def test_classify_error():
+    assert classify_error(StatusError(500)) == RETRYABLE
+    assert classify_error(StatusError(429)) == RETRYABLE
+    assert classify_error(StatusError(401)) == FATAL
+    assert classify_error(NonRetryableError('stream broken')) == FATAL
+    # 无法识别的错误按可重试处理，程序错误不重试
+    assert classify_error(ConnectionResetError()) == RETRYABLE
+    assert classify_error(Exception('API返回为空')) == RETRYABLE
+    assert classify_error(ImportError("No module named 'httpx'")) == FATAL
+    assert classify_error(TypeError('unexpected keyword argument')) == FATAL
+    assert classify_error(KeyError('choices')) == FATAL
+
+
+def test_retries_until_success_and_records_attempts():
+    records = []
+    retried = []
+    calls = _run(_policy(max_attempts=3), [StatusError(500), StatusError(503)], retried.append, records)
+    assert calls == 3
+    assert [record.attempt for record in records] == [1, 2, 3]
+    assert [record.error for record in records] == ['HTTP 500', 'HTTP 503', None]
+    assert [record.attempt for record in retried] == [1, 2]
+
+
+def test_fatal_error_is_not_retried():
+    records = []
+    with pytest.raises(StatusError):
+        _run(_policy(max_attempts=5), [StatusError(400)], records=records)
+    assert len(records) == 1
+
+
+def test_exhausted_attempts_raise():
+    with pytest.raises(RetryExhaustedError) as info:
+        _run(_policy(max_attempts=2), [StatusError(500)] * 3)
+    assert info.value.attempts == 2
+    assert isinstance(info.value.last_error, StatusError)
+
+
+def test_delay_grows_exponentially_and_honours_retry_after():
+    policy = RetryPolicy(base_delay=1, max_delay=30, multiplier=2, jitter=0)
+    assert [policy.compute_delay(n) for n in (1, 2, 3)] == [1, 2, 4]
+    assert policy.compute_delay(10) == 30
+    assert policy.compute_delay(1, StatusError(429, headers={'retry-after': '7'})) == 7
+
+
+def test_deadline_stops_retrying_and_limits_remaining_time():
+    delays = []
+    policy = _policy(max_attempts=100, deadline=0.2, sleep=lambda delay: (delays.append(delay), time.sleep(delay)))
+    remaining = []
+    started_at = time.monotonic()
+    with pytest.raises(RetryExhaustedError):
+        for attempt in policy.attempts():
+            with attempt:
+                remaining.append(attempt.remaining)
+                raise StatusError(500)
+    assert time.monotonic() - started_at < 0.5
+    assert all(0 <= value <= 0.2 for value in remaining)
+    assert remaining == sorted(remaining, reverse=True)
+
+
+def test_remaining_is_none_without_deadline():
+    for attempt in _policy(deadline=0).attempts():
+        with attempt:
+            assert attempt.remaining is None
+
+
+def test_async_attempts_retry_without_blocking():
+    async def main():
+        calls = 0
+        for attempt in RetryPolicy(max_attempts=3, base_delay=0.01, jitter=0).attempts():
+            async with attempt:
+                calls += 1
+                if calls < 3:
+                    raise StatusError(502)
+        return calls
+
+    assert asyncio.run(main()) == 3
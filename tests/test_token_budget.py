@@ -0,0 +1,65 @@
+import pytest
+
+from token_budget import (HistoryManager, estimate_messages_tokens, estimate_request_tokens, estimate_tokens,
+                          extract_ppt_skeleton)
+
+CONTENT = """# PPT内容
+瑜伽的起源
+    古印度
+    现代发展
+
+# 授课台词
+同学们好，今天我们来了解瑜伽的起源。""" + '这是一段很长的台词。' * 50
+
+
+def test_estimate_tokens_counts_cjk_per_character():
+    assert estimate_tokens('') == 0
+    assert estimate_tokens('瑜伽入门') == 4
+    assert estimate_tokens('abcdefgh') == 2
+    assert estimate_tokens('瑜伽 yoga') == 2 + 2
+
+
+def test_estimate_request_tokens_includes_overhead_and_output():
+    messages = [{'role': 'user', 'content': '瑜伽'}, {'role': 'assistant', 'content': None}]
+    assert estimate_messages_tokens(messages) == 2 + 4 + 0 + 4
+    assert estimate_request_tokens(messages, 100) == 110
+
+
+def test_extract_ppt_skeleton():
+    skeleton = extract_ppt_skeleton(CONTENT)
+    assert skeleton.splitlines() == ['瑜伽的起源', '    古印度', '    现代发展']
+    # 没有 PPT 标题时取开头几行，并限制长度
+    assert extract_ppt_skeleton('第一行\n\n第二行') == '第一行\n第二行'
+    assert len(extract_ppt_skeleton('很长' * 500, max_chars=20)) == 20
+
+
+def test_summary_mode_sends_skeletons_and_counts_saved_tokens():
+    history = HistoryManager(budget=1000, mode='summary', max_turns=2)
+    history.add('1.1 起源', '很长的提示词模板' * 20, CONTENT)
+    history.add('1.2 流派', '很长的提示词模板' * 20, CONTENT)
+    messages = history.messages()
+    assert len(messages) == 1 and messages[0]['role'] == 'system'
+    assert '[1.1 起源]' in messages[0]['content'] and '[1.2 流派]' in messages[0]['content']
+    assert '台词' not in messages[0]['content']
+    assert history.tokens_saved > 0
+
+
+def test_full_mode_keeps_recent_turns_within_budget():
+    history = HistoryManager(budget=10000, mode='full', max_turns=1)
+    history.add('1.1 起源', '提示词', 'A' * 40)
+    history.add('1.2 流派', '提示词', 'B' * 40)
+    messages = history.messages()
+    assert [m['role'] for m in messages] == ['user', 'assistant']
+    assert messages[1]['content'] == 'B' * 40
+    assert '1.2 流派' in messages[0]['content']
+
+
+def test_budget_drops_turns_that_do_not_fit():
+    history = HistoryManager(budget=5, mode='full', max_turns=3)
+    history.add('1.1 起源', '提示词', CONTENT)
+    assert history.messages() == []
+
+
+def test_unknown_mode_is_rejected():
+    with pytest.raises(ValueError):
+        HistoryManager(mode='everything')
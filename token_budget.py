@@ -0,0 +1,123 @@
+import re
+from typing import Dict, List, Optional
+
+from config import CONFIG
+
+_CJK_RE = re.compile(r'[\u3000-\u303f\u3400-\u4dbf\u4e00-\u9fff\uff00-\uffef]')
+
+# 历史记录模式：full 为带上之前小节的完整内容，summary 为只带标题和 PPT 骨架
+HISTORY_MODES = ('full', 'summary')
+
+# 每条消息除内容外的固定开销（角色等）
+MESSAGE_OVERHEAD = 4
+
+
+def estimate_tokens(text: str) -> int:
+    """粗略估算文本的 token 数：中文按每字 1 个，其余按每 4 个字符 1 个"""
+    if not text:
+        return 0
+    cjk = len(_CJK_RE.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def estimate_messages_tokens(messages: List[Dict]) -> int:
+    """估算消息列表的输入 token 数"""
+    return sum(estimate_tokens(m.get('content') or '') + MESSAGE_OVERHEAD for m in messages)
+
+
+def estimate_request_tokens(messages: List[Dict], max_tokens: int) -> int:
+    """估算一次请求会占用的 token 配额（输入 + 最大输出）"""
+    return estimate_messages_tokens(messages) + max_tokens
+
+
+def extract_ppt_skeleton(content: str, max_chars: int = 300) -> str:
+    """
+    从小节内容中取出 PPT 骨架（“# PPT内容”到“# 授课台词”之间的部分）
+
+    找不到标题时取开头的几行，结果不超过 max_chars 个字符。
+    """
+    lines = []
+    in_ppt = False
+    for line in (content or '').splitlines():
+        heading = line.strip().lstrip('#').strip()
+        if line.lstrip().startswith('#') and 'PPT' in heading.upper():
+            in_ppt = True
+            continue
+        if line.lstrip().startswith('#') and in_ppt:
+            break
+        if in_ppt and line.strip():
+            lines.append(line.rstrip())
+    if not lines:
+        lines = [line.rstrip() for line in (content or '').splitlines() if line.strip()][:8]
+    return '\n'.join(lines)[:max_chars]
+
+
+class HistoryManager:
+    """
+    按 token 预算管理一组小节共享的对话历史
+
+    full 模式保留最近几节的完整问答（提问只保留节标题，不再重复整段提示词模板）；
+    summary 模式只用一条 system 消息列出之前小节的标题和 PPT 骨架。
+    两种模式都从最近的一节往前取，直到用完 token 预算或达到 MAX_HISTORY_LENGTH 节。
+    tokens_saved 累计与“最近几节完整提示词 + 完整内容”相比少发送的输入 token 数。
+    """
+
+    def __init__(self, budget: Optional[int] = None, mode: str = 'summary',
+                 max_turns: Optional[int] = None):
+        self.budget = CONFIG['HISTORY_TOKEN_BUDGET'] if budget is None else int(budget)
+        self.mode = mode
+        if self.mode not in HISTORY_MODES:
+            raise ValueError(f"未知的历史记录模式: {self.mode}")
+        self.max_turns = CONFIG['MAX_HISTORY_LENGTH'] if max_turns is None else int(max_turns)
+        self.turns = []
+        self.tokens_saved = 0
+
+    def add(self, title: str, prompt: str, content: str) -> None:
+        """记录一节已完成的内容"""
+        turn = {
+            'title': title,
+            'baseline': estimate_messages_tokens([
+                {"role": "user", "content": prompt}, {"role": "assistant", "content": content}
+            ])
+        }
+        if self.mode == 'summary':
+            turn['summary'] = f"[{title}]\n{extract_ppt_skeleton(content)}"
+        else:
+            turn['content'] = content
+        self.turns.append(turn)
+        # 只保留可能被用到的几节
+        del self.turns[:-max(1, self.max_turns)]
+
+    def _turn_messages(self, turn: Dict) -> List[Dict]:
+        return [
+            {"role": "user", "content": f"请为[{turn['title']}]制作课程PPT和授课台词"},
+            {"role": "assistant", "content": turn['content']}
+        ]
+
+    def messages(self) -> List[Dict]:
+        """返回本次请求要带上的历史消息，并累计节省的 token 数"""
+        recent = self.turns[-self.max_turns:] if self.max_turns > 0 else []
+        baseline = sum(turn['baseline'] for turn in recent)
+
+        selected = []
+        used = 0
+        for turn in reversed(recent):
+            if self.mode == 'summary':
+                cost = estimate_tokens(turn['summary']) + 1
+            else:
+                cost = estimate_messages_tokens(self._turn_messages(turn))
+            if used + cost > self.budget:
+                break
+            selected.insert(0, turn)
+            used += cost
+
+        if not selected:
+            messages = []
+        elif self.mode == 'summary':
+            summary = '\n'.join(turn['summary'] for turn in selected)
+            messages = [{"role": "system", "content": f"前面已经完成的小节（标题和PPT骨架），请保持衔接、避免重复：\n{summary}"}]
+        else:
+            messages = [message for turn in selected for message in self._turn_messages(turn)]
+
+        self.tokens_saved += max(0, baseline - estimate_messages_tokens(messages))
+        return messages